@@ -0,0 +1,69 @@
+"""Compare the cost of the autopilot's calculations using frange with the
+closed forms in server.kinematics, as ships get faster."""
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from timeit import timeit
+from server.distance import km, light_speed
+from server.kinematics import autopilot, braking_distance, braking_time
+
+parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+
+parser.add_argument(
+    '-n', '--number', type=int, default=3,
+    help='The number of times to time each calculation'
+)
+parser.add_argument(
+    '-a', '--acceleration', type=float, default=km,
+    help='The maximum acceleration of the simulated engine'
+)
+
+
+def frange(start, stop, step):
+    """The same as server.util.frange, which cannot be imported without the
+    database."""
+    while start < stop:
+        yield start
+        start += step
+
+
+def old_tick(speed, distance, max_acceleration):
+    """The calculations the Space task and hotkeys used to do."""
+    deceleration_distance = sum(frange(0, speed, max_acceleration))
+    len(list(frange(0, speed, max_acceleration)))
+    if distance > deceleration_distance:
+        acceleration = sum(frange(0.0, distance, max_acceleration))
+    else:
+        acceleration = deceleration_distance
+    return min(1.0, acceleration)
+
+
+def new_tick(speed, distance, max_acceleration):
+    """The same calculations with server.kinematics."""
+    braking_time(speed, max_acceleration)
+    braking_distance(speed, max_acceleration)
+    return autopilot(distance, speed, max_acceleration)[0]
+
+
+def main():
+    """Print a table of timings."""
+    args = parser.parse_args()
+    a = args.acceleration
+    print('%-14s %14s %14s' % ('Speed', 'frange (ms)', 'closed (ms)'))
+    for fraction in (0.0001, 0.001, 0.01, 0.1, 1.0):
+        speed = light_speed * fraction
+        # A target just inside braking distance, so only braking is summed.
+        distance = braking_distance(speed, a)
+        assert abs(
+            old_tick(speed, distance, a) - new_tick(speed, distance, a)
+        ) < 1e-9
+        old = timeit(
+            lambda: old_tick(speed, distance, a), number=args.number
+        ) / args.number
+        new = timeit(
+            lambda: new_tick(speed, distance, a), number=args.number * 1000
+        ) / (args.number * 1000)
+        print('%-14g %14.3f %14.6f' % (speed, old * 1000, new * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Compare the storage modes from server.db.engine. For each mode the database
+is loaded, a number of simulated commands are timed, then the database is
+dumped and the time the reactor would be blocked is reported separately from
+the total."""
+
+import logging
+import os
+import os.path
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from random import choice, uniform
+from tempfile import mkdtemp
+from time import time
+from server import db
+from server.db import Object, Session, session, load_db, get_dump
+from server.db.engine import modes
+
+parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+
+parser.add_argument(
+    'infile', nargs='?', default='world.yaml', help='The database file to load'
+)
+parser.add_argument(
+    '-c', '--commands', type=int, default=2000,
+    help='The number of commands to time in each mode'
+)
+parser.add_argument(
+    '-m', '--modes', nargs='+', choices=modes, default=modes,
+    help='The storage modes to compare'
+)
+
+
+def command(object_id):
+    """Do the sort of work a movement command does: load an object and its
+    surroundings, then move it."""
+    with session() as s:
+        obj = s.query(Object).get(object_id)
+        location = obj.location
+        if location is not None:
+            [thing.name for thing in location.contents]
+        obj.x = uniform(0, 100)
+        s.add(obj)
+
+
+def percentile(values, fraction):
+    """Return the value at fraction of the way through the sorted values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def benchmark(mode, args, directory):
+    """Benchmark a single mode, and return a tuple of results."""
+    db.configure_engine(
+        mode, filename=os.path.join(directory, 'benchmark.db')
+    )
+    started = time()
+    load_db(args.infile)
+    loaded = time() - started
+    ids = [id for id, in Session.query(Object.id)]
+    Session.remove()
+    latencies = []
+    for x in range(args.commands):
+        started = time()
+        command(choice(ids))
+        latencies.append(time() - started)
+    results = [mode, loaded * 1000]
+    for extension in ('.yaml', db.snapshot_extension):
+        started = time()
+        write = get_dump(os.path.join(directory, 'benchmark' + extension))
+        blocked = time() - started
+        write()
+        results.extend([blocked * 1000, (time() - started) * 1000])
+    results.extend(
+        [
+            sum(latencies) / len(latencies) * 1000,
+            percentile(latencies, 0.95) * 1000
+        ]
+    )
+    return results
+
+
+def main():
+    """Run the benchmarks and print a table."""
+    args = parser.parse_args()
+    logging.basicConfig(level='WARNING')
+    directory = mkdtemp()
+    headings = (
+        'Mode', 'Load', 'YAML block', 'YAML total', 'Snap block',
+        'Snap total', 'Cmd mean', 'Cmd p95'
+    )
+    print(('%-8s' + ' %11s' * (len(headings) - 1)) % headings)
+    for mode in args.modes:
+        print(
+            ('%-8s' + ' %11.2f' * (len(headings) - 1)) % tuple(
+                benchmark(mode, args, directory)
+            )
+        )
+    print('All times are in milliseconds.')
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
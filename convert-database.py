@@ -0,0 +1,40 @@
+"""Convert a database between the YAML and binary snapshot formats. The
+format of each file is chosen by its extension: files ending in .snapshot are
+binary snapshots, anything else is YAML."""
+
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from time import time
+from server.db import load_db, dump_db, Base
+
+parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+
+parser.add_argument(
+    'infile', nargs='?', default='world.yaml', help='The database file to load'
+)
+parser.add_argument(
+    'outfile', nargs='?', default='world.snapshot',
+    help='The file to write to'
+)
+
+
+def main():
+    """Do stuff."""
+    args = parser.parse_args()
+    logging.basicConfig(level='INFO')
+    started = time()
+    load_db(args.infile)
+    logging.info(
+        'Objects loaded: %d (%.2f seconds).', Base.number_of_objects(),
+        time() - started
+    )
+    started = time()
+    dump_db(args.outfile)
+    logging.info(
+        'Objects dumped: %d (%.2f seconds).', Base.number_of_objects(),
+        time() - started
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,23 @@ from time import time
 from argparse import ArgumentParser, FileType, ArgumentDefaultsHelpFormatter
 from twisted.internet import reactor, error
 from twisted.internet.task import LoopingCall
+from server import db
 from server.server import server
-from server.db import load_db, dump_db, ServerOptions, Task, session, Base
+from server.db import (
+    load_db, dump_db, ServerOptions, Task, session, Base, journal, compact_db
+)
+from server.db.session import enable_persistence
+from server.db.engine import (
+    modes as storage_modes, default_filename as default_storage_file,
+    default_mmap_size, default_cache_size, default_synchronous
+)
 from server.program import build_context
 from server.log_handler import LogHandler
 from server.tasks import start_tasks
+from server.timers import timers
+from server.interest import interest
+from server import space
+from server.sound import update_manifest, refresh_sounds
 
 parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
 
@@ -34,6 +46,12 @@ parser.add_argument(
     help='The format of log messages'
 )
 
+parser.add_argument(
+    '-d', '--db-file', default=db.db_file, metavar='FILENAME',
+    help='The database to load. Files ending in .snapshot are loaded and '
+    'saved as binary snapshots rather than YAML'
+)
+
 parser.add_argument(
     '-t',
     '--test-db',
@@ -41,6 +59,48 @@ parser.add_argument(
     help='Try and load the database then exit'
 )
 
+parser.add_argument(
+    '-p',
+    '--persistent-session',
+    action='store_true',
+    help='Keep loaded objects in memory between commands'
+)
+
+parser.add_argument(
+    '-s', '--storage', choices=storage_modes, default=storage_modes[0],
+    help='Where to keep the database while the server is running'
+)
+
+parser.add_argument(
+    '--storage-file', default=default_storage_file, metavar='FILENAME',
+    help='The database file to use with file storage. It is emptied when the '
+    'server starts'
+)
+
+parser.add_argument(
+    '--mmap-size', type=int, default=default_mmap_size, metavar='BYTES',
+    help='The number of bytes of the database file to memory map'
+)
+
+parser.add_argument(
+    '--cache-size', type=int, default=default_cache_size,
+    help='The SQLite page cache size. Negative numbers are in kibibytes'
+)
+
+parser.add_argument(
+    '--synchronous', default=default_synchronous,
+    choices=('OFF', 'NORMAL', 'FULL', 'EXTRA'),
+    help='How often SQLite waits for the database file to reach the disk'
+)
+
+parser.add_argument(
+    '-P',
+    '--profile-load',
+    action='store_true',
+    help='Print the number of rows loaded into each table and how long it '
+    'took'
+)
+
 parser.add_argument(
     'private_key', nargs='?', metavar='PRIVATE-KEY',
     default=os.path.join('certs', 'privkey.pem'), help='Private key file'
@@ -52,6 +112,20 @@ parser.add_argument(
 )
 
 
+def print_timings(timings):
+    """Print the table timings gathered by load_db, slowest first."""
+    rows = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)
+    print('%-40s %10s %10s' % ('Table', 'Rows', 'Seconds'))
+    for name, (count, taken) in rows:
+        print('%-40s %10d %10.3f' % (name, count, taken))
+    print(
+        '%-40s %10d %10.3f' % (
+            'Total', sum(count for count, taken in timings.values()),
+            sum(taken for count, taken in timings.values())
+        )
+    )
+
+
 if __name__ == '__main__':
     started = time()
     args = parser.parse_args()
@@ -60,7 +134,17 @@ if __name__ == '__main__':
         stream=args.log_file
     )
     started = time()
-    load_db()
+    db.db_file = args.db_file
+    db.configure_engine(
+        args.storage, filename=args.storage_file, mmap_size=args.mmap_size,
+        cache_size=args.cache_size, synchronous=args.synchronous
+    )
+    if args.persistent_session:
+        enable_persistence()
+    timings = {} if args.profile_load else None
+    load_db(timings=timings)
+    if timings is not None:
+        print_timings(timings)
     logging.info(
         'Objects loaded: %d (%.2f seconds).', Base.number_of_objects(),
         time() - started
@@ -74,6 +158,10 @@ if __name__ == '__main__':
     else:
         logging.info('Using server options: %s.', ServerOptions.instance())
     build_context()
+    journal.open()
+    update_manifest().addErrback(
+        lambda err: logging.exception(err.getTraceback())
+    )
     try:
         server.start_listening(args.private_key, args.cert_key)
     except error.CannotListenError as e:
@@ -91,12 +179,34 @@ if __name__ == '__main__':
     ).addErrback(
         lambda err: logging.exception(err.getTraceback())
     )
+    refresh_sounds_task = LoopingCall(refresh_sounds)
+    refresh_sounds_task.start(
+        ServerOptions.instance().sound_scan_interval, now=False
+    ).addErrback(
+        lambda err: logging.exception(err.getTraceback())
+    )
+    timers.start()
+    space_task = LoopingCall(space.tick)
+    space_task.start(
+        ServerOptions.instance().space_interval, now=False
+    ).addErrback(
+        lambda err: logging.exception(err.getTraceback())
+    )
+    interest.start(ServerOptions.instance().move_interval)
+    compact_task = LoopingCall(compact_db)
+    compact_task.start(
+        ServerOptions.instance().journal_compact_interval, now=False
+    ).addErrback(
+        lambda err: logging.exception(err.getTraceback())
+    )
     logging.info('Initialisation completed in %.2f seconds.', time() - started)
     reactor.run()
     started = time()
     # Reactor has finished, let's stop writing to the database.
     logger.removeHandler(handler)
     dump_db()
+    # The snapshot holds everything the journal did.
+    journal.clear()
     logging.info(
         'Objects dumped: %d (%.2f seconds).', Base.number_of_objects(),
         time() - started
@@ -0,0 +1,181 @@
+"""Provides the ConnectionRegistry class, which keeps track of every live
+connection."""
+
+from collections import defaultdict
+from attr import attrs, attrib, Factory
+
+# Used to tell ConnectionRegistry.update that a location was not provided.
+unset = object()
+
+
+class PermissionLevels:
+    """The permission levels connections are indexed by."""
+
+    player = 'player'
+    builder = 'builder'
+    admin = 'admin'
+
+
+def permission_level(admin, builder):
+    """Return the permission level for the given flags."""
+    if admin:
+        return PermissionLevels.admin
+    elif builder:
+        return PermissionLevels.builder
+    return PermissionLevels.player
+
+
+@attrs
+class ConnectionRegistry:
+    """Every connection to the server, indexed by the ID of the object it is
+    logged in as, the room and zone that object is in, host and permission
+    level, so that broadcasts can find their connections without touching the
+    database.
+
+    Iterating over the registry yields every connection in the order they
+    connected."""
+
+    connections = attrib(default=Factory(dict), init=False, repr=False)
+    by_object = attrib(default=Factory(dict), init=False, repr=False)
+    by_room = attrib(
+        default=Factory(lambda: defaultdict(set)), init=False, repr=False
+    )
+    by_zone = attrib(
+        default=Factory(lambda: defaultdict(set)), init=False, repr=False
+    )
+    by_host = attrib(
+        default=Factory(lambda: defaultdict(set)), init=False, repr=False
+    )
+    by_level = attrib(
+        default=Factory(lambda: defaultdict(set)), init=False, repr=False
+    )
+    # Maps connections to (room_id, zone_id, level) tuples, so they can be
+    # removed from the indices they were added to.
+    keys = attrib(default=Factory(dict), init=False, repr=False)
+    # The connections whose commands are being logged.
+    logged = attrib(default=Factory(set), init=False, repr=False)
+
+    def __iter__(self):
+        return iter(list(self.connections))
+
+    def __len__(self):
+        return len(self.connections)
+
+    def __contains__(self, con):
+        return con in self.connections
+
+    def add(self, con):
+        """A new connection has been made."""
+        self.connections[con] = None
+        self.by_host[con.host].add(con)
+
+    def remove(self, con):
+        """A connection has been lost."""
+        if con in self.connections:
+            del self.connections[con]
+            self._discard(self.by_host, con.host, con)
+        object_id = getattr(con, 'player_id', None)
+        if self.by_object.get(object_id) is con:
+            self.unregister(object_id)
+        self.logged.discard(con)
+
+    def register(self, obj, con):
+        """Connection con is now logged in as obj."""
+        self.by_object[obj.id] = con
+        self.update(obj)
+
+    def unregister(self, object_id):
+        """Nobody is logged in as the object with the given ID anymore. Return
+        the connection which was, or None."""
+        con = self.by_object.pop(object_id, None)
+        if con is not None:
+            self._unindex(con)
+        return con
+
+    def get(self, object_id):
+        """Return the connection logged in as the object with the given ID, or
+        None."""
+        return self.by_object.get(object_id)
+
+    def update(self, obj, location=unset, level=None):
+        """Reindex the connection for obj, which has moved or had its
+        permissions changed. Attribute events fire before the new value is
+        set, so location and level can be passed to override what is read
+        from obj."""
+        con = self.by_object.get(obj.id)
+        if con is None:
+            return
+        if location is unset:
+            location = obj.location
+        if level is None:
+            level = permission_level(obj.is_admin, obj.is_builder)
+        if location is None:
+            room_id = zone_id = None
+        else:
+            room_id = location.id
+            zone_id = location.zone_id
+        self._index(con, room_id, zone_id, level)
+
+    def rezone(self, room_id, zone_id):
+        """The room with the given ID has been moved to a different zone."""
+        for con in self.in_room(room_id):
+            level = self.keys[con][2]
+            self._index(con, room_id, zone_id, level)
+
+    def _index(self, con, room_id, zone_id, level):
+        key = (room_id, zone_id, level)
+        if self.keys.get(con) == key:
+            return
+        self._unindex(con)
+        self.keys[con] = key
+        self.by_room[room_id].add(con)
+        self.by_zone[zone_id].add(con)
+        self.by_level[level].add(con)
+
+    def _discard(self, index, key, con):
+        connections = index.get(key)
+        if connections is not None:
+            connections.discard(con)
+            if not connections:
+                del index[key]
+
+    def _unindex(self, con):
+        key = self.keys.pop(con, None)
+        if key is not None:
+            room_id, zone_id, level = key
+            self._discard(self.by_room, room_id, con)
+            self._discard(self.by_zone, zone_id, con)
+            self._discard(self.by_level, level, con)
+
+    def in_room(self, room_id):
+        """Return the connections whose objects are in the given room."""
+        return list(self.by_room.get(room_id, ()))
+
+    def in_zone(self, zone_id):
+        """Return the connections whose objects are in the given zone."""
+        return list(self.by_zone.get(zone_id, ()))
+
+    def from_host(self, host):
+        """Return every connection from the given host."""
+        return list(self.by_host.get(host, ()))
+
+    def at_level(self, *levels):
+        """Return the logged in connections with any of the given permission
+        levels."""
+        res = []
+        for level in levels:
+            res.extend(self.by_level.get(level, ()))
+        return res
+
+    @property
+    def players(self):
+        """Every logged in connection."""
+        return list(self.by_object.values())
+
+    @property
+    def staff(self):
+        """Every connection logged in as a builder or an admin."""
+        return self.at_level(PermissionLevels.builder, PermissionLevels.admin)
+
+
+connections = ConnectionRegistry()
@@ -3,14 +3,22 @@
 import os
 import os.path
 import logging
+import sqlite3
 from inspect import isclass
-from sqlalchemy import inspect, event
-from twisted.internet import reactor
+from tempfile import mkstemp
+from time import time
+from sqlalchemy import create_engine, inspect, event, select
+from twisted.internet import threads
 from yaml import dump, load
-from db_dumper import load as dumper_load, dump as dumper_dump
-from .engine import engine
-from .session import Session, session
+from db_dumper import dump as dumper_dump
+from .engine import engine, configure_storage, snapshot_reader
+from .session import Session, session, session_factory
 from .base import Base, DataMixin
+from .journal import journal
+from .bulk import create_tables, create_indexes, defer_foreign_keys, bulk_load
+from .snapshot import (
+    snapshot_extension, read_tables, write_snapshot, load_snapshot
+)
 from .rooms import (
     Room, RoomRandomSound, RoomFloorTile, RoomAirlock, floor_types_dir
 )
@@ -19,8 +27,8 @@ from .objects import Object, ObjectRandomSound, RestingStates
 from .actions import Action, ObjectAction
 from .entrances import Entrance
 from .starships import Starship, StarshipSensors, StarshipEngine
-from .zones import Zone
-from .directions import Direction
+from .zones import Zone, create_zone_index
+from .directions import Direction, direction_table
 from .adverts import Advert
 from .commands import Command
 from .hotkeys import Hotkey, HotkeySecondary, RemappedHotkey
@@ -61,11 +69,25 @@ from .phones import (
 )
 from .markers import MapMarker
 from .bug_reports import BugReport
+from .timers import build_timers
+from .migrations import Migration, migrate
+from ..connections import connections, permission_level
+from ..protocol import random_sounds
+from ..wire import prepare
+from ..spatial import spatial_index
+from ..interest import interest
+from ..tiles import tile_index
 
 logger = logging.getLogger(__name__)
 db_file = 'world.yaml'
 output_directory = 'world'
 
+# The number of pages copied at a time when backing up the database.
+backup_pages = 1024
+
+# Set to True while a dump is being written in a thread.
+dumping = False
+
 
 @event.listens_for(Session, 'before_flush')
 def before_flush(s, ctx, instances):
@@ -90,6 +112,190 @@ def before_flush(s, ctx, instances):
                 s.delete(item)
 
 
+@event.listens_for(Object.location, 'set')
+def object_moved(obj, value, oldvalue, initiator):
+    """Keep the connection registry up to date with where players are."""
+    connections.update(obj, location=value)
+    index_object(obj, room_id=None if value is None else value.id)
+
+
+@event.listens_for(Object.location_id, 'set')
+def object_location_id_changed(obj, value, oldvalue, initiator):
+    index_object(obj, room_id=value)
+
+
+@event.listens_for(Object.x, 'set')
+def object_x_changed(obj, value, oldvalue, initiator):
+    index_object(obj, x=value)
+
+
+@event.listens_for(Object.y, 'set')
+def object_y_changed(obj, value, oldvalue, initiator):
+    index_object(obj, y=value)
+
+
+@event.listens_for(Object.z, 'set')
+def object_z_changed(obj, value, oldvalue, initiator):
+    index_object(obj, z=value)
+
+
+@event.listens_for(Object, 'after_insert')
+@event.listens_for(Object, 'after_update')
+def object_stored(mapper, connection, obj):
+    """Once an object has been flushed its columns are the truth."""
+    spatial_index.add(obj.id, obj.location_id, obj.x, obj.y, obj.z)
+
+
+@event.listens_for(Object, 'load')
+def object_loaded(obj, context):
+    spatial_index.add(obj.id, obj.location_id, obj.x, obj.y, obj.z)
+
+
+@event.listens_for(Object, 'after_delete')
+def object_deleted(mapper, connection, obj):
+    spatial_index.remove(obj.id)
+    interest.remove(obj.id)
+
+
+def index_object(obj, **changes):
+    """Keep the spatial index up to date with where objects are. Attribute
+    events fire before the new value is set, and the location relationship is
+    only copied to location_id when the session is flushed, so changes
+    override the position obj had when it was last indexed."""
+    if obj.id is None:
+        return  # Objects are indexed when they are inserted.
+    position = spatial_index.get(obj.id)
+    if position is None:
+        position = (obj.location_id, obj.x, obj.y, obj.z)
+    values = dict(zip(('room_id', 'x', 'y', 'z'), position))
+    values.update(changes)
+    spatial_index.add(obj.id, **values)
+
+
+def build_spatial_index():
+    """Index the position of every object which is in a room."""
+    started = time()
+    spatial_index.clear()
+    table = Object.__table__
+    for row in engine.execute(
+        select(
+            [table.c.id, table.c.location_id, table.c.x, table.c.y, table.c.z]
+        ).where(table.c.location_id.isnot(None))
+    ):
+        spatial_index.add(*row)
+    logger.info(
+        'Indexed the positions of %d objects (%.2f seconds).',
+        len(spatial_index), time() - started
+    )
+
+
+@event.listens_for(RoomFloorTile, 'after_insert')
+@event.listens_for(RoomFloorTile, 'after_update')
+@event.listens_for(RoomFloorTile, 'after_delete')
+def floor_tile_changed(mapper, connection, tile):
+    """Forget the tiles of any room this tile is or was in, so they are
+    loaded again."""
+    tile_index.invalidate(tile.room_id)
+    for room_id in inspect(tile).attrs.room_id.history.deleted:
+        tile_index.invalidate(room_id)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def floor_tiles_changed(context):
+    """Bulk changes do not say which rooms they touched, so forget every
+    room."""
+    if context.mapper.class_ is RoomFloorTile:
+        tile_index.clear()
+
+
+@event.listens_for(Room.zone_id, 'set')
+def room_rezoned(room, value, oldvalue, initiator):
+    """Keep the connection registry up to date with which zones rooms are
+    in."""
+    if value != oldvalue:
+        connections.rezone(room.id, value)
+
+
+@event.listens_for(Session, 'after_flush')
+def random_sounds_changed(s, ctx):
+    """When clients play the random sounds of rooms themselves, prepare the
+    random_sounds command for rooms whose random sounds have changed. They
+    are sent to everyone in those rooms by random_sounds_committed."""
+    ids = set()
+    for obj in s.new | s.dirty | s.deleted:
+        state = inspect(obj)
+        if isinstance(obj, RoomRandomSound):
+            ids.add(obj.room_id)
+            for name in ('room_id', 'room'):
+                for value in state.attrs[name].history.deleted:
+                    ids.add(value.id if isinstance(value, Room) else value)
+        elif isinstance(obj, Room) and any(
+            state.attrs[name].history.has_changes() for name in (
+                'min_random_sound_interval', 'max_random_sound_interval',
+                'size_x', 'size_y', 'size_z'
+            )
+        ):
+            ids.add(obj.id)
+    ids.discard(None)
+    if ids and ServerOptions.instance().client_random_sounds:
+        pending = s.info.setdefault('random_sounds', {})
+        for room in s.query(Room).filter(Room.id.in_(ids)):
+            pending[room.id] = prepare(random_sounds, room)
+
+
+@event.listens_for(Session, 'after_commit')
+def random_sounds_committed(s):
+    """Send the commands prepared by random_sounds_changed, now the changes
+    they describe have been committed. No SQL can be emitted here, so
+    everyone registered in each room is sent them."""
+    for room_id, commands in s.info.pop('random_sounds', {}).items():
+        for con in connections.in_room(room_id):
+            for command in commands:
+                con.send_prepared(command)
+
+
+@event.listens_for(Session, 'after_rollback')
+def random_sounds_rolled_back(s):
+    """Forget the commands prepared by random_sounds_changed, because the
+    changes they describe never happened. Rolling back a savepoint keeps
+    them, since sending a room which has not changed does no harm."""
+    if s.transaction is None or not s.transaction.nested:
+        s.info.pop('random_sounds', None)
+
+
+@event.listens_for(ServerOptions.client_random_sounds, 'set')
+def client_random_sounds_changed(options, value, oldvalue, initiator):
+    """Send everyone the random sounds of the room they are in when clients
+    start playing them, and tell them to stop when the server takes over
+    again."""
+    if value == oldvalue or options is not ServerOptions.instance():
+        return
+    for con in connections.players:
+        obj = con.get_player()
+        if obj is None or obj.location is None:
+            continue
+        random_sounds(con, obj.location if value else None)
+
+
+@event.listens_for(Player.admin, 'set')
+def admin_changed(player, value, oldvalue, initiator):
+    """Keep the connection registry up to date with who is an admin."""
+    if player.object is not None:
+        connections.update(
+            player.object, level=permission_level(value, player.builder)
+        )
+
+
+@event.listens_for(Player.builder, 'set')
+def builder_changed(player, value, oldvalue, initiator):
+    """Keep the connection registry up to date with who is a builder."""
+    if player.object is not None:
+        connections.update(
+            player.object, level=permission_level(player.admin, value)
+        )
+
+
 def get_classes():
     """Returns a list of all classes used in the database."""
     classes = []
@@ -111,9 +317,16 @@ def dump_object(obj):
     if DataMixin in cls.__bases__:
         obj.save_data()
     columns = inspect(cls).columns
+    return dump_values(
+        columns.items(), (getattr(obj, name) for name in columns.keys())
+    )
+
+
+def dump_values(columns, values):
+    """Return a dictionary of the (name, column) pairs in columns mapped to
+    values, without any which are None or equal to their defaults."""
     d = {}
-    for name, column in columns.items():
-        value = getattr(obj, name)
+    for (name, column), value in zip(columns, values):
         if (
             column.nullable is True and value is None
         ) or (
@@ -192,21 +405,72 @@ def save_objects(objects):
     Session.commit()
 
 
-def load_db(filename=None):
+def configure_engine(mode, **kwargs):
+    """Store the database as described by mode, which should be one of
+    server.db.engine.modes. Extra keyword arguments are passed to
+    create_storage. Call this before load_db."""
+    global engine
+    engine = configure_storage(mode, **kwargs)
+    Base.metadata.bind = engine
+    session_factory.configure(bind=engine)
+    Session.remove()
+    logger.info('Storing the database in %s mode (%s).', mode, engine.url)
+
+
+def is_snapshot(filename):
+    """Return whether or not filename is a binary snapshot rather than YAML."""
+    return filename.endswith(snapshot_extension)
+
+
+def load_db(filename=None, timings=None):
     """Load the database from a single flat file. If filename is None use
-    db_file."""
+    db_file, and replay the journal on top of it.
+
+    Rows are inserted with SQLAlchemy Core in foreign key order, and indexes
+    are created once they are all in. If timings is not None, it is filled
+    with table names mapped to [rows, seconds] lists."""
     logger.info('Creating database tables...')
-    Base.metadata.create_all()
-    if filename is None:
+    replay = filename is None
+    if replay:
         filename = db_file
-    if os.path.isfile(filename):
-        logger.info('Loading the database from %s.', filename)
-        with open(filename, 'r') as f:
-            y = load(f)
-        dumper_load(y, get_sorted_classes(), class_save=save_objects)
-    else:
-        logger.info('Starting with blank database.')
+    with engine.begin() as connection:
+        defer_foreign_keys(connection)
+        created = create_tables(connection, Base.metadata)
+        if os.path.isfile(filename):
+            logger.info('Loading the database from %s.', filename)
+            if is_snapshot(filename):
+                load_snapshot(
+                    filename, connection, Base.metadata, timings=timings
+                )
+            else:
+                started = time()
+                with open(filename, 'r') as f:
+                    y = load(f)
+                logger.info(
+                    'Parsed %s (%.2f seconds).', filename, time() - started
+                )
+                started = time()
+                count = bulk_load(
+                    y, connection, get_classes(), timings=timings
+                )
+                logger.info(
+                    'Loaded %d rows from %s (%.2f seconds).', count,
+                    filename, time() - started
+                )
+        else:
+            logger.info('Starting with blank database.')
+        if replay:
+            journal.replay(connection, Base.metadata)
+        started = time()
+        create_indexes(connection, created)
+        create_zone_index(connection)
+        logger.info('Created indexes (%.2f seconds).', time() - started)
     finalise_db()
+    build_spatial_index()
+    direction_table.clear()
+    tile_index.clear()
+    migrate()
+    build_timers()
 
 
 def objects_as_dicts():
@@ -218,23 +482,183 @@ def objects_as_dicts():
     return dumper_dump(objects, dump_object)
 
 
+def save_data():
+    """Store the data of every DataMixin instance in its _data column."""
+    for cls in get_classes():
+        if DataMixin in cls.__bases__:
+            for obj in Session.query(cls):
+                obj.save_data()
+    Session.commit()
+
+
+def backup_db():
+    """Copy the database into a temporary file with the SQLite online backup
+    API, and return the name of the file. Only committed changes are copied,
+    so the copy is a consistent snapshot of the world as it is now."""
+    started = time()
+    fd, filename = mkstemp(suffix='.db', prefix='mindspace-')
+    os.close(fd)
+    target = sqlite3.connect(filename)
+    raw = engine.raw_connection()
+    try:
+        raw.connection.backup(
+            target, pages=backup_pages, progress=backup_progress
+        )
+    finally:
+        raw.close()
+        target.close()
+    logger.info(
+        'Copied the database to %s (%.2f seconds).', filename,
+        time() - started
+    )
+    return filename
+
+
+def backup_progress(status, remaining, total):
+    """Log the progress of backup_db."""
+    logger.debug('Copied %d of %d pages.', total - remaining, total)
+
+
+def rows_as_dicts(connection):
+    """Return every row of the database on connection in the same form as
+    objects_as_dicts, without going through the ORM. DataMixin instances are
+    dumped with whatever is in their _data columns."""
+    d = {}
+    for cls in get_classes():
+        columns = inspect(cls).columns.items()
+        rows = connection.execute(
+            select([column for name, column in columns])
+        )
+        objects = [dump_values(columns, row) for row in rows]
+        if objects:
+            d[cls.__name__] = objects
+    return d
+
+
+def write_tables(connection, filename):
+    """Write every table of the database on connection to filename. If
+    filename ends with snapshot_extension a binary snapshot is written,
+    otherwise YAML."""
+    if is_snapshot(filename):
+        tables = read_tables(
+            connection, sorted(
+                Base.metadata.tables.values(), key=lambda t: t.name
+            )
+        )
+        write_snapshot(filename, tables)
+    else:
+        dump_objects(filename, rows_as_dicts(connection))
+
+
+def write_backup(backup, filename):
+    """Write the database copied to backup by backup_db to filename, then
+    delete backup. Can be called from any thread."""
+    started = time()
+    backup_engine = create_engine('sqlite:///' + backup)
+    try:
+        with backup_engine.connect() as connection:
+            write_tables(connection, filename)
+    finally:
+        backup_engine.dispose()
+        os.remove(backup)
+    logger.info(
+        'Database written to %s (%.2f seconds).', filename, time() - started
+    )
+
+
+def write_reader(connection, filename):
+    """Write the database as seen by connection, as returned by
+    snapshot_reader, to filename, then close connection. Can be called from
+    any thread."""
+    started = time()
+    try:
+        write_tables(connection, filename)
+    finally:
+        connection.close()
+    logger.info(
+        'Database written to %s (%.2f seconds).', filename, time() - started
+    )
+
+
+def get_dump(filename):
+    """Capture the state of the database, and return a function which will
+    write it to filename from any thread. When the storage engine gives
+    worker threads their own snapshots, one of those is used, otherwise the
+    database is copied with backup_db."""
+    save_data()
+    connection = snapshot_reader()
+    if connection is None:
+        backup = backup_db()
+        return lambda: write_backup(backup, filename)
+    return lambda: write_reader(connection, filename)
+
+
 def dump_db(filename=None, thread=False):
-    """Dump the database to single files."""
+    """Dump the database to a single file. If thread is True, the database is
+    only copied on the reactor thread, and is written to filename in a thread.
+    In that case a Deferred which fires when the file has been written is
+    returned, or None if another dump is still being written."""
     if filename is None:
         filename = db_file
+    if thread and dumping:
+        logger.warning(
+            'Not dumping the database to %s because another dump is still '
+            'being written.', filename
+        )
+        return
     logger.info('Dumping the database to %s.', filename)
-    y = objects_as_dicts()
-    args = (filename, y)
+    write = get_dump(filename)
     if thread:
-        reactor.callInThread(dump_objects, *args)
-    else:
-        dump_objects(*args)
+        return write_in_thread(write)
+    write()
+
+
+def write_in_thread(write):
+    """Call write in a thread, making sure no other dump is started until it
+    has finished. Returns a Deferred."""
+    global dumping
+    dumping = True
+
+    def done(result):
+        global dumping
+        dumping = False
+        return result
+
+    return threads.deferToThread(write).addBoth(done)
 
 
 def dump_objects(filename, d):
-    """Dump dictionary d to the given filename."""
-    with open(filename, 'w') as f:
+    """Dump dictionary d to the given filename. The file is replaced in one
+    step, so a crash part way through never leaves half a database."""
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
         dump(d, stream=f)
+    os.replace(tmp, filename)
+
+
+def compact_db():
+    """Write a snapshot of the database to db_file in a thread, and start a
+    new journal. The old journal is deleted once the snapshot has been
+    written. Returns a Deferred, or None if another dump is still being
+    written."""
+    if dumping:
+        logger.warning(
+            'Not compacting the journal because a dump is still being '
+            'written.'
+        )
+        return
+    started = time()
+    write = get_dump(db_file)
+    journal.rotate()
+
+    def done(result):
+        journal.discard_old()
+        logger.info(
+            'Journal compacted into %s (%.2f seconds).', db_file,
+            time() - started
+        )
+
+    return write_in_thread(write).addCallback(done)
 
 
 __all__ = (
@@ -256,5 +680,7 @@ __all__ = (
     'TextMessage', 'RemappedHotkey', 'CreditCard', 'CreditCardTransfer',
     'TransferDirections', 'CreditCardError', 'Bank', 'BankAccountAccessor',
     'BankAccount', 'ATM', 'ATMError', 'BankAccessError', 'TextStyle',
-    'get_sorted_classes', 'floor_types_dir', 'MapMarker', 'BugReport'
+    'get_sorted_classes', 'floor_types_dir', 'MapMarker', 'BugReport',
+    'journal', 'compact_db', 'is_snapshot', 'configure_engine', 'Migration',
+    'migrate'
 )
@@ -18,7 +18,9 @@ from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from .engine import engine
 from .session import Session
-from ..protocol import identify, random_sound
+from ..protocol import random_sound
+from ..connections import connections
+from ..interest import interest
 from ..sound import sounds_dir, get_sound
 from ..forms import Label, Field, text
 
@@ -316,10 +318,21 @@ class LocationMixin:
             remote_side='Room.id'
         )
 
-    def update_neighbours(self):
-        """Notify everyone in the current room that this object's state has
-        changed."""
-        return self.location.broadcast_command(identify, self)
+    def update_neighbours(self, full=True):
+        """Notify everyone in the current room who can hear this object that
+        its state has changed. If full evaluates to True they are sent a full
+        identify command. Otherwise those who already know about this object
+        are only sent its coordinates. Anyone who can no longer hear it is
+        told to forget it."""
+        location = self.location
+        for con in connections.in_room(location.id):
+            viewer = con.get_player()
+            if viewer is not None:
+                interest.update(
+                    con, self,
+                    location.max_distance * viewer.max_distance_multiplier,
+                    viewer.coordinates, full=full
+                )
 
 
 class OwnerMixin:
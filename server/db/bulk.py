@@ -0,0 +1,175 @@
+"""Load flat files into the database with SQLAlchemy Core.
+
+Rows are inserted table by table in foreign key order with executemany,
+without constructing ORM instances. Tables are created without their indexes,
+which are built once the data is in."""
+
+import logging
+from time import time
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateTable
+
+logger = logging.getLogger(__name__)
+
+
+def sorted_tables(metadata):
+    """Return the tables in metadata sorted so that every table comes after
+    the tables it refers to. Tables which refer to each other, directly or
+    not, are kept together, with the table with the fewest outstanding
+    references to the others first."""
+    dependencies = {
+        table: {
+            key.column.table for key in table.foreign_keys
+            if key.column.table is not table
+        } for table in sorted(metadata.tables.values(), key=lambda t: t.name)
+    }
+    res = []
+    for component in strongly_connected(dependencies):
+        remaining = {
+            table: dependencies[table].intersection(component)
+            for table in component
+        }
+        while remaining:
+            ready = [table for table, refs in remaining.items() if not refs]
+            if not ready:
+                ready = [
+                    min(remaining, key=lambda table: len(remaining[table]))
+                ]
+            for table in ready:
+                res.append(table)
+                del remaining[table]
+            for refs in remaining.values():
+                refs.difference_update(ready)
+    return res
+
+
+def strongly_connected(graph):
+    """Return the strongly connected components of graph, a dictionary of
+    nodes to the nodes they point to, using Tarjan's algorithm. Every
+    component comes after the components it points to, and the nodes of each
+    component are kept in the order of graph."""
+    indexes = {}
+    lowlinks = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    def visit(node):
+        indexes[node] = lowlinks[node] = len(indexes)
+        stack.append(node)
+        on_stack.add(node)
+        for other in graph[node]:
+            if other not in indexes:
+                visit(other)
+                lowlinks[node] = min(lowlinks[node], lowlinks[other])
+            elif other in on_stack:
+                lowlinks[node] = min(lowlinks[node], indexes[other])
+        if lowlinks[node] == indexes[node]:
+            component = set()
+            while True:
+                other = stack.pop()
+                on_stack.discard(other)
+                component.add(other)
+                if other is node:
+                    break
+            components.append([other for other in graph if other in component])
+
+    for node in graph:
+        if node not in indexes:
+            visit(node)
+    return components
+
+
+def create_tables(connection, metadata):
+    """Create every table in metadata which does not exist yet, without any
+    indexes. Returns a list of the tables which were created."""
+    created = []
+    for table in sorted_tables(metadata):
+        if not connection.dialect.has_table(connection, table.name):
+            connection.execute(CreateTable(table))
+            created.append(table)
+    return created
+
+
+def create_indexes(connection, tables):
+    """Create the indexes for tables created by create_tables."""
+    for table in tables:
+        for index in table.indexes:
+            index.create(connection)
+
+
+def defer_foreign_keys(connection):
+    """Do not check foreign keys until the current transaction commits."""
+    connection.execute('PRAGMA defer_foreign_keys = ON')
+
+
+def group_rows(rows):
+    """Group dictionaries by the keys they have, so each group can be inserted
+    with a single executemany. Returns a list of lists."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    return list(groups.values())
+
+
+def record_timing(timings, name, rows, seconds):
+    """Add rows and seconds to the entry for name in timings, which maps table
+    names to [rows, seconds] lists."""
+    if timings is not None:
+        entry = timings.setdefault(name, [0, 0.0])
+        entry[0] += rows
+        entry[1] += seconds
+
+
+def bulk_load(source, connection, classes, timings=None):
+    """Insert the objects in source, a dictionary as returned by
+    db_dumper.dump, using classes to find their tables. If timings is not
+    None, the number of rows and seconds taken are added to it for each
+    table. Returns the number of rows loaded."""
+    total = 0
+    by_table = {}
+    for cls in classes:
+        by_table.setdefault(cls.__table__, []).append(cls)
+    tables = [
+        table for table in sorted_tables(classes[0].metadata)
+        if table in by_table
+    ] if classes else []
+    for table in tables:
+        started = time()
+        count = 0
+        for cls in by_table[table]:
+            objects = source.get(cls.__name__)
+            if not objects:
+                continue
+            columns = {
+                key: column.name for key, column in inspect(
+                    cls
+                ).columns.items()
+            }
+            unknown = set()
+            rows = []
+            for obj in objects:
+                row = {}
+                for key, value in obj.items():
+                    if key in columns:
+                        row[columns[key]] = value
+                    else:
+                        unknown.add(key)
+                rows.append(row)
+            if unknown:
+                logger.warning(
+                    'Ignoring columns from %s: %s.', cls.__name__,
+                    ', '.join(sorted(unknown))
+                )
+            for group in group_rows(rows):
+                connection.execute(table.insert(), group)
+            count += len(rows)
+        if count:
+            taken = time() - started
+            record_timing(timings, table.name, count, taken)
+            logger.debug(
+                'Loaded %d rows into %s (%.2f seconds).', count, table.name,
+                taken
+            )
+            total += count
+    return total
@@ -1,7 +1,9 @@
-"""Provides the Direction class."""
+"""Provides the Direction class, and direction_table, which keeps every
+direction in memory."""
 
 import logging
-from sqlalchemy import Column, Integer, ForeignKey
+from attr import attrs, attrib
+from sqlalchemy import Column, Integer, ForeignKey, event
 from sqlalchemy.orm import relationship
 from .base import Base, CoordinatesMixin, NameMixin
 from .session import Session
@@ -58,3 +60,71 @@ class Direction(Base, NameMixin, CoordinatesMixin):
             'U': 'northwest'
         }
         return names[name]
+
+
+@attrs
+class DirectionRow:
+    """The columns of a Direction which are needed to move in it."""
+
+    id = attrib()
+    x = attrib()
+    y = attrib()
+    z = attrib()
+    opposite_id = attrib()
+
+    @property
+    def coordinates(self):
+        return (self.x, self.y, self.z)
+
+    def coordinates_from(self, start):
+        """The same as Direction.coordinates_from."""
+        x, y, z = start
+        return (x + self.x, y + self.y, z + self.z)
+
+
+@attrs
+class DirectionTable:
+    """Every direction, loaded with a single query the first time it is
+    needed, so things which move often do not have to query the database.
+    Cleared whenever a direction is stored or deleted."""
+
+    rows = attrib(default=None, init=False, repr=False)
+    by_id = attrib(default=None, init=False, repr=False)
+
+    def load(self):
+        """Return a list of DirectionRow instances, ordered by id."""
+        if self.rows is None:
+            self.rows = [
+                DirectionRow(*row) for row in Session.query(
+                    Direction.id, Direction.x, Direction.y, Direction.z,
+                    Direction.opposite_id
+                ).order_by(Direction.id)
+            ]
+            self.by_id = {row.id: row for row in self.rows}
+        return self.rows
+
+    def clear(self):
+        """Forget every direction, so they are loaded again."""
+        self.rows = None
+        self.by_id = None
+
+    def get(self, id):
+        """Return the row with the given id, or None."""
+        self.load()
+        return self.by_id.get(id)
+
+    def find(self, x, y, z):
+        """Return the first row with the given coordinates, or None."""
+        for row in self.load():
+            if row.coordinates == (x, y, z):
+                return row
+
+
+direction_table = DirectionTable()
+
+
+@event.listens_for(Direction, 'after_insert')
+@event.listens_for(Direction, 'after_update')
+@event.listens_for(Direction, 'after_delete')
+def direction_changed(mapper, connection, direction):
+    direction_table.clear()
@@ -1,5 +1,146 @@
-"""Provides the database engine."""
+"""Provides the database engine.
 
-from sqlalchemy import create_engine
+By default the database lives in memory, and can only be used from the
+thread which created it. configure_storage can replace the engine with one of
+the other storage modes before the database is loaded:
 
-engine = create_engine('sqlite:///:memory:')
+StorageModes.shared
+    A shared-cache memory database. Worker threads can read it with read_only,
+    but may see changes which have not been committed yet.
+StorageModes.file
+    A file in WAL mode, which is emptied when the server starts, so the flat
+    file and journal remain the real copy of the world. Worker threads read
+    from their own snapshot of the database, without blocking the reactor."""
+
+import os
+import os.path
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool, SingletonThreadPool, StaticPool
+
+memory_url = 'sqlite:///:memory:'
+shared_url = 'sqlite:///file:mindspace?mode=memory&cache=shared&uri=true'
+
+engine = create_engine(memory_url)
+
+# The engine worker threads read from, or None if they cannot.
+read_engine = None
+
+# True if connections from read_engine see a consistent snapshot.
+isolated_reads = False
+
+
+class StorageModes:
+    """The places the database can be stored."""
+
+    memory = 'memory'
+    shared = 'shared'
+    file = 'file'
+
+
+modes = (StorageModes.memory, StorageModes.shared, StorageModes.file)
+
+default_filename = 'world.db'
+default_mmap_size = 256 * 1024 * 1024
+# Negative sizes are in kibibytes.
+default_cache_size = -64 * 1024
+default_synchronous = 'NORMAL'
+default_pool_size = 5
+
+
+class StorageError(Exception):
+    """There was a problem with the database storage."""
+
+
+def set_pragmas(engine, **pragmas):
+    """Set pragmas on every new connection to engine."""
+
+    @event.listens_for(engine, 'connect')
+    def connect(connection, record):
+        cursor = connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+        cursor.close()
+
+
+def remove_database(filename):
+    """Remove a database file, along with its WAL and shared memory files."""
+    for name in (filename, filename + '-wal', filename + '-shm'):
+        if os.path.isfile(name):
+            os.remove(name)
+
+
+def create_storage(
+    mode, filename=default_filename, mmap_size=default_mmap_size,
+    cache_size=default_cache_size, synchronous=default_synchronous,
+    pool_size=default_pool_size
+):
+    """Create the engines for the given mode, which should be one of modes.
+    Returns (engine, read engine). The read engine is None in memory mode."""
+    if mode == StorageModes.memory:
+        return create_engine(memory_url), None
+    elif mode == StorageModes.shared:
+        connect_args = dict(check_same_thread=False)
+        # Whilst the writer has its connection open the database exists.
+        writer = create_engine(
+            shared_url, poolclass=StaticPool, connect_args=connect_args
+        )
+        reader = create_engine(
+            shared_url, poolclass=QueuePool, pool_size=pool_size,
+            connect_args=connect_args
+        )
+        set_pragmas(writer, cache_size=cache_size)
+        set_pragmas(reader, read_uncommitted='ON', query_only='ON')
+        return writer, reader
+    elif mode == StorageModes.file:
+        remove_database(filename)
+        url = 'sqlite:///' + os.path.abspath(filename)
+        pragmas = dict(
+            mmap_size=mmap_size, cache_size=cache_size,
+            synchronous=synchronous
+        )
+        writer = create_engine(url, poolclass=SingletonThreadPool)
+        set_pragmas(writer, journal_mode='WAL', **pragmas)
+        reader = create_engine(
+            url, poolclass=QueuePool, pool_size=pool_size,
+            connect_args=dict(check_same_thread=False)
+        )
+        set_pragmas(reader, query_only='ON', **pragmas)
+        return writer, reader
+    raise StorageError('Invalid storage mode: %r.' % mode)
+
+
+def configure_storage(mode, **kwargs):
+    """Replace engine and read_engine with engines created by create_storage.
+    Returns the new engine. Use server.db.configure_engine rather than
+    calling this directly, so the session and metadata are rebound too."""
+    global engine, read_engine, isolated_reads
+    old = engine
+    engine, read_engine = create_storage(mode, **kwargs)
+    isolated_reads = mode == StorageModes.file
+    old.dispose()
+    return engine
+
+
+@contextmanager
+def read_only():
+    """Yield a connection which can be used to read the database from a
+    worker thread."""
+    if read_engine is None:
+        raise StorageError(
+            'The database cannot be read from other threads in this mode.'
+        )
+    with read_engine.connect() as connection:
+        yield connection
+
+
+def snapshot_reader():
+    """Return a read_engine connection with a read transaction open, so that
+    it sees the database as it is now, whichever thread uses it. The caller
+    must close the connection. Returns None unless reads are isolated."""
+    if not isolated_reads:
+        return
+    connection = read_engine.connect()
+    connection.execute('BEGIN')
+    connection.execute('SELECT COUNT(*) FROM sqlite_master').fetchall()
+    return connection
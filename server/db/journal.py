@@ -0,0 +1,262 @@
+"""Provides the Journal class, which records every change made to the database
+so that changes made since the last snapshot survive a crash.
+
+Each record is a msgpack array of [operation, table name, values]. Inserts
+store the whole row, updates store the primary key and the columns which
+changed, and deletes store the primary key. Records are gathered from
+after_flush events, and only written once the transaction commits.
+
+When a snapshot is taken the journal is rotated: changes made after the
+snapshot go to a new journal, and the old one is deleted once the snapshot
+has been written. Replaying is idempotent, so if the server stops between
+writing the snapshot and deleting the old journal nothing is lost.
+
+The journal does not see the contents of DataMixin.data, which are only
+written to the database by save_data when a snapshot is taken."""
+
+import logging
+import os
+import os.path
+from time import time
+from attr import attrs, attrib
+from sqlalchemy import and_, event, inspect
+from .session import Session
+from .serialise import get_packer, get_unpacker
+
+logger = logging.getLogger(__name__)
+
+INSERT = 0
+UPDATE = 1
+DELETE = 2
+
+
+def primary_key(mapper, obj):
+    """Return a dictionary of primary key column names to values."""
+    return {
+        column.name: value for column, value in zip(
+            mapper.primary_key, mapper.primary_key_from_instance(obj)
+        )
+    }
+
+
+def row(mapper, obj):
+    """Return every column of obj as a dictionary."""
+    return {
+        column.name: getattr(obj, mapper.get_property_by_column(column).key)
+        for column in mapper.local_table.columns
+    }
+
+
+def changes(mapper, state):
+    """Return a dictionary of the columns of an object which have changed,
+    or None if nothing has."""
+    res = {}
+    for column in mapper.local_table.columns:
+        prop = mapper.get_property_by_column(column)
+        history = state.attrs[prop.key].history
+        if history.added:
+            res[column.name] = history.added[0]
+        elif history.deleted:
+            res[column.name] = None
+    return res or None
+
+
+@attrs
+class Journal:
+    """An append-only log of changes to the database."""
+
+    filename = attrib()
+    f = attrib(default=None, init=False, repr=False)
+    packer = attrib(default=None, init=False, repr=False)
+
+    @property
+    def old_filename(self):
+        """The journal which holds changes made before the snapshot which is
+        being written."""
+        return self.filename + '.old'
+
+    @property
+    def recording(self):
+        return self.f is not None
+
+    def open(self):
+        """Start recording changes."""
+        logger.info('Recording changes to %s.', self.filename)
+        self.f = open(self.filename, 'ab')
+        self.packer = get_packer()
+
+    def close(self):
+        """Stop recording changes."""
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def rotate(self):
+        """Start a new journal, keeping the current one until discard_old is
+        called."""
+        recording = self.recording
+        self.close()
+        if os.path.isfile(self.filename):
+            if os.path.isfile(self.old_filename):
+                # A previous snapshot failed, so keep both sets of changes.
+                with open(self.old_filename, 'ab') as old:
+                    with open(self.filename, 'rb') as f:
+                        old.write(f.read())
+                os.remove(self.filename)
+            else:
+                os.replace(self.filename, self.old_filename)
+        if recording:
+            self.open()
+
+    def discard_old(self):
+        """A snapshot has been written, so the changes in the old journal are
+        no longer needed."""
+        if os.path.isfile(self.old_filename):
+            os.remove(self.old_filename)
+
+    def clear(self):
+        """Discard every recorded change. Call this once a snapshot of the
+        whole database has been written."""
+        self.rotate()
+        self.discard_old()
+
+    def record(self, s):
+        """Gather records for everything the session s is about to flush."""
+        records = s.info.setdefault('journal', [])
+        for obj in s.new:
+            mapper = inspect(obj).mapper
+            records.append([INSERT, mapper.local_table.name, row(mapper, obj)])
+        for obj in s.dirty:
+            state = inspect(obj)
+            mapper = state.mapper
+            values = changes(mapper, state)
+            if values is not None:
+                values.update(primary_key(mapper, obj))
+                records.append([UPDATE, mapper.local_table.name, values])
+        for obj in s.deleted:
+            mapper = inspect(obj).mapper
+            records.append(
+                [DELETE, mapper.local_table.name, primary_key(mapper, obj)]
+            )
+
+    def record_bulk(self, context, operation):
+        """Gather records for a Query.update or Query.delete."""
+        mapper = context.mapper
+        if hasattr(context, 'matched_objects'):
+            keys = [
+                primary_key(mapper, obj) for obj in context.matched_objects
+            ]
+        elif hasattr(context, 'matched_rows'):
+            keys = [
+                {
+                    column.name: value for column, value in zip(
+                        mapper.primary_key, primary_key_row
+                    )
+                } for primary_key_row in context.matched_rows
+            ]
+        else:
+            logger.warning(
+                'Cannot journal a bulk operation on %s with '
+                'synchronize_session=False. It will be saved by the next '
+                'snapshot.', mapper.local_table.name
+            )
+            return
+        values = {}
+        if operation == UPDATE:
+            for key, value in context.values.items():
+                if isinstance(key, str):
+                    key = mapper.attrs[key].columns[0]
+                elif hasattr(key, 'property'):
+                    key = key.property.columns[0]
+                values[key.name] = value
+        records = context.session.info.setdefault('journal', [])
+        for key in keys:
+            key.update(values)
+            records.append([operation, mapper.local_table.name, key])
+
+    def record_updates(self, s, table_name, rows):
+        """Gather records for updates made with SQLAlchemy Core through
+        session s. Each row is a dictionary of column names to values, which
+        must include the primary key."""
+        if self.recording:
+            s.info.setdefault('journal', []).extend(
+                [UPDATE, table_name, row] for row in rows
+            )
+
+    def commit(self, s):
+        """Write the records gathered for session s."""
+        records = s.info.pop('journal', None)
+        if records:
+            for record in records:
+                self.f.write(self.packer.pack(record))
+            self.f.flush()
+
+    def replay(self, connection, metadata):
+        """Apply every change in the journal to the database on the given
+        connection. Returns the number of changes applied."""
+        count = 0
+        started = time()
+        for filename in (self.old_filename, self.filename):
+            if not os.path.isfile(filename):
+                continue
+            logger.info('Replaying %s.', filename)
+            with open(filename, 'rb') as f:
+                for operation, table_name, values in get_unpacker(f):
+                    table = metadata.tables[table_name]
+                    apply(connection, table, operation, values)
+                    count += 1
+        if count:
+            logger.info(
+                'Replayed %d changes (%.2f seconds).', count, time() - started
+            )
+        return count
+
+
+def apply(connection, table, operation, values):
+    """Apply a single journal record."""
+    if operation == INSERT:
+        connection.execute(table.insert().prefix_with('OR REPLACE'), values)
+        return
+    criteria = and_(
+        *[column == values.pop(column.name) for column in table.primary_key]
+    )
+    if operation == UPDATE:
+        connection.execute(table.update().where(criteria).values(**values))
+    elif operation == DELETE:
+        connection.execute(table.delete().where(criteria))
+    else:
+        raise ValueError('Invalid operation: %r.' % operation)
+
+
+journal = Journal('world.journal')
+
+
+@event.listens_for(Session, 'after_flush')
+def after_flush(s, ctx):
+    if journal.recording:
+        journal.record(s)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+def after_bulk_update(context):
+    if journal.recording:
+        journal.record_bulk(context, UPDATE)
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+def after_bulk_delete(context):
+    if journal.recording:
+        journal.record_bulk(context, DELETE)
+
+
+@event.listens_for(Session, 'after_commit')
+def after_commit(s):
+    if journal.recording:
+        journal.commit(s)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def after_transaction_end(s, transaction):
+    if transaction.parent is None:
+        # Anything which was not committed was rolled back.
+        s.info.pop('journal', None)
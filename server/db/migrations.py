@@ -0,0 +1,71 @@
+"""Provides the Migration class, and migrate, which makes one-off changes to
+worlds saved by older versions of the server.
+
+Migrations are functions registered with the migration decorator, which are
+called with a session. Each one runs the first time a world without a
+Migration row of the same name is loaded, and a row is then added so it never
+runs again."""
+
+import logging
+from sqlalchemy import Column, String
+from .base import Base, CreatedMixin
+from .session import session
+from .tasks import Task
+
+logger = logging.getLogger(__name__)
+migrations = []
+
+
+class Migration(Base, CreatedMixin):
+    """A migration which has been applied to this world."""
+
+    __tablename__ = 'migrations'
+    name = Column(String(100), nullable=False, unique=True)
+
+
+def migration(func):
+    """Register func as a migration."""
+    migrations.append(func)
+    return func
+
+
+def migrate():
+    """Apply every migration which has not been applied yet. Returns the
+    number applied."""
+    applied = 0
+    with session() as s:
+        done = {name for name, in s.query(Migration.name)}
+        for func in migrations:
+            if func.__name__ in done:
+                continue
+            logger.info('Applying migration %s.', func.__name__)
+            func(s)
+            s.add(Migration(name=func.__name__))
+            applied += 1
+    return applied
+
+
+def pause_tasks(s, names):
+    """Pause the tasks with the given names, because the server now does their
+    work itself. They are paused rather than deleted, so builders who had
+    changed them can still get their code back."""
+    for task in s.query(Task).filter(
+        Task.name.in_(names), Task.paused.isnot(True)
+    ):
+        task.pause()
+        logger.info(
+            'Paused task #%d (%s), which has been replaced.', task.id,
+            task.name
+        )
+
+
+@migration
+def pause_polling_tasks(s):
+    """The timers in server/db/timers.py replaced these tasks."""
+    pause_tasks(s, ('Random Sounds', 'Mobiles', 'Transit Routes', 'Ringtone'))
+
+
+@migration
+def pause_space_task(s):
+    """server.space.tick replaced the Space task."""
+    pause_tasks(s, ('Space',))
@@ -4,10 +4,12 @@ from time import time
 from random import uniform, choice
 from sqlalchemy import Column, Float, Boolean
 from .base import Base, Sound, PauseMixin
-from .directions import Direction
-from .objects import Object
+from .directions import direction_table
+from .objects import Object, RestingStates
 from .entrances import Entrance
+from .rooms import Room
 from .session import Session
+from ..connections import connections
 from ..sound import get_sound
 from ..util import walk
 
@@ -34,49 +36,129 @@ class Mobile(Base, PauseMixin):
 
     def move(self):
         """Move this object a bit."""
-        obj = self.object
-        loc = obj.location
-        x, y, z = obj.coordinates
-        self.next_move = time() + uniform(
-            self.min_move_interval, self.max_move_interval
+        move_mobiles([self], time())
+
+
+def exit_index(room_ids):
+    """Return a dictionary mapping (room id, x, y, z) tuples to lists of the
+    exits at those coordinates which mobiles can use, for every room in
+    room_ids."""
+    index = {}
+    for exit in Object.join(Entrance).filter(
+        Object.location_id.in_(room_ids), Entrance.no_mobiles.is_(False),
+        Entrance.locked.is_(False)
+    ):
+        index.setdefault(
+            (exit.location_id, *exit.coordinates), []
+        ).append(exit)
+    return index
+
+
+def choose_direction(obj, room):
+    """Return a random horizontal DirectionRow which does not take obj out of
+    room or back the way it came, or None."""
+    directions = direction_table.load()
+    recent = direction_table.get(obj.recent_direction_id)
+    avoid = None if recent is None else recent.opposite_id
+    limits = [(obj.x, room.size_x, 'x'), (obj.y, room.size_y, 'y')]
+    choices = []
+    for direction in directions:
+        if direction.z or direction.id == avoid:
+            continue
+        if any(
+            (not value and getattr(direction, name) == -1) or
+            (value == size and getattr(direction, name) == 1)
+            for value, size, name in limits
+        ):
+            continue
+        choices.append(direction)
+    if choices:
+        return choice(choices)
+
+
+def step_quietly(obj, direction, coordinates, now):
+    """Move obj like util.walk would, for rooms with nobody in them to tell
+    about it."""
+    if obj.resting_state is not RestingStates.standing or \
+       now - obj.last_walked < obj.speed:
+        return
+    obj.last_walked = now
+    obj.recent_direction_id = direction.id
+    obj.steps += 1
+    obj.recent_exit_id = None
+    obj.coordinates = coordinates
+
+
+def move_mobiles(mobiles, now):
+    """Move a batch of mobiles. Their objects, rooms, followers and the exits
+    they could use are loaded with one query each, and directions come from
+    direction_table.
+
+    Mobiles in rooms which nobody is connected to, who are not following or
+    followed by anyone, move without looking up footstep sounds or telling
+    anyone."""
+    objects = {
+        mobile.id: mobile.object for mobile in mobiles
+        if mobile.object is not None and
+        mobile.object.location_id is not None
+    }
+    for mobile in mobiles:
+        mobile.next_move = now + uniform(
+            mobile.min_move_interval, mobile.max_move_interval
         )
-        Session.add(self)
-        if self.follow_exits:
+    Session.add_all(mobiles)
+    if not objects:
+        return
+    room_ids = {obj.location_id for obj in objects.values()}
+    rooms = {
+        room.id: room for room in Room.query(Room.id.in_(room_ids))
+    }
+    listened = {id for id in room_ids if connections.in_room(id)}
+    followed = {
+        id for id, in Session.query(Object.following_id).filter(
+            Object.following_id.in_([obj.id for obj in objects.values()])
+        )
+    }
+    if any(mobile.follow_exits for mobile in mobiles):
+        exits = exit_index(room_ids)
+    else:
+        exits = {}
+    # Step mobiles room by room, so the commands each connection receives
+    # are sent together.
+    for mobile in sorted(
+        mobiles, key=lambda mobile: getattr(
+            objects.get(mobile.id), 'location_id', 0
+        )
+    ):
+        obj = objects.get(mobile.id)
+        if obj is None:
+            continue
+        room = rooms[obj.location_id]
+        if mobile.follow_exits:
             # Let's find us an exit.
-            args = [
-                Object.location_id == loc.id,
-                Object.exit_id.isnot(None),
-                Object.x == x,
-                Object.y == y,
-                Object.z == z,
-                Entrance.no_mobiles.is_(False),
-                Entrance.locked.is_(False)
+            choices = [
+                exit for exit in exits.get(
+                    (room.id, *obj.coordinates), ()
+                ) if exit.id != obj.recent_exit_id
             ]
-            if obj.recent_exit_id is not None:
-                args.append(Object.id != obj.recent_exit_id)
-            exits = Object.join(Entrance).filter(*args).all()
-            if exits:
-                # We found one.
-                exit = choice(exits)
-                # Let's use the exit.
-                return exit.use_exit(obj)
+            if choices:
+                # We found one. Let's use it.
+                choice(choices).use_exit(obj)
+                continue
         # Let's find a random direction.
-        args = []
-        for name in ('x', 'y'):
-            value = getattr(obj, name)
-            if not value:
-                args.append(getattr(Direction, name) != -1.0)
-            elif value == getattr(loc, f'size_{name}'):
-                args.append(getattr(Direction, name) != 1.0)
-        if obj.recent_direction_id is not None:
-            args.append(Direction.id != obj.recent_direction.opposite_id)
+        direction = choose_direction(obj, room)
         obj.recent_direction_id = None
-        directions = Direction.query(*args, z=0.0).all()
-        if directions:
-            # We're not stuck.
-            direction = choice(directions)
-            coordinates = direction.coordinates_from(obj.coordinates)
-            if loc.coordinates_ok(coordinates):
-                sound = self.get_move_sound()
-                x, y, z = direction.coordinates
-                walk(obj, x=x, y=y, z=z, sound=sound)
+        if direction is None:
+            continue  # We're stuck.
+        coordinates = direction.coordinates_from(obj.coordinates)
+        if not room.coordinates_ok(coordinates):
+            continue
+        if room.id in listened or obj.following_id is not None or \
+           obj.id in followed:
+            x, y, z = direction.coordinates
+            walk(
+                obj, x=x, y=y, z=z, sound=mobile.get_move_sound(),
+                followers=None if obj.id in followed else []
+            )
+        else:
+            step_quietly(obj, direction, coordinates, now)
@@ -19,17 +19,22 @@ from .session import Session
 from .communication import CommunicationChannel
 from ..util import directions
 from ..protocol import (
-    object_sound, location, message as _message, identify, delete, zone,
-    random_sound, remember_quit, speak, interface_sound
+    object_sound, location, message as _message, delete, zone,
+    random_sound, random_sounds, remember_quit, speak, interface_sound
 )
 from ..forms import Label, Field
+from ..connections import connections
+from ..interest import interest
+from ..spatial import spatial_index
 from ..sound import Sound as _Sound, get_sound, nonempty_room, motd_sound
 from ..socials import factory
 from .phones import PhoneStates
 
 logger = logging.getLogger(__name__)
 
-connections = {}
+# When more objects than this are in range, get_visible filters by coordinates
+# in SQL rather than by the IDs from the spatial index.
+max_visible_ids = 500
 
 
 class RestingStates(enum.Enum):
@@ -225,6 +230,13 @@ class Object(
         """Allow this object to speak an arbitrary array of floats."""
         self.location.broadcast_command(speak, self.id, data, _who=self)
 
+    def transmit_voice(self, frame):
+        """Send a voice frame from server.voice to every other object within
+        earshot."""
+        for obj, con in self.location.connections_near(self):
+            if obj is not self:
+                con.send_voice(frame)
+
     def same_coordinates(self):
         """Returns a set of sqlalchemy filters which expect the same
         coordinates as this object."""
@@ -292,7 +304,7 @@ class Object(
 
     def identify(self, con):
         """Identify this object to connection con."""
-        identify(con, self)
+        interest.identify(con, self)
 
     def get_all_fields(self):
         fields = super().get_all_fields()
@@ -382,7 +394,7 @@ class Object(
 
     def register_connection(self, con):
         """Assign connection con to this object."""
-        old = connections.pop(self.id, None)
+        old = connections.unregister(self.id)
         if old is not None:
             old.player_id = None
             remember_quit(old)
@@ -400,7 +412,7 @@ class Object(
             self.player.last_host = con.host
             con.player_id = self.id
             con.locked = self.player.locked
-            connections[self.id] = con
+            connections.register(self, con)
 
     def get_connection(self):
         """Get the connection associated with this object."""
@@ -431,9 +443,27 @@ class Object(
         if con is not None:
             zone(con, self.location.zone)
             location(con, self.location)
-            for obj in self.location.objects:
-                if obj is not self:
-                    obj.identify(con)
+            if ServerOptions.instance().client_random_sounds:
+                random_sounds(con, self.location)
+            self.update_interest(con, full=True)
+
+    def update_interest(self, con, full=False):
+        """Identify the objects this object can hear to connection con, and
+        tell it to forget those it can no longer hear. If full evaluates to
+        True, every object in range is identified again."""
+        loc = self.location
+        ids = spatial_index.near(
+            loc.id, self.coordinates,
+            loc.max_distance * self.max_distance_multiplier
+        )
+        ids.discard(self.id)
+        interest.look(con, self.id, ids, Object.get, full=full)
+
+    def update_neighbours(self, full=True):
+        super().update_neighbours(full=full)
+        con = self.get_connection()
+        if con is not None:
+            self.update_interest(con)
 
     def beep(self, private=False):
         """Make this object beep."""
@@ -552,7 +582,8 @@ class Object(
             ).first()
 
     def get_visible(self, *args, **kwargs):
-        """Get the objects in visual range of this object."""
+        """Get the objects in visual range of this object. Candidates are
+        found with the spatial index."""
         if self.location_id is not None:
             this = self
         elif self.holder_id is not None:
@@ -575,13 +606,17 @@ class Object(
                     )
                 ]
             )
-            for name in ('x', 'y', 'z'):
-                query_args.append(
-                    getattr(Object, name).between(
-                        getattr(this, name) - loc.visibility,
-                        getattr(this, name) + loc.visibility
+            ids = spatial_index.near(loc.id, this.coordinates, loc.visibility)
+            if len(ids) <= max_visible_ids:
+                query_args.append(Object.id.in_(ids))
+            else:
+                for name in ('x', 'y', 'z'):
+                    query_args.append(
+                        getattr(Object, name).between(
+                            getattr(this, name) - loc.visibility,
+                            getattr(this, name) + loc.visibility
+                        )
                     )
-                )
         return Object.query(*query_args, **kwargs)
 
     def use_exit(self, player):
@@ -674,21 +709,24 @@ class Object(
             exclusions.append(self)
             if self.following_id is not None:
                 exclusions.append(self.following)
+            excluded = {obj.id for obj in exclusions}
             if con is not None:
-                for obj in self.location.objects:
-                    if obj not in exclusions:
-                        delete(con, obj.id)
-            self.location.broadcast_command_selective(
-                lambda obj: obj not in exclusions, delete, self.id
-            )
+                for id in interest.known.get(con, set()) - excluded:
+                    delete(con, id)
+                interest.forget(con)
+            for c in list(interest.watchers.get(self.id, ())):
+                if c.player_id not in excluded:
+                    interest.drop(c, self.id)
         self.location = location
         self.coordinates = coordinates
         if self.location is not None:
+            # Identify the new room first, so that update_neighbours has
+            # nothing left to identify to this object's connection.
+            self.identify_location()
             self.update_neighbours()
             tile = location.tile_at(*coordinates)
             if tile is not None:
                 tile.step_on(self, private=bool(self.following))
-            self.identify_location()
 
     def clear_following(self):
         """Stop this object from following anyone."""
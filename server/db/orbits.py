@@ -7,7 +7,12 @@ from ..distance import au
 
 
 class Orbit(Base):
-    """Set an object orbiting around a point."""
+    """Set an object orbiting around a point.
+
+    Every tick the zone moves offset radians further around the zone it is
+    orbiting, at distance from it and height above it. If angle or height are
+    NULL, they are worked out from where the zone is on the next tick. See
+    server.space.orbit."""
 
     __tablename__ = 'orbits'
     orbiting_id = Column(Integer, ForeignKey('zones.id'), nullable=False)
@@ -20,3 +25,5 @@ class Orbit(Base):
     )
     distance = Column(Float, nullable=False, default=au)
     offset = Column(Float, nullable=False, default=0.004)
+    angle = Column(Float, nullable=True)
+    height = Column(Float, nullable=True)
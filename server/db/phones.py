@@ -3,6 +3,7 @@
 import os.path
 from enum import Enum as _Enum
 from string import digits
+from time import time
 from random_password import random_password
 from sqlalchemy import Column, Integer, Float, Enum, ForeignKey, Boolean
 from sqlalchemy.orm import relationship, backref
@@ -119,6 +120,7 @@ class Phone(Base, PhoneAddressMixin):
             player.do_social(self.dial_msg, _others=[obj])
             target.object.do_social(target.ring_msg)
             target.state = PhoneStates.ringing
+            target.next_ring = time()
             self.state = PhoneStates.calling
             self.call_to = target
             obj.sound(self.dial_sound)
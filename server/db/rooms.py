@@ -1,6 +1,5 @@
 """Provides the Room class."""
 
-import sys
 import os
 import os.path
 from sqlalchemy import Column, Float, Integer, ForeignKey
@@ -10,13 +9,25 @@ from .base import (
     RandomSoundMixin, RandomSoundContainerMixin, CoordinatesMixin, ZoneMixin,
     BoardMixin, LeaveMixin, Sound, message
 )
+from .session import Session
 from ..protocol import hidden_sound
-from ..sound import get_sound, sounds_dir
+from ..sound import get_sound, sounds_dir, catalog
 from ..socials import factory
+from ..wire import prepare
+from ..connections import connections
+from ..spatial import spatial_index
+from ..tiles import Tile, tile_index
 
 floor_types_dir = os.path.join(sounds_dir, 'footsteps')
 music_dir = os.path.join(sounds_dir, 'music')
 impulses_dir = os.path.join(sounds_dir, 'impulses')
+nothing = object()
+
+# The columns of RoomFloorTile which are copied to Tile instances.
+tile_columns = (
+    'id', 'name', 'floor_type', 'start_x', 'start_y', 'start_z', 'end_x',
+    'end_y', 'end_z'
+)
 
 
 class RoomRandomSound(RandomSoundMixin, Base):
@@ -64,10 +75,9 @@ class RoomFloorTile(Base, NameMixin):
     def covers(self, x, y, z):
         """Returns True if this tile covers the given coordinates, and False
         otherwise."""
-        if self.start_x <= x and self.end_x >= x and self.end_z >= z:
-            # Passed the x check, now let's check y.
-            return self.start_y <= y and self.end_y >= y and self.end_z >= z
-        return False
+        return self.start_x <= x <= self.end_x and \
+            self.start_y <= y <= self.end_y and \
+            self.start_z <= z <= self.end_z
 
     def step_on(self, obj, private=False):
         """Object obj has stepped onto this tile."""
@@ -116,43 +126,37 @@ class Room(
         Sound, nullable=True, default=os.path.join(floor_types_dir, 'grass')
     )
 
+    def get_tiles(self):
+        """Return the RoomTiles instance for this room from tile_index,
+        loading it first if necessary."""
+        tiles = tile_index.get(self.id)
+        if tiles is None:
+            tiles = tile_index.add(
+                self.id, [
+                    Tile(*row) for row in Session.query(
+                        *[
+                            getattr(RoomFloorTile, name)
+                            for name in tile_columns
+                        ]
+                    ).filter(RoomFloorTile.room_id == self.id)
+                ]
+            )
+        return tiles
+
     def tile_at(self, x, y, z):
         """Return the tile that spans the given coordinates."""
-        return RoomFloorTile.query(
-            RoomFloorTile.start_x <= x, RoomFloorTile.start_y <= y,
-            RoomFloorTile.start_z <= z, RoomFloorTile.end_x >= x,
-            RoomFloorTile.end_y >= y, RoomFloorTile.end_z >= z,
-            RoomFloorTile.room_id == self.id
-        ).order_by(RoomFloorTile.id.desc()).first()
+        tile = self.get_tiles().tile_at(x, y, z)
+        if tile is not None:
+            return RoomFloorTile.get(tile.id)
 
     def convolver_choices(self):
         res = [None]
-        for top, directories, filenames in os.walk(impulses_dir):
-            for filename in filenames:
-                full = os.path.join(top[len(impulses_dir) + 1:], filename)
-                name, ext = os.path.splitext(filename)
-                if ext in ('.wav', '.m4a'):
-                    readme = os.path.join(
-                        top, name + '.attribution.txt'
-                    )
-                    if os.path.isfile(readme):
-                        with open(readme, 'rb') as f:
-                            try:
-                                lines = [
-                                    x for x in f.readlines() if x.startswith(
-                                        b'"'
-                                    )
-                                ]
-                            except Exception as e:
-                                err = f'Unable to read file {readme}: {e}."'
-                                err = err.encode()
-                                lines = [err]
-                            description = b'. '.join(lines).decode(
-                                sys.getdefaultencoding(), 'replace'
-                            )
-                    else:
-                        description = 'No description available.'
-                    res.append([full, f'{filename}: {description.strip()}'])
+        for path in catalog.walk(impulses_dir):
+            filename = os.path.basename(path)
+            if os.path.splitext(filename)[1] in ('.wav', '.m4a'):
+                full = os.path.relpath(path, impulses_dir)
+                description = catalog.attribution(path)
+                res.append([full, f'{filename}: {description}'])
         return res
 
     @property
@@ -160,6 +164,23 @@ class Room(
         """Return all the objects in this room that are exits."""
         return [x for x in self.objects if x.is_exit]
 
+    def connections_near(self, who=None):
+        """Yield (object, connection) pairs for every connected object in this
+        room. If who is not None, only objects within self.max_distance of who
+        are yielded."""
+        if who is not None:
+            near = spatial_index.near(
+                self.id, who.coordinates,
+                self.max_distance * who.max_distance_multiplier
+            )
+        for con in connections.in_room(self.id):
+            if who is not None and con.player_id not in near:
+                continue
+            obj = con.get_player()
+            if obj is None:
+                continue
+            yield obj, con
+
     def broadcast_command(self, *args, **kwargs):
         """Send a command to everyone in the room. If _who is not None only
         objects within self.max_distance will hear about it."""
@@ -171,25 +192,24 @@ class Room(
         self, func, command, *args, _who=None, **kwargs
     ):
         """Send a command to any object for whom func(object) evaluates to
-        True. For further usage see the docstring for broadcast_command."""
-        if _who is None:
-            objects = self.objects
-        else:
-            Object = _who.__class__
-            md = self.max_distance * _who.max_distance_multiplier
-            query_args = [Object.location_id == self.id]
-            for name in ('x', 'y', 'z'):
-                query_args.append(
-                    getattr(Object, name).between(
-                        getattr(_who, name) - md,
-                        getattr(_who, name) + md
-                    )
-                )
-            objects = Object.query(*query_args)
-        for obj in objects:
-            con = obj.get_connection()
-            if con is not None and func(obj):
+        True. For further usage see the docstring for broadcast_command.
+
+        Recipients are found with the connection registry, so only objects
+        which are connected are considered. The command is only encoded once,
+        and the same data is sent to every connection. Commands which need
+        more than a connection's send method are called once per connection
+        instead."""
+        prepared = nothing
+        for obj, con in self.connections_near(_who):
+            if not func(obj):
+                continue
+            if prepared is nothing:
+                prepared = prepare(command, *args, **kwargs)
+            if prepared is None:
                 command(con, *args, **kwargs)
+            else:
+                for c in prepared:
+                    con.send_prepared(c)
 
     def sound(self, sound, coordinates, is_dry=False, selector=None):
         """The provided sound will be heard at the specified coordinates by
@@ -207,12 +227,12 @@ class Room(
         """Return a suitable footstep sound for this room. If coordinates is
         None then this room's overall walk sound will be returned, otherwise a
         tile will be searched for. If covering is not None then it will be used
-        instead of querying for a tile."""
+        instead of looking for a tile."""
         name = None
         if coordinates is not None:
             x, y, z = coordinates
             if covering is None:
-                covering = self.tile_at(x, y, z)
+                covering = self.get_tiles().tile_at(x, y, z)
             if covering is not None:
                 name = covering.floor_type
         else:
@@ -224,4 +244,4 @@ class Room(
 
     def make_random_sound(self, name):
         """Make an instance of RoomRandomSound."""
-        return RoomRandomSound(room=self, name=name)
+        return RoomRandomSound(room_id=self.id, name=name)
@@ -0,0 +1,64 @@
+"""Convert database rows to and from msgpack.
+
+Values which msgpack does not understand natively are stored as extension
+types. Enums are stored by name, which SQLAlchemy's Enum type accepts when
+they are inserted again."""
+
+import enum
+from datetime import datetime, timedelta
+from struct import Struct
+from msgpack import ExtType, Packer, Unpacker, packb, unpackb
+
+datetime_ext = 1
+timedelta_ext = 2
+
+# Days, seconds, microseconds.
+timedelta_struct = Struct('>qii')
+
+
+def default(value):
+    """Convert values msgpack cannot pack by itself."""
+    if isinstance(value, datetime):
+        return ExtType(datetime_ext, value.isoformat().encode())
+    elif isinstance(value, timedelta):
+        return ExtType(
+            timedelta_ext, timedelta_struct.pack(
+                value.days, value.seconds, value.microseconds
+            )
+        )
+    elif isinstance(value, enum.Enum):
+        return value.name
+    raise TypeError('Cannot serialise %r.' % value)
+
+
+def ext_hook(code, data):
+    """Convert extension types back to values."""
+    if code == datetime_ext:
+        return datetime.fromisoformat(data.decode())
+    elif code == timedelta_ext:
+        days, seconds, microseconds = timedelta_struct.unpack(data)
+        return timedelta(
+            days=days, seconds=seconds, microseconds=microseconds
+        )
+    return ExtType(code, data)
+
+
+def get_packer():
+    """Return a msgpack Packer which understands database values."""
+    return Packer(default=default, use_bin_type=True)
+
+
+def get_unpacker(f, **kwargs):
+    """Return a msgpack Unpacker which reads database values from the file
+    object f. Extra keyword arguments are passed to the Unpacker."""
+    return Unpacker(f, ext_hook=ext_hook, raw=False, **kwargs)
+
+
+def pack(value):
+    """Pack a single value."""
+    return packb(value, default=default, use_bin_type=True)
+
+
+def unpack(data):
+    """Unpack a single value."""
+    return unpackb(data, ext_hook=ext_hook, raw=False)
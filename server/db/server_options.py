@@ -2,7 +2,9 @@
 
 from socket import getfqdn
 from datetime import timedelta
-from sqlalchemy import Column, Integer, Interval, ForeignKey, Float
+from sqlalchemy import (
+    Column, Integer, Interval, ForeignKey, Float, Boolean
+)
 from sqlalchemy.orm import relationship, backref
 from .base import Base, NameMixin, message
 from .session import Session
@@ -56,6 +58,18 @@ class ServerOptions(Base, NameMixin):
     )
     motd = message(None, nullable=True)
     auto_start_tasks = Column(Float, nullable=False, default=60)
+    batch_commands = Column(Boolean, nullable=False, default=False)
+    outbound_high_water = Column(Integer, nullable=False, default=1000)
+    outbound_limit = Column(Integer, nullable=False, default=10000)
+    slow_client_timeout = Column(Float, nullable=False, default=30.0)
+    sound_scan_interval = Column(Float, nullable=False, default=60.0)
+    journal_compact_interval = Column(Float, nullable=False, default=1800.0)
+    space_interval = Column(Float, nullable=False, default=1.0)
+    orbit_warp = Column(Float, nullable=False, default=1.0)
+    client_random_sounds = Column(Boolean, nullable=False, default=False)
+    move_interval = Column(Float, nullable=False, default=0.1)
+    max_voice_frame_length = Column(Integer, nullable=False, default=32768)
+    voice_frame_rate = Column(Integer, nullable=False, default=50)
 
     @classmethod
     def instance(cls):
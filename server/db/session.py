@@ -1,16 +1,21 @@
 """Provides the scoped session."""
 
 from contextlib import contextmanager
+from sqlalchemy import event
 from sqlalchemy.orm import sessionmaker, scoped_session
 from .engine import engine
 
 session_factory = sessionmaker(bind=engine)
 Session = scoped_session(session_factory)
 
+# When True, the session and its identity map outlive each unit of work.
+persistent = False
+
 
 @contextmanager
 def session():
-    """Close the session when we're done."""
+    """Commit when we're done. Unless persistent mode is enabled, the session
+    is closed too."""
     s = Session()
     try:
         yield s
@@ -19,4 +24,58 @@ def session():
         s.rollback()
         raise e
     finally:
-        Session.remove()
+        if not persistent:
+            Session.remove()
+
+
+def enable_persistence():
+    """Keep one session for the life of the server. Objects are no longer
+    expired by commit, so the player, their location and everything else
+    which has been loaded stays in memory instead of being loaded again for
+    every command.
+
+    Every change goes through this session, so loaded objects stay up to date.
+    The exceptions are bulk updates and deletes, which expire the loaded
+    instances of the class they touch."""
+    global persistent
+    persistent = True
+    Session.remove()
+    make_persistent(session_factory)
+
+
+def make_persistent(factory):
+    """Configure a sessionmaker for long-lived sessions."""
+    factory.configure(expire_on_commit=False)
+    for name in (
+        'pending_to_persistent', 'deleted_to_persistent',
+        'detached_to_persistent', 'loaded_as_persistent'
+    ):
+        event.listen(factory, name, keep_reference)
+    for name in (
+        'persistent_to_detached', 'persistent_to_deleted',
+        'persistent_to_transient'
+    ):
+        event.listen(factory, name, drop_reference)
+    event.listen(factory, 'after_bulk_update', after_bulk)
+    event.listen(factory, 'after_bulk_delete', after_bulk)
+
+
+def keep_reference(s, instance):
+    """The identity map only holds weak references, so hold a strong one for
+    as long as the object is in the session."""
+    s.info.setdefault('references', set()).add(instance)
+
+
+def drop_reference(s, instance):
+    """The object has left the session."""
+    s.info.get('references', set()).discard(instance)
+
+
+def after_bulk(context):
+    """Expire every loaded instance of the class a bulk update or delete was
+    performed on."""
+    cls = context.mapper.class_
+    s = context.session
+    for instance in list(s.identity_map.values()):
+        if isinstance(instance, cls):
+            s.expire(instance)
@@ -0,0 +1,168 @@
+"""Binary snapshots of the database.
+
+A snapshot is a stream of msgpack values. The first is a header:
+
+    {
+        'format': 'mindspace-snapshot', 'version': 1,
+        'tables': [[table name, [column name, ...], number of rows], ...]
+    }
+
+Tables follow in the order they appear in the header, as [table name, rows]
+chunks, where each row is a list of values in the order given by the header.
+Columns which no longer exist are ignored when loading, and columns which
+have been added since the snapshot was written get their defaults."""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+from .bulk import record_timing
+from .serialise import get_packer, get_unpacker, pack
+
+logger = logging.getLogger(__name__)
+
+snapshot_format = 'mindspace-snapshot'
+snapshot_version = 1
+snapshot_extension = '.snapshot'
+
+# The number of rows in each chunk.
+chunk_size = 1000
+
+# Tables with fewer rows than this are packed without a worker process.
+min_parallel_rows = 5000
+
+
+class SnapshotError(Exception):
+    """The snapshot could not be loaded."""
+
+
+def read_tables(connection, tables):
+    """Read every row of the given tables. Returns a list of (name, columns,
+    rows) tuples which can be passed to write_snapshot."""
+    res = []
+    for table in tables:
+        started = time()
+        columns = [column.name for column in table.columns]
+        rows = [list(row) for row in connection.execute(table.select())]
+        res.append((table.name, columns, rows))
+        logger.debug(
+            'Read %d rows from %s (%.2f seconds).', len(rows), table.name,
+            time() - started
+        )
+    return res
+
+
+def pack_table(name, rows):
+    """Pack the rows of a table. Returns (data, seconds taken). Runs in a
+    worker process for large tables."""
+    started = time()
+    packer = get_packer()
+    chunks = []
+    for start in range(0, len(rows), chunk_size):
+        chunks.append(packer.pack([name, rows[start:start + chunk_size]]))
+    return b''.join(chunks), time() - started
+
+
+def write_snapshot(filename, tables, workers=None):
+    """Write tables (as returned by read_tables) to filename. Large tables are
+    packed in parallel worker processes. Can be called from any thread."""
+    started = time()
+    header = dict(
+        format=snapshot_format, version=snapshot_version, tables=[
+            [name, columns, len(rows)] for name, columns, rows in tables
+        ]
+    )
+    results = {}
+    large = [
+        (name, rows) for name, columns, rows in tables
+        if len(rows) >= min_parallel_rows
+    ]
+    if len(large) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for (name, rows), result in zip(
+                large, executor.map(pack_table, *zip(*large))
+            ):
+                results[name] = result
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(pack(header))
+        for name, columns, rows in tables:
+            if name in results:
+                data, taken = results.pop(name)
+            else:
+                data, taken = pack_table(name, rows)
+            f.write(data)
+            if rows:
+                logger.info(
+                    'Dumped %d rows from %s (%d bytes, %.2f seconds).',
+                    len(rows), name, len(data), taken
+                )
+    os.replace(tmp, filename)
+    logger.info(
+        'Snapshot written to %s (%.2f seconds).', filename, time() - started
+    )
+
+
+def load_snapshot(filename, connection, metadata, timings=None):
+    """Load the snapshot at filename into the database on connection, using
+    metadata to find tables. If timings is not None, the number of rows and
+    seconds taken are added to it for each table. Returns the number of rows
+    loaded."""
+    started = time()
+    total = 0
+    with open(filename, 'rb') as f:
+        unpacker = get_unpacker(f, max_buffer_size=2 ** 31 - 1)
+        try:
+            header = next(unpacker)
+        except StopIteration:
+            raise SnapshotError('%s is empty.' % filename)
+        if not isinstance(header, dict) or header.get(
+            'format'
+        ) != snapshot_format:
+            raise SnapshotError('%s is not a snapshot.' % filename)
+        elif header['version'] != snapshot_version:
+            raise SnapshotError(
+                'Unsupported snapshot version: %r.' % header['version']
+            )
+        columns = {}
+        for name, names, count in header['tables']:
+            table = metadata.tables.get(name)
+            if table is None:
+                logger.warning('Ignoring table %s.', name)
+                continue
+            columns[name] = [
+                (index, column) for index, column in enumerate(names)
+                if column in table.c
+            ]
+            missing = set(names).difference(table.c.keys())
+            if missing:
+                logger.warning(
+                    'Ignoring columns from %s: %s.', name,
+                    ', '.join(sorted(missing))
+                )
+        table_timings = {}
+        for name, rows in unpacker:
+            if name not in columns:
+                continue
+            table_started = time()
+            connection.execute(
+                metadata.tables[name].insert(), [
+                    {column: row[index] for index, column in columns[name]}
+                    for row in rows
+                ]
+            )
+            count, taken = table_timings.get(name, (0, 0.0))
+            table_timings[name] = (
+                count + len(rows), taken + time() - table_started
+            )
+            total += len(rows)
+    for name, (count, taken) in table_timings.items():
+        record_timing(timings, name, count, taken)
+        logger.info(
+            'Loaded %d rows into %s (%.2f seconds).', count, name, taken
+        )
+    logger.info(
+        'Loaded %d rows from %s (%.2f seconds).', total, filename,
+        time() - started
+    )
+    return total
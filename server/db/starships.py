@@ -9,7 +9,7 @@ from .base import Base, NameMixin, LandMixin, LaunchMixin
 from ..distance import km, ly
 from ..sound import get_sound, NoSuchSound
 from ..protocol import hidden_sound
-from ..util import frange
+from ..kinematics import braking_distance, braking_time, autopilot
 
 
 @attrs
@@ -135,11 +135,18 @@ class Starship(Base, LandMixin, LaunchMixin):
         """Set how much this ship is accelerating by. Factor should be between
         0.0 (not accelerating) and 1.0 (full thrust). Can overload for fun. If
         accelerating is left at None then the accelerating state of the
-        starship will remain unchanged."""
+        starship will remain unchanged. Occupants are only told about the
+        change if something actually changed."""
         z = self.zone
-        z.acceleration = self.engine.max_acceleration * factor
-        if accelerating is not None:
-            z.accelerating = accelerating
+        acceleration = self.engine.max_acceleration * factor
+        if accelerating is None:
+            accelerating = z.accelerating
+        if (z.acceleration, z.accelerating, z.ambience_rate) == (
+            acceleration, accelerating, factor
+        ):
+            return
+        z.acceleration = acceleration
+        z.accelerating = accelerating
         z.ambience_rate = factor
         z.update_occupants()
 
@@ -150,7 +157,7 @@ class Starship(Base, LandMixin, LaunchMixin):
         z = self.zone
         if thrust is None:
             thrust = e.max_acceleration
-        return sum(frange(0, z.speed, thrust))
+        return braking_distance(z.speed or 0.0, thrust)
 
     def get_deceleration_time(self, thrust=None):
         """Return a timedelta representing how long it will take this ship to
@@ -159,4 +166,11 @@ class Starship(Base, LandMixin, LaunchMixin):
         z = self.zone
         if thrust is None:
             thrust = e.max_acceleration
-        return timedelta(seconds=len(list(frange(0, z.speed, thrust))))
+        return timedelta(seconds=braking_time(z.speed or 0.0, thrust))
+
+    def get_autopilot_thrust(self, distance):
+        """Return (factor, accelerating) to pass to set_acceleration, so that
+        this ship reaches a target which is distance away without
+        overshooting."""
+        max_acceleration = getattr(self.engine, 'max_acceleration', 1.0)
+        return autopilot(distance, self.zone.speed or 0.0, max_acceleration)
@@ -0,0 +1,145 @@
+"""The timers the server keeps in server.timers.timers.
+
+Each timer is backed by a column which holds the time its row is next due.
+Mapper events push rows onto the heap when they are inserted, or when the
+column or paused changes, and build_timers fills the heap from the columns
+when the database is loaded."""
+
+import logging
+from random import uniform
+from time import time
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload
+from .base import Base, RandomSoundContainerMixin
+from .mobiles import Mobile, move_mobiles
+from .phones import Phone, PhoneStates
+from .rooms import Room
+from .server_options import ServerOptions
+from .session import Session, session
+from .transits import TransitRoute, TransitStop
+from ..timers import timers
+
+logger = logging.getLogger(__name__)
+
+timers.session = session
+
+
+def watch(timer):
+    """Push rows of timer.cls when they are stored, and discard them when
+    they are deleted."""
+    cls = timer.cls
+
+    def stored(mapper, connection, obj):
+        key = timers.key(obj, timer.kind)
+        state = inspect(obj)
+        if getattr(obj, 'paused', False):
+            timers.discard(key)
+        elif state.attrs[timer.column].history.has_changes() or (
+            'paused' in state.attrs and
+            state.attrs['paused'].history.has_changes()
+        ):
+            timers.push(key, timer.get_due(obj))
+
+    def inserted(mapper, connection, obj):
+        if not getattr(obj, 'paused', False):
+            timers.push(timers.key(obj, timer.kind), timer.get_due(obj))
+
+    def deleted(mapper, connection, obj):
+        timers.discard(timers.key(obj, timer.kind))
+
+    event.listen(cls, 'after_insert', inserted)
+    event.listen(cls, 'after_update', stored)
+    event.listen(cls, 'after_delete', deleted)
+
+
+def tracked(cls, column, kind, **kwargs):
+    """A decorator which tracks column of cls, calling the decorated function
+    when rows are due. Extra keyword arguments are passed to Timer."""
+
+    def inner(func):
+        watch(timers.track(cls, column, kind, func, **kwargs))
+        return func
+
+    return inner
+
+
+# Phones which were ringing before their next ring was recorded are due
+# straight away, and stop if they are no longer ringing.
+@tracked(Phone, 'next_ring', 'ring', when_none=0.0)
+def ring(phone, now):
+    """Ring a phone which is ringing."""
+    if phone.state is PhoneStates.ringing:
+        phone.next_ring = now + phone.ring_every
+        phone.object.sound(phone.ring_sound)
+    else:
+        phone.next_ring = None
+
+
+# Mobiles which are due together move as a batch.
+watch(
+    timers.track(
+        Mobile, 'next_move', 'move', move_mobiles, batch=True,
+        options=[joinedload('object')]
+    )
+)
+
+
+# Routes with no next move have never run, so are due straight away.
+@tracked(TransitRoute, 'next_move', 'transit', when_none=0.0)
+def advance_route(route, now):
+    """Move a transit route on to its next stop."""
+    route.advance(now)
+
+
+def play_random_sound(obj, now):
+    """Play a random sound, or stop if there are none left. When clients play
+    the random sounds of rooms themselves, rooms stay scheduled without
+    playing anything, so they start again if the option is turned off."""
+    if not obj.random_sounds:
+        obj.next_random_sound = None
+    elif isinstance(obj, Room) and \
+            ServerOptions.instance().client_random_sounds:
+        obj.next_random_sound = now + uniform(
+            obj.min_random_sound_interval, obj.max_random_sound_interval
+        )
+    else:
+        obj.play_random_sound()
+
+
+for cls in Base._decl_class_registry.values():
+    if isinstance(cls, type) and RandomSoundContainerMixin in cls.__bases__:
+        watch(
+            timers.track(
+                cls, 'next_random_sound', 'random_sound', play_random_sound
+            )
+        )
+
+
+@event.listens_for(TransitStop, 'after_insert')
+def transit_stop_added(mapper, connection, stop):
+    """Routes with no stops are not rescheduled, so start them again."""
+    route = stop.transit_route
+    if route is not None and not route.paused:
+        timer = timers.get_timer(route, 'transit')
+        timers.push(timers.key(route, 'transit'), timer.get_due(route))
+
+
+def build_timers():
+    """Fill the timer heap from the database."""
+    started = time()
+    timers.clear()
+    for timer in timers.timers.values():
+        cls = timer.cls
+        column = getattr(cls, timer.column)
+        args = []
+        if timer.when_none is None:
+            args.append(column.isnot(None))
+        if hasattr(cls, 'paused'):
+            args.append(cls.paused.is_(False))
+        for id, when in Session.query(cls.id, column).filter(*args):
+            if when is None:
+                when = timer.when_none
+            timers.push((cls.__name__, id, timer.kind), when)
+    logger.info(
+        'Timers built: %d (%.2f seconds).', len(timers), time() - started
+    )
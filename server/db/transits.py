@@ -1,11 +1,16 @@
 """Classes to make trains and the like work."""
 
+from datetime import timedelta
 from sqlalchemy import Column, Integer, Float, ForeignKey
 from sqlalchemy.orm import relationship, backref
 from .base import (
     Base, NameMixin, CoordinatesMixin, LocationMixin, PauseMixin, BoardMixin,
     LeaveMixin, message, Sound
 )
+from .session import Session
+from ..protocol import message as _message, random_sound
+from ..sound import get_sound
+from ..util import format_timedelta
 
 
 class TransitStop(Base, LocationMixin, CoordinatesMixin):
@@ -60,3 +65,73 @@ class TransitRoute(
     room = relationship(
         'Room', backref=backref('transit_route', uselist=False)
     )
+
+    def advance(self, now):
+        """Pull into the next stop if in transit, or depart from the current
+        stop. Routes with no stops do nothing."""
+        if not self.stops:
+            return
+        if self.next_stop_id is None or self.next_stop not in self.stops:
+            self.next_stop_id = self.stops[0].id
+            Session.add(self)
+        obj = self.object
+        if obj.location is None:
+            # We're in transit, let's pull into a stop.
+            stop = self.next_stop
+            assert stop.location is not None, \
+                f'This stop ({repr(stop)}) has no location.'
+            obj.move(stop.location, stop.coordinates)
+            assert obj.location is stop.location, \
+                f'This object ({obj.get_name(True)}) failed to move to the ' \
+                f'next stop ({repr(stop)}).'
+            Session.add(obj)
+            Session.commit()
+            obj.do_social(self.arrive_msg, _channel='transit-arrive')
+            if self.arrive_sound is not None:
+                obj.sound(get_sound(self.arrive_sound))
+            i = self.stops.index(self.next_stop) + 1
+            if i >= len(self.stops):
+                i = 0
+            stop = self.stops[i]
+            self.next_stop_id = stop.id
+            if self.room is not None:
+                here = obj.location.get_name()
+                new = stop.location.get_name()
+                when = format_timedelta(
+                    timedelta(
+                        seconds=stop.before_departure + stop.after_departure
+                    )
+                )
+                self.room.broadcast_command(
+                    _message, self.arrive_other_msg.format(here, new, when)
+                )
+                if self.arrive_other_sound is not None:
+                    sound = get_sound(self.arrive_other_sound)
+                    for occupant in self.room.objects:
+                        occupant.sound(sound, private=True)
+            self.next_move = now + stop.before_departure
+        else:
+            # We're at a stop. Let's move out.
+            stop = self.next_stop
+            obj.do_social(self.depart_msg, _channel='transit-depart')
+            if self.depart_sound is not None:
+                obj.location.broadcast_command(
+                    random_sound, get_sound(self.depart_sound),
+                    *obj.coordinates, 1.0
+                )
+            if self.room is not None:
+                here = obj.location.get_name(False)
+                new = stop.location.get_name(False)
+                when = format_timedelta(
+                    timedelta(seconds=stop.after_departure)
+                )
+                self.room.broadcast_command(
+                    _message, self.depart_other_msg.format(here, new, when)
+                )
+                if self.depart_other_sound is not None:
+                    sound = get_sound(self.depart_other_sound)
+                    for occupant in self.room.objects:
+                        occupant.sound(sound, private=True)
+            self.next_move = now + stop.after_departure
+            obj.move(None, (0.0, 0.0, 0.0))
+        Session.add_all([obj, self])
@@ -1,6 +1,14 @@
-"""Provides the Zone class."""
+"""Provides the Zone class.
 
-from sqlalchemy import Column, Float, Integer, ForeignKey, Boolean
+The positions of zones are indexed by the zones_rtree R*Tree virtual table,
+which triggers keep up to date. Along with each zone's bounding box it stores
+the zone's kind (see zone_kinds) and whether or not it is hidden, so sensor
+filters are applied by the index."""
+
+from sqlalchemy import (
+    Column, Float, Integer, ForeignKey, Boolean, MetaData, Table, event,
+    and_, not_
+)
 from sqlalchemy.orm import relationship, backref
 from .base import (
     Base, CoordinatesMixin, NameMixin, DescriptionMixin, OwnerMixin,
@@ -8,7 +16,61 @@ from .base import (
 )
 from .session import Session
 from ..protocol import zone
-from ..util import distance_between
+from ..connections import connections
+
+# The values stored in the kind column of zones_rtree.
+zone_kinds = dict(Starship=1, Star=2, Debris=3)
+
+# The index is not part of Base.metadata, so create_all leaves it alone.
+zones_rtree = Table(
+    'zones_rtree', MetaData(), Column('id', Integer, primary_key=True),
+    *[
+        Column(name, Float) for name in (
+            'min_x', 'max_x', 'min_y', 'max_y', 'min_z', 'max_z'
+        )
+    ], Column('kind', Integer), Column('hidden', Boolean)
+)
+
+zone_index_values = '''
+    new.id, new.x, new.x, new.y, new.y, new.z, new.z,
+    CASE
+        WHEN new.starship_id IS NOT NULL THEN %d
+        WHEN new.star_id IS NOT NULL THEN %d
+        ELSE %d
+    END,
+    new.hidden
+''' % (zone_kinds['Starship'], zone_kinds['Star'], zone_kinds['Debris'])
+
+zone_index_ddl = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS zones_rtree USING rtree(
+        id, min_x, max_x, min_y, max_y, min_z, max_z, +kind, +hidden
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS zones_rtree_insert AFTER INSERT ON zones
+    BEGIN
+        INSERT INTO zones_rtree VALUES (%s);
+    END''' % zone_index_values,
+    '''CREATE TRIGGER IF NOT EXISTS zones_rtree_update
+    AFTER UPDATE OF id, x, y, z, starship_id, star_id, hidden ON zones
+    BEGIN
+        DELETE FROM zones_rtree WHERE id = old.id;
+        INSERT INTO zones_rtree VALUES (%s);
+    END''' % zone_index_values,
+    '''CREATE TRIGGER IF NOT EXISTS zones_rtree_delete AFTER DELETE ON zones
+    BEGIN
+        DELETE FROM zones_rtree WHERE id = old.id;
+    END'''
+]
+
+
+def create_zone_index(connection):
+    """Create zones_rtree and its triggers if they do not exist yet, and index
+    every zone. Zones which are already indexed are indexed again."""
+    for statement in zone_index_ddl:
+        connection.execute(statement)
+    connection.execute(
+        'INSERT OR REPLACE INTO zones_rtree SELECT %s FROM zones' %
+        zone_index_values.replace('new.', 'zones.')
+    )
 
 
 class Zone(
@@ -47,40 +109,68 @@ class Zone(
 
     def update_occupants(self):
         """Tell everyone inside this zone it has changed."""
-        for room in self.rooms:
-            for obj in room.objects:
-                con = obj.get_connection()
-                if con is not None:
-                    zone(con, self)
+        for con in connections.in_zone(self.id):
+            zone(con, self)
 
-    def visible_objects(self, sort=True):
-        """Get the objects in sensor range."""
-        cls = self.__class__
-        args = [cls.id != self.id, cls.hidden.isnot(True)]
-        for name in ('x', 'y', 'z'):
+    @classmethod
+    def near(
+        cls, coordinates, distance, *args, exclude=(), include_hidden=False,
+        sort=True, limit=None
+    ):
+        """Return a query for the zones which are no more than distance away
+        from coordinates along every axis, and match any extra criteria given
+        as args. Zones whose types (as returned by
+        get_type) are in exclude are left out, as are hidden zones unless
+        include_hidden evaluates to True. If sort evaluates to True the
+        closest zones come first, and if limit is not None only that many are
+        returned, giving the nearest neighbours within range."""
+        x, y, z = coordinates
+        c = zones_rtree.c
+        args = [
+            *args,
+            c.min_x <= x + distance, c.max_x >= x - distance,
+            c.min_y <= y + distance, c.max_y >= y - distance,
+            c.min_z <= z + distance, c.max_z >= z - distance
+        ]
+        # The index stores 32-bit floats, so check the exact values too.
+        for name, value in zip(('x', 'y', 'z'), coordinates):
             args.append(
-                getattr(cls, name).between(
-                    getattr(self, name) - self.starship.sensors.distance,
-                    getattr(self, name) + self.starship.sensors.distance
-                )
+                getattr(cls, name).between(value - distance, value + distance)
             )
-        objects = cls.query(*args)
+        kinds = [zone_kinds[name] for name in exclude if name in zone_kinds]
+        if kinds:
+            args.append(not_(c.kind.in_(kinds)))
+        if not include_hidden:
+            args.append(c.hidden.isnot(True))
+        query = Session.query(cls).join(
+            zones_rtree, zones_rtree.c.id == cls.id
+        ).filter(and_(*args))
         if sort:
-            objects = sorted(
-                objects,
-                key=lambda value: distance_between(
-                    self.coordinates, value.coordinates
-                )
+            query = query.order_by(
+                (cls.x - x) * (cls.x - x) + (cls.y - y) * (cls.y - y) +
+                (cls.z - z) * (cls.z - z)
             )
-        for name in dir(self.starship):
-            if name.startswith(
-                'filter_'
-            ) and getattr(
-                self.starship, name
-            ):
-                type = name[7:].title()
-                objects = [x for x in objects if x.get_type() != type]
-        return objects
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def sensor_query(self, sort=True, limit=None):
+        """Return a query for the objects in sensor range."""
+        return self.near(
+            self.coordinates, self.starship.sensors.distance,
+            self.__class__.id != self.id,
+            exclude=self.starship.get_filters(), sort=sort, limit=limit
+        )
+
+    def visible_objects(self, sort=True):
+        """Get the objects in sensor range."""
+        return self.sensor_query(sort=sort).all()
+
+    def can_see(self, obj):
+        """Return True if obj is in sensor range."""
+        return self.sensor_query(sort=False).filter(
+            self.__class__.id == obj.id
+        ).count() > 0
 
     def delete(self):
         """Destructively deletes all objects within this zone."""
@@ -89,3 +179,8 @@ class Zone(
                 Session.delete(obj)
             Session.delete(room)
         Session.delete(self)
+
+
+@event.listens_for(Zone.__table__, 'after_create')
+def zones_created(target, connection, **kwargs):
+    create_zone_index(connection)
@@ -0,0 +1,186 @@
+"""Provides the InterestManager class, which decides what each connection is
+told about the objects around it.
+
+A connection is sent a full identify command when an object comes within
+range of the object it is logged in as. The range is the max_distance of
+their room multiplied by their max_distance_multiplier, measured along each
+axis, as with SpatialIndex.near. While the object stays in range, the
+connection is only sent its coordinates with the move command, at most once
+every interval seconds. When the object leaves range, the connection is sent
+a delete command.
+
+See LocationMixin.update_neighbours and Object.update_interest for where
+objects are checked."""
+
+from time import time
+from attr import attrs, attrib, Factory
+from .protocol import identify, move, delete
+
+
+def in_range(first, second, distance):
+    """Return True if the coordinates first and second are no more than
+    distance apart along any axis."""
+    return all(abs(a - b) <= distance for a, b in zip(first, second))
+
+
+@attrs
+class InterestManager:
+    """The objects each connection knows about."""
+
+    # The least time between move commands about the same object.
+    interval = attrib(default=0.0)
+    # Maps connections to the set of object IDs they have been identified.
+    known = attrib(default=Factory(dict), init=False, repr=False)
+    # Maps object IDs to the set of connections they have been identified to.
+    watchers = attrib(default=Factory(dict), init=False, repr=False)
+    # Maps (connection, object ID) pairs to the time they were last moved.
+    moved = attrib(default=Factory(dict), init=False, repr=False)
+    # Maps (connection, object ID) pairs to coordinates which are waiting to
+    # be sent.
+    pending = attrib(default=Factory(dict), init=False, repr=False)
+    clock = attrib(default=None, init=False, repr=False)
+    call = attrib(default=None, init=False, repr=False)
+
+    def knows(self, con, id):
+        """Return True if con has been identified the object with the given
+        ID."""
+        return id in self.known.get(con, ())
+
+    def add(self, con, id):
+        """Record that con knows about the object with the given ID."""
+        self.known.setdefault(con, set()).add(id)
+        self.watchers.setdefault(id, set()).add(con)
+
+    def discard(self, con, id):
+        """Record that con no longer knows about the object with the given
+        ID."""
+        ids = self.known.get(con)
+        if ids is not None:
+            ids.discard(id)
+            if not ids:
+                del self.known[con]
+        cons = self.watchers.get(id)
+        if cons is not None:
+            cons.discard(con)
+            if not cons:
+                del self.watchers[id]
+        self.moved.pop((con, id), None)
+        self.pending.pop((con, id), None)
+
+    def forget(self, con):
+        """Forget everything con knows about, because it has left its room or
+        disconnected. No delete commands are sent."""
+        for id in list(self.known.get(con, ())):
+            self.discard(con, id)
+
+    def remove(self, id):
+        """Forget that anyone knows about the object with the given ID,
+        because it has left its room."""
+        for con in list(self.watchers.get(id, ())):
+            self.discard(con, id)
+
+    def clear(self):
+        """Forget everything."""
+        self.known.clear()
+        self.watchers.clear()
+        self.moved.clear()
+        self.pending.clear()
+
+    def identify(self, con, obj):
+        """Send con a full identify command for obj."""
+        identify(con, obj)
+        self.add(con, obj.id)
+        self.pending.pop((con, obj.id), None)
+
+    def drop(self, con, id):
+        """Tell con to forget about the object with the given ID if it knows
+        about it."""
+        if self.knows(con, id):
+            delete(con, id)
+            self.discard(con, id)
+
+    def move(self, con, id, coordinates):
+        """Send con the new coordinates of the object with the given ID. If
+        con was sent a move for the same object less than self.interval
+        seconds ago, only the most recent coordinates are sent once the
+        interval has passed."""
+        key = (con, id)
+        now = self.seconds()
+        last = self.moved.get(key)
+        if self.clock is None or last is None or now - last >= self.interval:
+            self.moved[key] = now
+            self.pending.pop(key, None)
+            move(con, id, *coordinates)
+        else:
+            self.pending[key] = coordinates
+            self.arm()
+
+    def update(self, con, obj, distance, coordinates, full=False):
+        """Tell con about obj, which has changed. The object con is logged in
+        as is at coordinates, and can hear distance units. If full evaluates
+        to True or con does not know about obj yet, a full identify command is
+        sent. Otherwise only its coordinates are."""
+        if not in_range(coordinates, obj.coordinates, distance):
+            self.drop(con, obj.id)
+        elif full or not self.knows(con, obj.id):
+            self.identify(con, obj)
+        else:
+            self.move(con, obj.id, obj.coordinates)
+
+    def look(self, con, viewer_id, ids, get, full=False):
+        """The object with the ID viewer_id, which con is logged in as, can now
+        hear the objects whose IDs are in ids. Identify those which con does
+        not know about yet, or all of them if full evaluates to True, and drop
+        those which are out of range. Objects are loaded with get(id)."""
+        known = self.known.get(con, set())
+        for id in known - ids:
+            if id != viewer_id:
+                self.drop(con, id)
+        for id in ids:
+            if full or id not in known:
+                obj = get(id)
+                if obj is not None:
+                    self.identify(con, obj)
+
+    def seconds(self):
+        """Return the current time according to self.clock."""
+        if self.clock is None:
+            return time()
+        return self.clock.seconds()
+
+    def flush(self):
+        """Send every move which has been held back."""
+        self.call = None
+        now = self.seconds()
+        pending = self.pending
+        self.pending = {}
+        for key, coordinates in pending.items():
+            con, id = key
+            if self.knows(con, id):
+                self.moved[key] = now
+                move(con, id, *coordinates)
+
+    def start(self, interval, clock=None):
+        """Start holding back moves which are less than interval seconds
+        apart. If clock is None, the reactor is used."""
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.interval = interval
+        self.clock = clock
+
+    def stop(self):
+        """Send moves straight away again."""
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+        self.call = None
+        self.clock = None
+        self.flush()
+
+    def arm(self):
+        """Make sure held back moves are sent once the interval has
+        passed."""
+        if self.clock is not None and self.call is None and self.pending:
+            self.call = self.clock.callLater(self.interval, self.flush)
+
+
+interest = InterestManager()
@@ -0,0 +1,76 @@
+"""Closed forms for starship movement.
+
+Ships move once per tick of the Space task: their speed changes by their
+acceleration, then they move by their speed. Summing frange(0, speed, step)
+describes that movement, so the functions here give the same answers as those
+sums without iterating over them."""
+
+from math import ceil, sqrt
+
+
+def steps(stop, step):
+    """Return the number of values frange(0, stop, step) would yield."""
+    if stop <= 0 or step <= 0:
+        return 0
+    return ceil(stop / step)
+
+
+def series_sum(stop, step):
+    """Return sum(frange(0, stop, step)): 0 + step + 2 * step + ... for every
+    multiple of step less than stop."""
+    n = steps(stop, step)
+    return step * n * (n - 1) / 2
+
+
+def braking_distance(speed, deceleration):
+    """Return how far a ship travelling at speed goes while slowing down by
+    deceleration every tick."""
+    return series_sum(speed, deceleration)
+
+
+def braking_time(speed, deceleration):
+    """Return the number of ticks a ship travelling at speed takes to stop
+    when slowing down by deceleration every tick."""
+    return steps(speed, deceleration)
+
+
+def intercept_steps(distance, acceleration, speed=0.0):
+    """Return the smallest number of ticks after which a ship travelling at
+    speed, and speeding up by acceleration every tick, will have covered
+    distance. Solves speed * n + acceleration * n * (n + 1) / 2 >= distance
+    for n."""
+    if distance <= 0:
+        return 0
+    if acceleration <= 0:
+        if speed <= 0:
+            raise ValueError('The target will never be reached.')
+        return ceil(distance / speed)
+    b = speed + acceleration / 2
+    n = ceil(
+        (-b + sqrt(b * b + 2 * acceleration * distance)) / acceleration
+    )
+    # Correct for rounding in the square root.
+    while n > 0 and speed * (n - 1) + acceleration * (n - 1) * n / 2 >= \
+            distance:
+        n -= 1
+    while speed * n + acceleration * n * (n + 1) / 2 < distance:
+        n += 1
+    return n
+
+
+def should_accelerate(distance, speed, deceleration):
+    """Return True if a ship which is distance away from its target and
+    travelling at speed can keep accelerating, or False if it must start
+    braking at deceleration to stop in time."""
+    return distance > braking_distance(speed, deceleration)
+
+
+def autopilot(distance, speed, max_acceleration):
+    """Return (thrust factor, accelerating) for a ship which is distance away
+    from its target, travelling at speed with an engine which can accelerate
+    by max_acceleration. The factor is suitable for
+    Starship.set_acceleration."""
+    stopping = braking_distance(speed, max_acceleration)
+    if distance > stopping:
+        return min(1.0, series_sum(distance, max_acceleration)), True
+    return min(1.0, stopping), False
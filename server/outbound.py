@@ -0,0 +1,79 @@
+"""Provides the OutboundQueue class, which holds commands waiting to be sent
+to a connection."""
+
+from collections import deque
+from attr import attrs, attrib, Factory
+
+# Commands which can be dropped when a connection is not keeping up. Anything
+# else is interactive, and is always sent.
+ambient_commands = frozenset(
+    ['random_sound', 'hidden_sound', 'object_sound', 'speak']
+)
+
+# Commands where only the most recent one about a particular object matters.
+# The first argument of these commands must be the ID of the object.
+coalesced_commands = frozenset(['identify', 'move'])
+
+
+@attrs
+class OutboundQueue:
+    """A queue of PreparedCommand instances. Once the queue holds high_water
+    commands, ambient commands are dropped rather than queued."""
+
+    high_water = attrib()
+    entries = attrib(default=Factory(deque), init=False, repr=False)
+    pending = attrib(default=Factory(dict), init=False, repr=False)
+    size = attrib(default=0, init=False)
+    dropped = attrib(default=0, init=False)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def over_high_water(self):
+        return self.size >= self.high_water
+
+    def push(self, command):
+        """Add a command to the queue. Returns True if the command was queued,
+        or False if it was dropped."""
+        name = command.name
+        if name in ambient_commands and self.over_high_water:
+            self.dropped += 1
+            return False
+        key = None
+        if command.args:
+            if name in coalesced_commands:
+                key = (name, command.args[0])
+                self.discard(key)
+                if name == 'identify':
+                    # Identify commands include the coordinates too.
+                    self.discard(('move', command.args[0]))
+            elif name == 'delete':
+                # There is no point identifying or moving an object the client
+                # is about to forget.
+                self.discard(('identify', command.args[0]))
+                self.discard(('move', command.args[0]))
+        entry = [command, key]
+        if key is not None:
+            self.pending[key] = entry
+        self.entries.append(entry)
+        self.size += 1
+        return True
+
+    def discard(self, key):
+        """Remove the pending command with the given key from the queue."""
+        entry = self.pending.pop(key, None)
+        if entry is not None:
+            entry[0] = None
+            self.size -= 1
+
+    def pop_all(self):
+        """Empty the queue, returning the commands it held in the order they
+        were queued."""
+        commands = [
+            command for command, key in self.entries if command is not None
+        ]
+        self.entries.clear()
+        self.pending.clear()
+        self.size = 0
+        return commands
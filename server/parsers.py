@@ -21,6 +21,7 @@ from .db import (
 )
 from .menus import Menu, LabelItem, Item
 from .util import pluralise
+from .connections import connections
 
 logger = logging.getLogger(__name__)
 
@@ -114,11 +115,10 @@ def login(con, username, password):
         obj.message('Welcome back, %s.' % player.username)
         obj.connected = True
         s.commit()
-        for character in Object.join(Object.player).filter(
-            Object.connected.is_(True),
-            Player.connect_notifications.is_(True)
-        ):
-            connection = character.get_connection()
+        for connection in connections.players:
+            character = connection.get_player(s)
+            if not character.player.connect_notifications:
+                continue
             msg = f'{obj.get_name(character.is_staff)} has connected.'
             character.message(msg, channel='Connection')
             interface_sound(connection, connect_sound)
@@ -18,12 +18,16 @@ from psutil import Process, boot_time, virtual_memory
 from sqlalchemy import exc
 from twisted.internet import reactor
 from emote_utils import SocialsError
-from . import db, server, protocol, menus, util, forms, sound, distance
+from . import (
+    db, server, protocol, menus, util, forms, sound, distance, kinematics,
+    space
+)
 from .db import (
     base, Object, ServerOptions, CommunicationChannel, ATM, Session as s
 )
 from .socials import factory
 from .mail import Message
+from .timers import timers
 
 logger = logging.getLogger(__name__)
 
@@ -245,6 +249,9 @@ def handle_traceback(e, program_name, player_name, location_name):
 codes = {}
 ctx = dict(
     util=util,
+    kinematics=kinematics,
+    space=space,
+    timers=timers,
     handle_traceback=handle_traceback,
     random_password=random_password,
     OK=OK,
@@ -318,6 +325,7 @@ def build_context():
     ctx.update(
         floor_types_dir=db.floor_types_dir,
         server=server.server,
+        sound_catalog=sound.catalog,
         reactor=reactor,
         run_program=run_program
     )
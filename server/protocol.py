@@ -2,7 +2,8 @@
 hard-coding."""
 
 import os.path
-from .sound import get_sound
+from random import randint
+from .sound import get_sound, get_sounds
 
 
 def message(con, text, channel=None, style=None, split_lines=True):
@@ -77,6 +78,12 @@ def identify(con, obj):
     )
 
 
+def move(con, id, x, y, z):
+    """Tell the client that the object with the given id has moved. The client
+    must already have been sent an identify command for it."""
+    return con.send('move', id, x, y, z)
+
+
 def options(con, obj):
     """Send player options to the client."""
     con.send(
@@ -154,6 +161,27 @@ def random_sound(con, sound, x, y, z, volume=1.0, max_distance=100):
     con.send('random_sound', *sound.dump(), x, y, z, volume, max_distance)
 
 
+def random_sounds(con, room, max_distance=100):
+    """Send the random sounds of a room to the client, which plays them itself
+    until it is sent another room. Each sound is sent as a list of the files
+    it could be, with its volume range. The seed is the same for everyone
+    this command is broadcast to. If room is None, the client stops playing
+    random sounds."""
+    if room is None:
+        return con.send('random_sounds', 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0, [])
+    sounds = [
+        [
+            [sound.dump() for sound in get_sounds(random_sound.name)],
+            random_sound.min_volume, random_sound.max_volume
+        ] for random_sound in room.random_sounds
+    ]
+    con.send(
+        'random_sounds', randint(0, 0x7fffffff),
+        room.min_random_sound_interval, room.max_random_sound_interval,
+        room.size_x, room.size_y, room.size_z, max_distance, sounds
+    )
+
+
 def convolver(con, filename, volume):
     """Tell con about a Convolver instance."""
     if filename is None:
@@ -4,7 +4,6 @@ import logging
 import re
 from time import time
 from datetime import datetime
-from json import dumps, loads
 from socket import getfqdn
 from urllib.parse import urljoin
 from klein import Klein
@@ -17,11 +16,16 @@ from autobahn.websocket.compress import (
 from twisted.internet import reactor, ssl
 from twisted.web.server import Site
 from .protocol import interface_sound, message
+from .wire import formats, json_format, msgpack_format, PreparedCommand
+from .outbound import OutboundQueue
+from .connections import connections
+from .interest import interest
+from .voice import is_voice, relabel, VoiceError
 from .sound import disconnect_sound
 from .parsers import login_parser
 from .program import handle_traceback
 from .db import (
-    Session, session, Object, Player, ServerOptions, LoggedCommand
+    Session, session, Object, ServerOptions, LoggedCommand
 )
 from .web.app import app
 from .web import routes  # noqa
@@ -45,8 +49,7 @@ class Server:
     def __init__(self):
         """Leave everything in one place."""
         self.started = None
-        self.logged_players = set()
-        self.connections = []
+        self.connections = connections
         self.curses = []
         with open('curses.txt', 'r') as f:
             for curse in f.readlines():
@@ -111,6 +114,11 @@ class Server:
 class ProtocolBase:
     """Base class for mindspace protocol classes."""
 
+    # When the current second of voice frames started, and how many frames
+    # have been received during it.
+    voice_second = 0.0
+    voice_frames = 0
+
     def on_connect(self):
         self.last_active = 0
         self.locked = False
@@ -124,29 +132,120 @@ class ProtocolBase:
         self.port = peer.port
         self.logger = logging.getLogger(f'{self.host}:{self.port}')
         self.logger.info('Connected.')
-        server.connections.append(self)
+        connections.add(self)
         self.parser = login_parser
+        self.setup_outbound(ServerOptions.instance())
+        self.transport.registerProducer(self, True)
+
+    def setup_outbound(self, options):
+        """Create the outbound queue for this connection, using the provided
+        ServerOptions instance for its limits."""
+        self.outbound = OutboundQueue(options.outbound_high_water)
+        self.outbound_limit = options.outbound_limit
+        self.slow_client_timeout = options.slow_client_timeout
+        self.over_high_water_since = None
+        self.batching = options.batch_commands
+        self.flush_pending = False
+        self.paused = False
+        self.closed = False
+
+    def send(self, name, *args, **kwargs):
+        """Prepare a command and send it with self.send_prepared."""
+        self.send_prepared(PreparedCommand(name, args, kwargs))
+
+    def send_prepared(self, command):
+        """Queue a PreparedCommand instance. The queue is flushed straight
+        away, or at the end of the current reactor turn if this connection is
+        batching, unless the transport has asked us to stop producing. Once
+        the connection is closed, commands are thrown away."""
+        if self.closed:
+            return
+        if not self.outbound.push(command):
+            return  # Dropped.
+        self.check_outbound()
+        if self.paused:
+            return
+        elif not self.batching:
+            self.flush()
+        elif not self.flush_pending:
+            self.flush_pending = True
+            reactor.callLater(0, self.flush)
+
+    def flush(self, force=False):
+        """Send everything in the outbound queue. Unless force evaluates to
+        True, nothing is sent while the transport is paused. Nothing is ever
+        sent unless the connection is writable, because a flush scheduled by
+        send_prepared can run after the close handshake has started."""
+        self.flush_pending = False
+        if not self.writable or (self.paused and not force):
+            return
+        self.over_high_water_since = None
+        commands = self.outbound.pop_all()
+        if commands:
+            self.write_commands(commands)
+
+    def check_outbound(self):
+        """Disconnect this client if its outbound queue is over the hard
+        limit, or has been over its high water mark for too long."""
+        if len(self.outbound) >= self.outbound_limit:
+            self.evict(f'{len(self.outbound)} commands waiting')
+        elif self.outbound.over_high_water:
+            now = time()
+            if self.over_high_water_since is None:
+                self.over_high_water_since = now
+            elif now - self.over_high_water_since > self.slow_client_timeout:
+                self.evict(
+                    'over the high water mark for %.2f seconds' % (
+                        now - self.over_high_water_since
+                    )
+                )
+
+    def evict(self, reason):
+        """Drop this connection because it cannot keep up."""
+        self.logger.warning(
+            'Disconnecting slow client (%s, %d commands dropped).', reason,
+            self.outbound.dropped
+        )
+        self.outbound.pop_all()
+        self.transport.abortConnection()
+
+    def pauseProducing(self):
+        """The transport's buffer is full. Hold commands in the outbound queue
+        until it empties."""
+        self.paused = True
+
+    def resumeProducing(self):
+        """The transport can take more data."""
+        self.paused = False
+        self.flush()
+
+    def stopProducing(self):
+        """The connection is going away."""
+        self.paused = True
+        self.closed = True
 
     def on_disconnect(self, reason):
         self.shell = None
+        self.closed = True
+        if getattr(self, 'outbound', None) is not None:
+            self.outbound.pop_all()
         if getattr(self, 'walk_task', None) is not None:
             try:
                 self.walk_task.stop()
             except AssertionError:
                 pass  # Not running.
-        if self in server.connections:
-            server.connections.remove(self)
+        connections.remove(self)
+        interest.forget(self)
         getattr(self, 'logger', logger).info(reason.getErrorMessage())
         if getattr(self, 'player_id', None) is not None:
             with session() as s:
                 player = self.get_player(s)
                 player.connected = False
                 s.commit()
-                for obj in Object.join(Object.player).filter(
-                    Object.connected.is_(True),
-                    Player.disconnect_notifications.is_(True)
-                ):
-                    connection = obj.get_connection()
+                for connection in connections.players:
+                    obj = connection.get_player(s)
+                    if not obj.player.disconnect_notifications:
+                        continue
                     name = player.get_name(obj.is_staff)
                     msg = f'{name} has disconnected.'
                     obj.message(msg, channel='Connection')
@@ -161,7 +260,9 @@ class ProtocolBase:
         message(self, f'Your connection has been {state}.')
 
     def disconnect(self, text=None):
-        """Close this websocket, sending text as reason."""
+        """Close this websocket, sending text as reason. Anything still in the
+        outbound queue is sent first."""
+        self.flush(force=True)
         self.sendClose(code=self.CLOSE_STATUS_CODE_NORMAL, reason=text)
 
     def get_player(self, s=None):
@@ -187,23 +288,24 @@ class ProtocolBase:
 
     @property
     def logged(self):
-        return self.player_id in server.logged_players
+        return self in connections.logged
 
     @logged.setter
     def logged(self, value):
         if value:
-            server.logged_players.add(self)
+            connections.logged.add(self)
         else:
-            if self in server.logged_players:
-                server.logged_players.remove(self)
+            connections.logged.discard(self)
 
 
 class MindspaceWebSocketProtocol(WebSocketServerProtocol, ProtocolBase):
     """A protocol to use with a web client."""
 
+    format = json_format
+
     def _handle_string(self, string):
         """Handle JSON string."""
-        name, args, kwargs = loads(string)
+        name, args, kwargs = self.format.decode(string)
         player = self.get_player()
         if player is None:
             player_name = self.logger.name
@@ -222,13 +324,42 @@ class MindspaceWebSocketProtocol(WebSocketServerProtocol, ProtocolBase):
             message(self, ServerOptions.instance().command_error_msg)
             handle_traceback(e, 'handle_string', player_name, location_name)
 
-    def send(self, name, *args, **kwargs):
-        """Prepare data and send it via self.sendString."""
-        data = dumps(dict(name=name, args=args, kwargs=kwargs))
-        self.sendMessage(data.encode())
+    @property
+    def writable(self):
+        """Return True if the websocket is open, so messages can be written to
+        it."""
+        return self.state == self.STATE_OPEN
+
+    def write_commands(self, commands):
+        """Write a list of PreparedCommand instances to the websocket. If this
+        connection is batching they are sent as a single frame containing a
+        list of [name, args, kwargs] lists. Nothing is written unless the
+        websocket is open."""
+        if not self.writable:
+            return
+        f = self.format
+        if self.batching:
+            data = f.join([command.get_item(f) for command in commands])
+            self.sendMessage(data, isBinary=f.binary)
+        elif self._perMessageCompress is None:
+            for command in commands:
+                self.sendPreparedMessage(command.get_prepared(self.factory, f))
+        else:
+            for command in commands:
+                self.sendMessage(command.get_frame(f), isBinary=f.binary)
+
+    def onConnect(self, request):
+        """Choose the first wire format the client supports. If the client
+        offers no subprotocols, stick with JSON."""
+        for f in formats:
+            if f.subprotocol in request.protocols:
+                self.format = f
+                return f.subprotocol
 
     def onOpen(self):
         """Web socket is now open."""
+        if self.format is msgpack_format:
+            self.send('opcodes', self.format.names)
         message(self, ServerOptions.instance().connect_msg)
 
     def connectionMade(self):
@@ -236,9 +367,46 @@ class MindspaceWebSocketProtocol(WebSocketServerProtocol, ProtocolBase):
         self.on_connect()
 
     def onMessage(self, payload, is_binary):
-        if not is_binary:
+        if is_binary and is_voice(payload):
+            self.handle_voice(payload)
+        elif is_binary == self.format.binary:
             self.handle_string(payload)
 
+    def handle_voice(self, payload):
+        """Relay a voice frame to everyone within earshot. Frames which are
+        longer than ServerOptions.max_voice_frame_length, or which arrive
+        after ServerOptions.voice_frame_rate frames in the same second, are
+        dropped."""
+        now = time()
+        self.last_active = now
+        if self.locked:
+            return
+        options = ServerOptions.instance()
+        if now - self.voice_second >= 1.0:
+            self.voice_second = now
+            self.voice_frames = 0
+        self.voice_frames += 1
+        if self.voice_frames > options.voice_frame_rate:
+            if self.voice_frames == options.voice_frame_rate + 1:
+                self.logger.warning('Voice frame rate exceeded.')
+            return
+        if len(payload) > options.max_voice_frame_length:
+            return message(self, 'Transmition too long.')
+        player = self.get_player()
+        if player is None or player.location is None:
+            return
+        try:
+            frame = relabel(payload, player.id)
+        except VoiceError as e:
+            return self.logger.warning(str(e))
+        player.transmit_voice(frame)
+
+    def send_voice(self, frame):
+        """Send a voice frame. Voice is no use late, so it is dropped rather
+        than queued while the transport is paused."""
+        if self.writable and not self.paused:
+            self.sendMessage(frame, isBinary=True)
+
     def connectionLost(self, reason):
         super().connectionLost(reason)
         self.on_disconnect(reason)
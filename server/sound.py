@@ -3,9 +3,12 @@
 import logging
 import os
 import os.path
-from time import time
+import sys
+from hashlib import sha256
+from json import dump, load
 from random import choice
 from attr import attrs, attrib, Factory
+from twisted.internet import defer, threads
 
 logger = logging.getLogger(__name__)
 
@@ -13,18 +16,180 @@ sounds_dir = 'sounds'
 
 sounds = {}
 
+manifest_filename = 'sounds.json'
+
+# Maps sound paths to [size, mtime_ns, digest] lists.
+manifest = {}
+
 
 class NoSuchSound(Exception):
     """The path provided is not a sound file or folder containing sound
     files."""
 
 
+@attrs
+class SoundCatalog:
+    """Every file and directory below root, so that sounds can be found
+    without touching the filesystem."""
+
+    root = attrib()
+    # Maps directory paths to sorted lists of the names they contain.
+    directories = attrib(default=Factory(dict), init=False, repr=False)
+    files = attrib(default=Factory(set), init=False, repr=False)
+    # Maps directory paths to their modification times when last listed.
+    mtimes = attrib(default=Factory(dict), init=False, repr=False)
+    # Maps sound paths to (mtime_ns, text) tuples, where mtime_ns is the
+    # modification time of the attribution file when it was read, or None if
+    # there was none.
+    attributions = attrib(default=Factory(dict), init=False, repr=False)
+
+    def isfile(self, path):
+        return os.path.normpath(path) in self.files
+
+    def isdir(self, path):
+        return os.path.normpath(path) in self.directories
+
+    def listdir(self, path):
+        """Return a sorted list of the names in the given directory."""
+        try:
+            return self.directories[os.path.normpath(path)]
+        except KeyError:
+            raise NoSuchSound(path)
+
+    def walk(self, path):
+        """Return a sorted list of the paths of every file below path."""
+        path = os.path.normpath(path)
+        res = []
+        for name in self.listdir(path):
+            full = os.path.join(path, name)
+            if full in self.directories:
+                res.extend(self.walk(full))
+            else:
+                res.append(full)
+        return res
+
+    def scan(self, path=None):
+        """List path (defaulting to self.root) and every directory below it.
+        Returns the number of directories listed."""
+        if path is None:
+            path = self.root
+        self.forget(path)
+        try:
+            st = os.stat(path)
+            entries = list(os.scandir(path))
+        except OSError:
+            return 0
+        self.mtimes[path] = st.st_mtime_ns
+        self.directories[path] = sorted(entry.name for entry in entries)
+        count = 1
+        for entry in entries:
+            full = os.path.join(path, entry.name)
+            if entry.is_dir():
+                count += self.scan(full)
+            else:
+                self.files.add(full)
+        return count
+
+    def forget(self, path):
+        """Forget path, and everything below it."""
+        names = self.directories.pop(path, None)
+        if names is None:
+            return
+        del self.mtimes[path]
+        for name in names:
+            full = os.path.join(path, name)
+            self.files.discard(full)
+            self.attributions.pop(full, None)
+            self.forget(full)
+
+    def refresh(self):
+        """Relist any directory which has changed since it was last listed.
+        Returns the number of directories listed."""
+        changed = []
+        for path, mtime in self.mtimes.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    changed.append(path)
+            except OSError:
+                changed.append(path)
+        count = 0
+        for path in changed:
+            # Relisting a parent may have forgotten this directory.
+            if path in self.directories:
+                count += self.rescan(path)
+        return count
+
+    def rescan(self, path):
+        """Relist a directory, leaving subdirectories which were already listed
+        alone unless they have gone."""
+        old = self.directories.get(path, [])
+        try:
+            st = os.stat(path)
+            entries = list(os.scandir(path))
+        except OSError:
+            self.forget(path)
+            return 0
+        names = set(entry.name for entry in entries)
+        for name in old:
+            full = os.path.join(path, name)
+            if name not in names:
+                self.forget(full)
+            self.files.discard(full)
+            self.attributions.pop(full, None)
+        self.mtimes[path] = st.st_mtime_ns
+        self.directories[path] = sorted(names)
+        count = 1
+        for entry in entries:
+            full = os.path.join(path, entry.name)
+            if not entry.is_dir():
+                self.files.add(full)
+            elif full not in self.directories:
+                count += self.scan(full)
+        return count
+
+    def attribution(self, path):
+        """Return the attribution for the sound at the given path. This is the
+        quoted lines of the .attribution.txt file beside it. The file is read
+        again if it has been modified since it was last read, since editing a
+        file in place does not change the directory it is in."""
+        name = os.path.splitext(path)[0] + '.attribution.txt'
+        mtime = None
+        if name in self.files:
+            try:
+                mtime = os.stat(name).st_mtime_ns
+            except OSError:
+                pass
+        entry = self.attributions.get(path)
+        if entry is None or entry[0] != mtime:
+            if mtime is None:
+                description = 'No description available.'
+            else:
+                with open(name, 'rb') as f:
+                    try:
+                        lines = [
+                            x for x in f.readlines() if x.startswith(b'"')
+                        ]
+                    except Exception as e:
+                        err = f'Unable to read file {name}: {e}."'
+                        lines = [err.encode()]
+                description = b'. '.join(lines).decode(
+                    sys.getdefaultencoding(), 'replace'
+                ).strip()
+            entry = (mtime, description)
+            self.attributions[path] = entry
+        return entry[1]
+
+
 @attrs
 class Sound:
     """A sound object."""
 
     path = attrib()
-    sum = attrib(default=Factory(time))
+    sum = attrib(default=None)
+
+    def __attrs_post_init__(self):
+        if self.sum is None:
+            self.sum = get_sum(self.path)
 
     def dump(self):
         if os.path.sep != '/':
@@ -32,6 +197,96 @@ class Sound:
         return [self.path, self.sum]
 
 
+def stat_tag(st):
+    """Return a version tag for a file with the given stat result."""
+    return '%x-%x' % (st.st_size, st.st_mtime_ns)
+
+
+def get_sum(path):
+    """Return the version tag for the sound at the given path. This is the
+    digest of its contents if the manifest holds an up to date one, or a tag
+    made from its size and modification time otherwise."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    entry = manifest.get(path)
+    if entry is not None and entry[:2] == [st.st_size, st.st_mtime_ns]:
+        return entry[2]
+    return stat_tag(st)
+
+
+def hash_file(path):
+    """Return the digest of the contents of the file at the given path."""
+    h = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:32]
+
+
+def load_manifest():
+    """Load the manifest from disk."""
+    if os.path.isfile(manifest_filename):
+        with open(manifest_filename, 'r') as f:
+            manifest.update(load(f))
+        logger.info('Loaded %d sound digests.', len(manifest))
+
+
+def save_manifest():
+    """Write the manifest to disk."""
+    with open(manifest_filename, 'w') as f:
+        dump(manifest, f, indent=1, sort_keys=True)
+
+
+def find_stale():
+    """Return a list of (path, size, mtime_ns) tuples for every sound whose
+    entry in the manifest is missing or out of date."""
+    stale = []
+    for dirpath, dirnames, filenames in os.walk(sounds_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            st = os.stat(path)
+            entry = manifest.get(path)
+            if entry is None or entry[:2] != [st.st_size, st.st_mtime_ns]:
+                stale.append((path, st.st_size, st.st_mtime_ns))
+    return stale
+
+
+def set_digest(digest, path, size, mtime_ns):
+    """Store a digest in the manifest, and update any Sound instance already
+    registered for path. Called on the reactor thread."""
+    manifest[path] = [size, mtime_ns, digest]
+    if path in sounds:
+        sounds[path].sum = digest
+
+
+@defer.inlineCallbacks
+def update_manifest():
+    """Hash every sound whose manifest entry is missing or out of date using
+    the reactor's thread pool, then save the manifest. Until then, sounds are
+    tagged by size and modification time."""
+    stale = yield threads.deferToThread(find_stale)
+    if not stale:
+        return
+    logger.info('Hashing %d sounds.', len(stale))
+    deferreds = []
+    for path, size, mtime_ns in stale:
+        d = threads.deferToThread(hash_file, path)
+        d.addCallback(set_digest, path, size, mtime_ns)
+        deferreds.append(d)
+    results = yield defer.DeferredList(deferreds, consumeErrors=True)
+    for success, result in results:
+        if not success:
+            logger.warning(result.getErrorMessage())
+    # Forget sounds which no longer exist.
+    for path in list(manifest):
+        if not os.path.isfile(path):
+            del manifest[path]
+    save_manifest()
+    logger.info('Sound manifest saved with %d entries.', len(manifest))
+
+
 def get_sound(path):
     """Gets a Sound instance. The path argument can either be a file path, or a
     directory path. In both instances, a path relative to the sounds directory
@@ -39,9 +294,11 @@ def get_sound(path):
     directory is chosen."""
     if not path.startswith('%s%s' % (sounds_dir, os.path.sep)):
         path = os.path.join(sounds_dir, path)
-    if os.path.isdir(path):
-        return get_sound(os.path.join(path, choice(os.listdir(path))))
-    elif os.path.isfile(path):
+    path = os.path.normpath(path)
+    members = catalog.directories.get(path)
+    if members:
+        return get_sound(os.path.join(path, choice(members)))
+    elif path in catalog.files:
         if path not in sounds:
             sounds[path] = Sound(path)
             logger.info('Registering %r.', sounds[path])
@@ -50,6 +307,34 @@ def get_sound(path):
         raise NoSuchSound(path)
 
 
+def get_sounds(path):
+    """Return a list of every Sound instance get_sound could return for
+    path."""
+    if not path.startswith('%s%s' % (sounds_dir, os.path.sep)):
+        path = os.path.join(sounds_dir, path)
+    path = os.path.normpath(path)
+    members = catalog.directories.get(path)
+    if members:
+        res = []
+        for member in sorted(members):
+            res.extend(get_sounds(os.path.join(path, member)))
+        return res
+    return [get_sound(path)]
+
+
+def refresh_sounds():
+    """Pick up any changes to the sounds directory. Returns the number of
+    directories which were listed."""
+    count = catalog.refresh()
+    if count:
+        logger.info('Relisted %d sound directories.', count)
+    return count
+
+
+catalog = SoundCatalog(sounds_dir)
+catalog.scan()
+load_manifest()
+
 nonempty_room = get_sound(
     os.path.join('notifications', 'look_objects.wav')
 )
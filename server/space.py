@@ -0,0 +1,310 @@
+"""Move every zone in space at once.
+
+step loads the position, speed, acceleration and direction of every moving
+zone into NumPy arrays, advances them all together, then writes back the rows
+which changed with a single executemany. steer runs the autopilot for ships
+with targets, and orbit moves zones around the zones they orbit. main.py
+calls tick every ServerOptions.space_interval seconds, which does all three."""
+
+import logging
+import numpy as np
+from sqlalchemy import and_, bindparam, or_, select
+from sqlalchemy.orm.util import identity_key
+from .db import (
+    Direction, Orbit, ServerOptions, Session, Starship, Zone, journal, session
+)
+from .distance import light_speed
+from .util import direction_between, distance_between
+
+logger = logging.getLogger(__name__)
+
+
+def load(s):
+    """Return an array of [id, x, y, z, speed, acceleration, accelerating,
+    direction x, direction y, direction z] rows for every zone with a speed or
+    an acceleration. Missing values are NaN."""
+    zones = Zone.__table__
+    directions = Direction.__table__
+    rows = s.execute(
+        select(
+            [
+                zones.c.id, zones.c.x, zones.c.y, zones.c.z, zones.c.speed,
+                zones.c.acceleration, zones.c.accelerating, directions.c.x,
+                directions.c.y, directions.c.z
+            ]
+        ).select_from(
+            zones.outerjoin(
+                directions, zones.c.direction_id == directions.c.id
+            )
+        ).where(
+            or_(zones.c.speed.isnot(None), zones.c.acceleration.isnot(None))
+        )
+    ).fetchall()
+    return np.array(rows, dtype=float).reshape(len(rows), 10)
+
+
+def advance(data):
+    """Advance the zones in data, as returned by load, by one tick. Returns
+    (positions, speeds, stopped), where stopped is a boolean array of the
+    zones which were decelerating and have come to a halt."""
+    positions = data[:, 1:4]
+    speeds = np.nan_to_num(data[:, 4])
+    accelerations = np.nan_to_num(data[:, 5])
+    accelerating = data[:, 6] == 1
+    directions = data[:, 7:10]
+    moving = (accelerations != 0) & ~np.isnan(directions[:, 0])
+    speeds = np.where(
+        moving, np.where(
+            accelerating, speeds + accelerations, speeds - accelerations
+        ), speeds
+    )
+    stopped = moving & (speeds < 0)
+    speeds[stopped] = 0.0
+    speeds = np.minimum(speeds, light_speed)
+    positions = positions + np.where(
+        moving, speeds, 0.0
+    )[:, None] * np.nan_to_num(directions)
+    return positions, speeds, stopped
+
+
+def step(s=None):
+    """Move every zone in space by one tick, and return the number of zones
+    whose rows changed. Zones which stop decelerating have their engines
+    turned off, and their occupants are told."""
+    if s is None:
+        s = Session()
+    s.flush()
+    data = load(s)
+    if not len(data):
+        return 0
+    positions, speeds, stopped = advance(data)
+    changed = np.isnan(data[:, 4]) | (speeds != data[:, 4]) | np.any(
+        positions != data[:, 1:4], axis=1
+    )
+    if not changed.any():
+        return 0
+    ids = data[:, 0].astype(int)
+    rows = [
+        dict(id=int(id), x=x, y=y, z=z, speed=speed) for id, (x, y, z), speed
+        in zip(
+            ids[changed], positions[changed].tolist(),
+            speeds[changed].tolist()
+        )
+    ]
+    update(s, rows)
+    stopped_ids = [int(id) for id in ids[stopped]]
+    if stopped_ids:
+        update(
+            s, [
+                dict(
+                    id=id, acceleration=0.0, accelerating=True,
+                    ambience_rate=0.0
+                ) for id in stopped_ids
+            ]
+        )
+    expire(s, Zone, ids[changed])
+    for id in stopped_ids:
+        Zone.get(id).update_occupants()
+    return len(rows)
+
+
+def update(s, rows, table=None, record=True):
+    """Update table (zones by default) with the given rows, which must all
+    have the same keys, including id. If record evaluates to True, the rows
+    are also written to the journal."""
+    if table is None:
+        table = Zone.__table__
+    names = [name for name in rows[0] if name != 'id']
+    s.execute(
+        table.update().where(table.c.id == bindparam('_id')).values(
+            **{name: bindparam('_' + name) for name in names}
+        ), [
+            {'_' + name: value for name, value in row.items()}
+            for row in rows
+        ]
+    )
+    if record:
+        journal.record_updates(s, table.name, rows)
+
+
+def expire(s, cls, ids):
+    """Expire any instances of cls with the given ids which s has loaded, so
+    they see the values written by update."""
+    for id in ids:
+        obj = s.identity_map.get(identity_key(cls, int(id)))
+        if obj is not None:
+            s.expire(obj)
+
+
+def load_orbits(s):
+    """Return an array of [id, zone id, orbiting id, distance, offset, angle,
+    height, orbiting x, orbiting y, orbiting z, x, y, z] rows for every orbit,
+    where the last three columns are the coordinates of the orbiting zone
+    itself. Missing values are NaN."""
+    orbits = Orbit.__table__
+    zones = Zone.__table__
+    parents = zones.alias()
+    rows = s.execute(
+        select(
+            [
+                orbits.c.id, orbits.c.zone_id, orbits.c.orbiting_id,
+                orbits.c.distance, orbits.c.offset, orbits.c.angle,
+                orbits.c.height, parents.c.x, parents.c.y, parents.c.z,
+                zones.c.x, zones.c.y, zones.c.z
+            ]
+        ).select_from(
+            orbits.join(
+                parents, orbits.c.orbiting_id == parents.c.id
+            ).join(zones, orbits.c.zone_id == zones.c.id)
+        )
+    ).fetchall()
+    return np.array(rows, dtype=float).reshape(len(rows), 13)
+
+
+def orbit_levels(zone_ids, orbiting_ids):
+    """Return an array of how deep in the hierarchy of orbits each zone is.
+    Zones orbiting something which is not orbiting are at level 0, their moons
+    are at level 1, and so on. Zones which end up orbiting themselves are at
+    level -1, as are any zones orbiting them."""
+    parents = dict(zip(zone_ids, orbiting_ids))
+    levels = {}
+    for zone_id in parents:
+        chain = []
+        while zone_id in parents and zone_id not in levels and \
+                zone_id not in chain:
+            chain.append(zone_id)
+            zone_id = parents[zone_id]
+        cycle = zone_id in chain or levels.get(zone_id) == -1
+        level = levels.get(zone_id, -1)
+        for id in reversed(chain):
+            if cycle:
+                levels[id] = -1
+            else:
+                level += 1
+                levels[id] = level
+    return np.array([levels[id] for id in zone_ids], dtype=int)
+
+
+def propagate(data, warp=1.0):
+    """Advance the orbits in data, as returned by load_orbits, by warp ticks.
+    Returns (angles, heights, positions). Missing angles and heights are taken
+    from where each zone is relative to the zone it orbits, so nothing jumps
+    on its first tick. The positions of zones caught in a cycle of orbits are
+    NaN."""
+    zone_ids = data[:, 1].astype(int)
+    orbiting_ids = data[:, 2].astype(int)
+    relative = data[:, 10:13] - data[:, 7:10]
+    angles = np.where(
+        np.isnan(data[:, 5]), np.arctan2(relative[:, 1], relative[:, 0]),
+        data[:, 5]
+    )
+    angles = np.mod(angles + data[:, 4] * warp, 2 * np.pi)
+    heights = np.where(np.isnan(data[:, 6]), relative[:, 2], data[:, 6])
+    offsets = np.stack(
+        [
+            data[:, 3] * np.cos(angles), data[:, 3] * np.sin(angles),
+            heights
+        ], axis=1
+    )
+    centres = data[:, 7:10].copy()
+    positions = np.full(centres.shape, np.nan)
+    rows = {id: row for row, id in enumerate(zone_ids)}
+    parents = np.array([rows.get(id, -1) for id in orbiting_ids], dtype=int)
+    levels = orbit_levels(zone_ids.tolist(), orbiting_ids.tolist())
+    for level in range(levels.max() + 1):
+        current = levels == level
+        if level:
+            centres[current] = positions[parents[current]]
+        positions[current] = centres[current] + offsets[current]
+    return angles, heights, positions
+
+
+def orbit(s=None, warp=None):
+    """Move every orbiting zone around the zone it orbits, and return the
+    number of zones moved. Each orbit advances by its offset multiplied by
+    warp, which defaults to ServerOptions.orbit_warp.
+
+    Nothing is journalled, because orbits move every tick. Positions follow
+    from the angles, so after a crash orbits carry on from the last
+    snapshot."""
+    if s is None:
+        s = Session()
+    if warp is None:
+        warp = ServerOptions.instance().orbit_warp
+    s.flush()
+    data = load_orbits(s)
+    if not len(data):
+        return 0
+    angles, heights, positions = propagate(data, warp=warp)
+    moving = ~np.isnan(positions[:, 0])
+    if not moving.any():
+        return 0
+    ids = data[moving, 0].astype(int)
+    zone_ids = data[moving, 1].astype(int)
+    update(
+        s, [
+            dict(id=int(id), x=x, y=y, z=z) for id, (x, y, z) in zip(
+                zone_ids, positions[moving].tolist()
+            )
+        ], record=False
+    )
+    update(
+        s, [
+            dict(id=int(id), angle=angle, height=height)
+            for id, angle, height in zip(
+                ids, angles[moving].tolist(), heights[moving].tolist()
+            )
+        ], table=Orbit.__table__, record=False
+    )
+    expire(s, Zone, zone_ids)
+    expire(s, Orbit, ids)
+    return len(ids)
+
+
+def steer(s=None):
+    """Point every moving starship with a target at it, and accelerate or
+    brake so it arrives without overshooting."""
+    if s is None:
+        s = Session()
+    for ship in s.query(Starship).join(
+        Zone, Zone.starship_id == Starship.id
+    ).filter(
+        or_(Zone.speed.isnot(None), Zone.acceleration.isnot(None)),
+        or_(
+            Starship.target_object_id.isnot(None),
+            and_(
+                Starship.target_x.isnot(None), Starship.target_y.isnot(None),
+                Starship.target_z.isnot(None)
+            )
+        )
+    ):
+        obj = ship.zone
+        t = ship.target
+        if t is None:
+            continue
+        d = direction_between(obj.coordinates, t.coordinates)
+        if d is None:
+            # We are probably here.
+            if not obj.speed:  # We arrived without overshooting.
+                assert obj.coordinates == t.coordinates
+                ship.target_object = None
+                ship.target_coordinates = None
+        else:
+            obj.direction = d
+            factor, accelerating = ship.get_autopilot_thrust(
+                distance_between(obj.coordinates, t.coordinates)
+            )
+            ship.set_acceleration(factor, accelerating=accelerating)
+
+
+def tick():
+    """Move everything in space by one tick, in a session of its own. Errors
+    are logged, so the next tick still happens."""
+    try:
+        with session() as s:
+            step(s)
+            orbit(s)
+            steer(s)
+    except Exception as e:
+        logger.warning('Space tick failed.')
+        logger.exception(e)
@@ -0,0 +1,128 @@
+"""Provides the SpatialIndex class, which keeps track of where every object in
+every room is, so that range queries do not have to scan the objects table."""
+
+from math import floor
+from attr import attrs, attrib, Factory
+
+# The size of each grid cell along every axis.
+default_cell_size = 10.0
+
+
+@attrs
+class SpatialIndex:
+    """The positions of objects in rooms, stored in a uniform grid per room.
+
+    Objects are indexed by ID. Use near to find the objects within a given
+    distance of a point along each axis, which is the same cube the
+    between() filters used to describe."""
+
+    cell_size = attrib(default=default_cell_size)
+    # Maps room IDs to dictionaries of cells to sets of object IDs.
+    rooms = attrib(default=Factory(dict), init=False, repr=False)
+    # Maps object IDs to (room_id, cell, x, y, z) tuples.
+    positions = attrib(default=Factory(dict), init=False, repr=False)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, id):
+        return id in self.positions
+
+    def cell(self, x, y, z):
+        """Return the cell which contains the given coordinates."""
+        size = self.cell_size
+        return (floor(x / size), floor(y / size), floor(z / size))
+
+    def clear(self):
+        """Forget every object."""
+        self.rooms.clear()
+        self.positions.clear()
+
+    def add(self, id, room_id, x, y, z):
+        """Record that the object with the given ID is in the given room at the
+        given coordinates. If room_id is None the object is removed."""
+        if room_id is None or None in (x, y, z):
+            return self.remove(id)
+        cell = self.cell(x, y, z)
+        old = self.positions.get(id)
+        self.positions[id] = (room_id, cell, x, y, z)
+        if old is not None:
+            if old[:2] == (room_id, cell):
+                return
+            self.discard(id, *old[:2])
+        self.rooms.setdefault(room_id, {}).setdefault(cell, set()).add(id)
+
+    def remove(self, id):
+        """Forget the object with the given ID."""
+        old = self.positions.pop(id, None)
+        if old is not None:
+            self.discard(id, *old[:2])
+
+    def discard(self, id, room_id, cell):
+        """Remove id from a cell, tidying up empty cells and rooms."""
+        cells = self.rooms[room_id]
+        ids = cells[cell]
+        ids.discard(id)
+        if not ids:
+            del cells[cell]
+            if not cells:
+                del self.rooms[room_id]
+
+    def get(self, id):
+        """Return (room_id, x, y, z) for the object with the given ID, or
+        None."""
+        position = self.positions.get(id)
+        if position is not None:
+            room_id, cell, x, y, z = position
+            return (room_id, x, y, z)
+
+    def in_room(self, room_id):
+        """Return the set of object IDs in the given room."""
+        res = set()
+        for ids in self.rooms.get(room_id, {}).values():
+            res.update(ids)
+        return res
+
+    def near(self, room_id, coordinates, distance):
+        """Return the set of IDs of objects in the given room whose coordinates
+        are no more than distance away from coordinates along any axis."""
+        cells = self.rooms.get(room_id)
+        if not cells:
+            return set()
+        x, y, z = coordinates
+        low = self.cell(x - distance, y - distance, z - distance)
+        high = self.cell(x + distance, y + distance, z + distance)
+        number = 1
+        for start, end in zip(low, high):
+            number *= end - start + 1
+        if number > len(cells):
+            # There are fewer occupied cells than cells in range.
+            candidates = [
+                ids for cell, ids in cells.items() if all(
+                    start <= value <= end for start, value, end in zip(
+                        low, cell, high
+                    )
+                )
+            ]
+        else:
+            candidates = []
+            for cx in range(low[0], high[0] + 1):
+                for cy in range(low[1], high[1] + 1):
+                    for cz in range(low[2], high[2] + 1):
+                        ids = cells.get((cx, cy, cz))
+                        if ids:
+                            candidates.append(ids)
+        res = set()
+        positions = self.positions
+        for ids in candidates:
+            for id in ids:
+                room_id, cell, ox, oy, oz = positions[id]
+                if (
+                    abs(ox - x) <= distance and abs(oy - y) <= distance and
+                    abs(oz - z) <= distance
+                ):
+                    res.add(id)
+        return res
+
+
+spatial_index = SpatialIndex()
@@ -0,0 +1,117 @@
+"""Provides the TileIndex class, which keeps the floor tiles of rooms in
+memory, so that finding the tile under a point does not have to query the
+room_floor_tiles table."""
+
+from bisect import bisect_left
+from attr import attrs, attrib, Factory
+
+
+@attrs
+class Tile:
+    """The parts of a RoomFloorTile which are needed to find it and play its
+    footsteps."""
+
+    id = attrib()
+    name = attrib()
+    floor_type = attrib()
+    start_x = attrib()
+    start_y = attrib()
+    start_z = attrib()
+    end_x = attrib()
+    end_y = attrib()
+    end_z = attrib()
+
+    def covers(self, x, y, z):
+        """Return True if this tile covers the given coordinates."""
+        return self.start_x <= x <= self.end_x and \
+            self.start_y <= y <= self.end_y and \
+            self.start_z <= z <= self.end_z
+
+
+@attrs
+class RoomTiles:
+    """The tiles of a single room, split into slabs along the x axis.
+
+    Every start_x and end_x is a boundary. Slab 2 * i + 1 is the boundary at
+    index i itself, and slab 2 * i is the space between boundaries i - 1 and
+    i. Each slab lists the tiles which overlap it, newest first, because
+    newer tiles are laid on top of older ones."""
+
+    boundaries = attrib(default=Factory(list))
+    slabs = attrib(default=Factory(lambda: [[]]))
+
+    @classmethod
+    def from_tiles(cls, tiles):
+        """Return an instance containing tiles."""
+        tiles = sorted(tiles, key=lambda tile: tile.id, reverse=True)
+        boundaries = sorted(
+            {tile.start_x for tile in tiles} | {tile.end_x for tile in tiles}
+        )
+        slabs = [[] for _ in range(len(boundaries) * 2 + 1)]
+        for tile in tiles:
+            first = bisect_left(boundaries, tile.start_x) * 2 + 1
+            last = bisect_left(boundaries, tile.end_x) * 2 + 1
+            for slab in range(first, last + 1):
+                slabs[slab].append(tile)
+        return cls(boundaries=boundaries, slabs=slabs)
+
+    def __len__(self):
+        return len({tile.id for slab in self.slabs for tile in slab})
+
+    def slab(self, x):
+        """Return the tiles which might cover x."""
+        i = bisect_left(self.boundaries, x)
+        if i < len(self.boundaries) and self.boundaries[i] == x:
+            return self.slabs[i * 2 + 1]
+        return self.slabs[i * 2]
+
+    def tile_at(self, x, y, z):
+        """Return the Tile which covers the given coordinates, or None."""
+        for tile in self.slab(x):
+            if tile.start_y <= y <= tile.end_y and \
+               tile.start_z <= z <= tile.end_z:
+                return tile
+
+    def crossing(self, start, end):
+        """Return (old tile, new tile) if moving from start to end steps from
+        one kind of floor onto another, or None if the floor underfoot stays
+        the same. Tiles with the same name count as the same floor."""
+        old = self.tile_at(*start)
+        new = self.tile_at(*end)
+        if getattr(old, 'name', None) == getattr(new, 'name', None):
+            return None
+        return (old, new)
+
+
+@attrs
+class TileIndex:
+    """The tiles of every room which has been asked about. Rooms are loaded
+    the first time they are needed, and forgotten when their tiles change."""
+
+    rooms = attrib(default=Factory(dict), init=False, repr=False)
+
+    def __contains__(self, room_id):
+        return room_id in self.rooms
+
+    def get(self, room_id):
+        """Return the RoomTiles for the given room, or None if it has not
+        been loaded."""
+        return self.rooms.get(room_id)
+
+    def add(self, room_id, tiles):
+        """Store tiles, an iterable of Tile instances, for the given room, and
+        return the resulting RoomTiles."""
+        room = RoomTiles.from_tiles(tiles)
+        self.rooms[room_id] = room
+        return room
+
+    def invalidate(self, room_id):
+        """Forget the tiles of the given room."""
+        self.rooms.pop(room_id, None)
+
+    def clear(self):
+        """Forget every room."""
+        self.rooms.clear()
+
+
+tile_index = TileIndex()
@@ -0,0 +1,291 @@
+"""Provides the TimerService class, which fires callbacks when rows are due.
+
+Several classes keep the time they next need attention in a column, such as
+Phone.next_ring. Rather than scanning those columns every second, the timer
+service keeps a heap of (due, key) entries, where key is a tuple of (class
+name, id, kind). The columns are still saved with every snapshot and written
+to the journal, so they remain the record of what is due, and the heap is
+built from them when the database is loaded.
+
+While the reactor is running, a single delayed call wakes the service when the
+earliest entry is due, so a world where nothing is due does no work at all.
+See server/db/timers.py for the timers the server tracks."""
+
+import logging
+from heapq import heappush, heappop
+from time import time
+from attr import attrs, attrib, Factory
+
+logger = logging.getLogger(__name__)
+
+
+@attrs
+class Timer:
+    """A column which holds the time a row of cls is next due. When it is,
+    handler is called with the row and the current time, and should set the
+    column to the next time the row is due, or None.
+
+    If when_none is not None, rows whose column is None are due at that
+    time.
+
+    If batch is True, rows which are due together are loaded with a single
+    query, using the loader options in options, and handler is called with a
+    list of them instead."""
+
+    cls = attrib()
+    column = attrib()
+    kind = attrib()
+    handler = attrib()
+    when_none = attrib(default=None)
+    batch = attrib(default=False)
+    options = attrib(default=Factory(list))
+
+    def get_due(self, obj):
+        """Return the time obj is due, or None."""
+        value = getattr(obj, self.column)
+        if value is None:
+            return self.when_none
+        return value
+
+
+@attrs
+class TimerService:
+    """A heap of timers keyed by (class name, id, kind).
+
+    Entries which are discarded or pushed again are left in the heap, and
+    skipped when they reach the top."""
+
+    # Maps (class name, kind) to Timer instances.
+    timers = attrib(default=Factory(dict), init=False, repr=False)
+    # A context manager which yields a database session to fire timers in.
+    session = attrib(default=None, repr=False)
+    # The most rows of a batch timer to load with a single query.
+    batch_size = attrib(default=500)
+    # How long to wait before firing a timer whose handler failed again. The
+    # wait doubles with every failure in a row, up to max_backoff.
+    backoff = attrib(default=5.0)
+    max_backoff = attrib(default=300.0)
+    heap = attrib(default=Factory(list), init=False, repr=False)
+    # Maps keys to the time they are due.
+    entries = attrib(default=Factory(dict), init=False, repr=False)
+    # Maps keys to the number of times in a row their handler has failed.
+    failures = attrib(default=Factory(dict), init=False, repr=False)
+    clock = attrib(default=None, init=False, repr=False)
+    call = attrib(default=None, init=False, repr=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def track(self, cls, column, kind, handler, **kwargs):
+        """Call handler when the time in column of a row of cls is due, and
+        return the resulting Timer. Extra keyword arguments are passed to
+        Timer."""
+        timer = Timer(cls, column, kind, handler, **kwargs)
+        self.timers[(cls.__name__, kind)] = timer
+        return timer
+
+    def get_timer(self, obj, kind):
+        """Return the Timer of the given kind for obj."""
+        try:
+            return self.timers[(type(obj).__name__, kind)]
+        except KeyError:
+            raise ValueError(f'{obj!r} has no {kind} timer.')
+
+    def key(self, obj, kind):
+        """Return the key for the timer of the given kind for obj."""
+        return (type(obj).__name__, obj.id, kind)
+
+    def push(self, key, when):
+        """Fire key at when, or never if when is None."""
+        if when is None:
+            return self.discard(key)
+        self.entries[key] = when
+        heappush(self.heap, (when, key))
+        self.arm()
+
+    def discard(self, key):
+        """Stop key from firing."""
+        self.entries.pop(key, None)
+        self.failures.pop(key, None)
+
+    def clear(self):
+        """Forget every timer."""
+        self.heap.clear()
+        self.entries.clear()
+        self.failures.clear()
+
+    def get(self, key):
+        """Return when key is due, or None."""
+        return self.entries.get(key)
+
+    def due(self, obj, kind):
+        """Return when the timer of the given kind for obj is due, or None."""
+        return self.get(self.key(obj, kind))
+
+    def schedule(self, obj, kind, when):
+        """Fire the timer of the given kind for obj at when. The time is
+        stored in the timer's column, so it is saved with the object."""
+        timer = self.get_timer(obj, kind)
+        setattr(obj, timer.column, when)
+        self.push(self.key(obj, kind), timer.get_due(obj))
+
+    def cancel(self, obj, kind):
+        """Stop the timer of the given kind for obj from firing."""
+        timer = self.get_timer(obj, kind)
+        setattr(obj, timer.column, None)
+        self.discard(self.key(obj, kind))
+
+    def next_due(self):
+        """Return when the earliest timer is due, or None."""
+        heap = self.heap
+        while heap and self.entries.get(heap[0][1]) != heap[0][0]:
+            heappop(heap)
+        if heap:
+            return heap[0][0]
+
+    def pop_due(self, now):
+        """Remove and return the keys which are due at now, earliest first."""
+        keys = []
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            when, key = heappop(heap)
+            if self.entries.get(key) == when:
+                del self.entries[key]
+                keys.append(key)
+        return keys
+
+    def ready(self, timer, obj, now):
+        """Return True if obj is due at now. Otherwise push it again for when
+        it is due."""
+        if getattr(obj, 'paused', False):
+            return False
+        when = timer.get_due(obj)
+        if when is None or when > now:
+            self.push(self.key(obj, timer.kind), when)
+            return False
+        return True
+
+    def reschedule(self, timer, obj, now):
+        """Push obj again for the next time it is due, after its handler has
+        run."""
+        when = timer.get_due(obj)
+        if when is not None and when > now:
+            self.push(self.key(obj, timer.kind), when)
+
+    def fire(self, s, key, now):
+        """Call the handler for key, then push it again for the next time its
+        row is due."""
+        name, id, kind = key
+        timer = self.timers[(name, kind)]
+        obj = s.query(timer.cls).get(id)
+        if obj is not None and self.ready(timer, obj, now):
+            timer.handler(obj, now)
+            self.reschedule(timer, obj, now)
+        self.failures.pop(key, None)
+
+    def fire_batch(self, s, timer, ids, now):
+        """Load the rows of a batch timer with the given ids, and call its
+        handler once with every row which is due."""
+        cls = timer.cls
+        objects = []
+        for start in range(0, len(ids), self.batch_size):
+            objects.extend(
+                obj for obj in s.query(cls).options(*timer.options).filter(
+                    cls.id.in_(ids[start:start + self.batch_size])
+                ) if self.ready(timer, obj, now)
+            )
+        if objects:
+            timer.handler(objects, now)
+            for obj in objects:
+                self.reschedule(timer, obj, now)
+        for id in ids:
+            self.failures.pop((timer.cls.__name__, id, timer.kind), None)
+
+    def retry(self, key, now):
+        """The handler for key failed at now, so push it again once its
+        back-off has passed. Returns when it will be fired."""
+        failures = self.failures.get(key, 0)
+        self.failures[key] = failures + 1
+        when = now + min(self.backoff * 2 ** failures, self.max_backoff)
+        self.push(key, when)
+        return when
+
+    def run(self, now=None):
+        """Fire every timer which is due, and return how many there were.
+
+        Each timer or batch fires inside a savepoint, so a failure only rolls
+        back its own changes, and is retried with retry."""
+        self.call = None
+        if now is None:
+            now = time()
+        keys = self.pop_due(now)
+        if keys:
+            batches = {}
+            with self.session() as s:
+                for key in keys:
+                    name, id, kind = key
+                    timer = self.timers[(name, kind)]
+                    if timer.batch:
+                        batches.setdefault((name, kind), []).append(id)
+                        continue
+                    try:
+                        with s.begin_nested():
+                            self.fire(s, key, now)
+                    except Exception as e:
+                        logger.warning(
+                            'Timer %r failed, retrying at %.2f.', key,
+                            self.retry(key, now)
+                        )
+                        logger.exception(e)
+                for (name, kind), ids in batches.items():
+                    try:
+                        with s.begin_nested():
+                            self.fire_batch(
+                                s, self.timers[(name, kind)], ids, now
+                            )
+                    except Exception as e:
+                        logger.warning(
+                            'Batch of %d %s timers for %s failed.', len(ids),
+                            kind, name
+                        )
+                        logger.exception(e)
+                        for id in ids:
+                            self.retry((name, id, kind), now)
+        self.arm()
+        return len(keys)
+
+    def start(self, clock=None):
+        """Start firing timers as they become due. If clock is None, the
+        reactor is used."""
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.clock = clock
+        self.arm()
+
+    def stop(self):
+        """Stop firing timers."""
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+        self.call = None
+        self.clock = None
+
+    def arm(self):
+        """Make sure the service wakes up when the earliest timer is due."""
+        if self.clock is None:
+            return
+        when = self.next_due()
+        call = self.call
+        if call is not None and call.active():
+            if when is not None and call.getTime() <= self.clock.seconds() + \
+                    max(0.0, when - time()):
+                return
+            call.cancel()
+            self.call = None
+        if when is not None:
+            self.call = self.clock.callLater(max(0.0, when - time()), self.run)
+
+
+timers = TimerService()
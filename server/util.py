@@ -5,8 +5,7 @@ from time import time
 from datetime import datetime
 from math import sin, cos, radians, pi, degrees, atan2
 from emote_utils import NoMatchError
-from attr import attrs, attrib
-from twisted.internet import reactor
+from attr import attrs, attrib, Factory
 from twisted.internet.task import LoopingCall
 from .distance import pc, kpc, mpc, gpc, tpc, au, ly, km, light_speed
 from .sound import get_sound, empty_room, nonempty_room
@@ -14,6 +13,7 @@ from . import db
 from .protocol import interface_sound, message
 from .socials import factory
 
+logger = logging.getLogger(__name__)
 nothing = object()
 
 
@@ -142,18 +142,24 @@ def show_objects(player, f=None):
     interface_sound(con, sound)
 
 
-def walk(player, x=0, y=0, z=0, observe_speed=True, sound=nothing):
+def walk(
+    player, x=0, y=0, z=0, observe_speed=True, sound=nothing, followers=None
+):
     """Walk player by the amount specified. If observe does not evaluate to
     True then the maximum speed of the player is ignored (used by WalkTask). If
     sound is nothing then the default walk sound for the current room will be
-    used. If it is None then the walk will be silent."""
+    used. If it is None then the walk will be silent. If followers is None,
+    player.followers is loaded. Callers which already know player has no
+    followers can pass an empty list instead."""
     if player.resting_state is not db.RestingStates.standing:
         player.message('You must stand up first.')
         return False  # Stop any walk task.
     loc = player.location
     s = db.Session
     players = [player]
-    players.extend(player.followers)
+    if followers is None:
+        followers = player.followers
+    players.extend(followers)
     now = time()
     if not observe_speed or now - player.last_walked >= player.speed:
         px, py, pz = player.coordinates
@@ -163,31 +169,27 @@ def walk(player, x=0, y=0, z=0, observe_speed=True, sound=nothing):
         if loc.coordinates_ok((px, py, pz)):
             player.clear_following()
             player.last_walked = now
-            direction = db.Direction.query(x=x, y=y, z=z).first()
-            old_tile = loc.tile_at(*player.coordinates)
-            new_tile = loc.tile_at(px, py, pz)
-            if getattr(
-                old_tile, 'name', None
-            ) == getattr(new_tile, 'name', None):
+            direction = db.direction_table.find(x, y, z)
+            crossing = loc.get_tiles().crossing(
+                player.coordinates, (px, py, pz)
+            )
+            if crossing is None:
                 func = None
-            elif new_tile is None:
-                if old_tile is None:
-                    func = None
-                else:
-                    func = old_tile.step_off
             else:
-                func = new_tile.step_on
-            default_walk_sound = loc.get_walk_sound(
-                (px, py, pz), covering=new_tile
-            )
+                old_tile, new_tile = crossing
+                if new_tile is None:
+                    func = db.RoomFloorTile.get(old_tile.id).step_off
+                else:
+                    func = db.RoomFloorTile.get(new_tile.id).step_on
+            default_walk_sound = loc.get_walk_sound((px, py, pz))
             for obj in players:
                 if obj.location is not loc:
                     continue
-                obj.recent_direction = direction
+                obj.recent_direction_id = getattr(direction, 'id', None)
                 obj.steps += 1
                 obj.recent_exit_id = None
                 obj.coordinates = (px, py, pz)
-                obj.update_neighbours()
+                obj.update_neighbours(full=False)
                 if func is not None:
                     func(obj, private=(obj is not player))
                 if obj is player:
@@ -207,72 +209,152 @@ def walk(player, x=0, y=0, z=0, observe_speed=True, sound=nothing):
 
 
 @attrs
-class WalkTask(LoopingCall):
-    """A task to automatically walk."""
+class WalkTask:
+    """Walk an object towards some coordinates. The steps are taken by
+    walkers, so every object walking at the same speed moves on the same
+    tick."""
 
     id = attrib()
     x = attrib()
     y = attrib()
     z = attrib()
 
-    def __attrs_post_init__(self):
-        super().__init__(self.walk)
-        self.logger = logging.getLogger(f'{db.Object.get(self.id)} walk task')
-
-    def log_error(self, failure):
-        """Log a failure instance."""
-        self.logger.exception(failure.getTraceback())
+    @property
+    def running(self):
+        return walkers.get(self.id) is self
 
     def start(self):
-        super().start(
-            db.Object.get(self.id).speed
-        ).addCallback(lambda task: self.logger.info('Finished.')).addErrback(
-            self.log_error
-        )
+        """Start walking."""
+        walkers.add(self, db.Object.get(self.id).speed)
+
+    def stop(self):
+        """Stop walking."""
+        if self.running:
+            walkers.discard(self.id)
+
+    def step(self, obj):
+        """Take a step towards the destination. Return True if obj should keep
+        walking."""
+        obj.clear_following()
+        kwargs = dict(observe_speed=False)
+        for name in ('x', 'y', 'z'):
+            coord = getattr(self, name)
+            current = getattr(obj, name)
+            if coord > current:
+                value = 1
+            elif coord == current:
+                value = 0
+            else:
+                value = -1
+            kwargs[name] = value
+        if any(kwargs.values()) and walk(obj, **kwargs) is not False:
+            return True
+        obj.message('You stop walking.')
+        return False
 
-    def restart(self):
-        """Restart this task."""
-        obj = db.Object.get(self.id)
-        con = obj.get_connection()
-        if con.walk_task is None:  # Noe new task was started in the meantime.
-            con.walk_task = self
-            self.start()
 
-    def walk(self):
-        """Make the player walk."""
+@attrs
+class WalkTicker:
+    """Moves every walking object. Objects are put in buckets by speed, and
+    each bucket has a single LoopingCall, which loads all of its walkers with
+    one query and steps them in one session. Walkers are stepped room by room,
+    so the commands each connection receives during a tick are sent
+    together."""
+
+    # Maps object ids to WalkTask instances.
+    tasks = attrib(default=Factory(dict), init=False, repr=False)
+    # Maps object ids to the speed they are walking at.
+    speeds = attrib(default=Factory(dict), init=False, repr=False)
+    # Maps speeds to sets of object ids.
+    buckets = attrib(default=Factory(dict), init=False, repr=False)
+    # Maps speeds to LoopingCall instances.
+    loops = attrib(default=Factory(dict), init=False, repr=False)
+    # The most walkers to load with a single query.
+    batch_size = attrib(default=500)
+    # The clock to tick with, or None for the reactor.
+    clock = attrib(default=None, repr=False)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def get(self, id):
+        """Return the WalkTask for the object with the given id, or None."""
+        return self.tasks.get(id)
+
+    def add(self, task, speed):
+        """Step task every speed seconds, replacing any task its object
+        already had."""
+        self.discard(task.id)
+        self.tasks[task.id] = task
+        self.speeds[task.id] = speed
+        self.buckets.setdefault(speed, set()).add(task.id)
+        if speed not in self.loops:
+            loop = LoopingCall(self.tick, speed)
+            if self.clock is not None:
+                loop.clock = self.clock
+            self.loops[speed] = loop
+            loop.start(speed, now=False).addErrback(
+                lambda failure: logger.error(failure.getTraceback())
+            )
+
+    def discard(self, id):
+        """Stop the object with the given id from walking."""
+        self.tasks.pop(id, None)
+        speed = self.speeds.pop(id, None)
+        bucket = self.buckets.get(speed)
+        if bucket is None:
+            return
+        bucket.discard(id)
+        if not bucket:
+            del self.buckets[speed]
+            loop = self.loops.pop(speed)
+            if loop.running:
+                loop.stop()
+
+    def finish(self, obj):
+        """Stop obj walking, and forget the walk task of its connection."""
+        task = self.tasks.get(obj.id)
+        self.discard(obj.id)
+        con = obj.get_connection()
+        if con is not None and con.walk_task is task:
+            con.walk_task = None
+
+    def tick(self, speed):
+        """Step every object walking at speed. Objects whose speed has changed
+        move to the right bucket and step on its next tick instead. Each step
+        happens inside a savepoint, so a walker which fails only rolls back
+        its own changes."""
+        ids = list(self.buckets.get(speed, ()))
+        if not ids:
+            return
+        found = set()
         with db.session() as s:
-            obj = db.Object.get(self.id)
-            if obj is None:
-                return self.stop()
-            obj.clear_following()
-            kwargs = dict(observe_speed=False)
-            if obj.speed != self.interval:
-                con = obj.get_connection()
-                con.walk_task = None
-                self.stop()
-                reactor.callLater(obj.speed, self.restart)
-                return
-            for name in ('x', 'y', 'z'):
-                coord = getattr(self, name)
-                current = getattr(obj, name)
-                if coord > current:
-                    value = 1
-                elif coord == current:
-                    value = 0
-                else:
-                    value = -1
-                kwargs[name] = value
-            if any(kwargs.values()):
-                res = walk(obj, **kwargs)
-                s.add(obj)
-            else:
-                res = False
-            if res is False:
-                obj.message('You stop walking.')
-                self.stop()
-                con = obj.get_connection()
-                if con is not None:
-                    con.walk_task = None
+            for start in range(0, len(ids), self.batch_size):
+                query = s.query(db.Object).filter(
+                    db.Object.id.in_(ids[start:start + self.batch_size])
+                ).order_by(db.Object.location_id)
+                for obj in query:
+                    found.add(obj.id)
+                    task = self.tasks.get(obj.id)
+                    if task is None:
+                        continue  # Stopped by an earlier step.
+                    elif obj.speed != speed:
+                        self.add(task, obj.speed)
+                        continue
+                    try:
+                        with s.begin_nested():
+                            walking = task.step(obj)
+                        if not walking:
+                            self.finish(obj)
+                    except Exception as e:
+                        logger.warning('Walk task for %r failed.', obj)
+                        logger.exception(e)
+                        self.finish(obj)
+        for id in set(ids) - found:
+            self.discard(id)  # The object has been deleted.
+
+
+walkers = WalkTicker()
 
 
 def emote(player, string):
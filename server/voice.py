@@ -0,0 +1,60 @@
+"""Binary voice frames.
+
+A voice frame is a binary websocket frame which starts with a header packed
+with voice_header, followed by audio samples. The first byte of the header is
+always voice_tag, which msgpack never uses, so voice frames cannot be mistaken
+for commands.
+
+Clients send 0 as the speaker ID. The server replaces it with the ID of the
+speaking object before relaying the frame, and never looks at the samples."""
+
+from struct import Struct, error
+
+voice_tag = 0xc1
+
+# Tag, encoding, sample rate, speaker ID, sequence number.
+voice_header = Struct('>BBIII')
+
+min_sample_rate = 3000
+max_sample_rate = 96000
+
+
+class VoiceEncodings:
+    """The ways samples can be encoded."""
+
+    pcm16 = 1  # Signed 16-bit little-endian integers.
+    mulaw = 2  # 8-bit G.711 mu-law.
+
+
+encodings = frozenset([VoiceEncodings.pcm16, VoiceEncodings.mulaw])
+
+
+class VoiceError(Exception):
+    """A voice frame was invalid."""
+
+
+def is_voice(payload):
+    """Return whether or not payload is a voice frame."""
+    return payload[:1] == bytes([voice_tag])
+
+
+def relabel(payload, speaker_id):
+    """Check that payload is a valid voice frame, and return it with its
+    speaker ID set to speaker_id."""
+    try:
+        header = voice_header.unpack_from(payload)
+    except error:
+        raise VoiceError('Voice frame is too short.')
+    tag, encoding, sample_rate, speaker, sequence = header
+    if tag != voice_tag:
+        raise VoiceError('Invalid tag: %d.' % tag)
+    elif encoding not in encodings:
+        raise VoiceError('Invalid encoding: %d.' % encoding)
+    elif not min_sample_rate <= sample_rate <= max_sample_rate:
+        raise VoiceError('Invalid sample rate: %d.' % sample_rate)
+    samples = payload[voice_header.size:]
+    if encoding == VoiceEncodings.pcm16 and len(samples) % 2:
+        raise VoiceError('Odd number of bytes in 16-bit samples.')
+    return voice_header.pack(
+        tag, encoding, sample_rate, speaker_id, sequence
+    ) + samples
@@ -8,6 +8,26 @@ from .app import app
 from .renderer import render_template
 from .forms import LoginForm
 from ..db import HelpTopic, HelpKeyword, Rule, Credit
+from ..sound import get_sum
+
+immutable = b'public, max-age=31536000, immutable'
+
+
+class SoundFile(File):
+    """Serve sounds. Clients request sounds with their version tag as the
+    query string, so when the tag matches the file can be cached forever."""
+
+    def render_GET(self, request):
+        if not self.isdir():
+            tag = get_sum(os.path.relpath(self.path))
+            if tag is not None:
+                request.setHeader(b'etag', b'"%s"' % tag.encode())
+                query = request.uri.partition(b'?')[2]
+                if query.decode(errors='replace') == tag:
+                    request.setHeader(b'cache-control', immutable)
+                else:
+                    request.setHeader(b'cache-control', b'no-cache')
+        return super().render_GET(request)
 
 
 @app.route('/')
@@ -19,7 +39,7 @@ def index(request):
 @app.route('/sounds/', branch=True)
 def sounds(request):
     """Return the sounds directory."""
-    return File('sounds')
+    return SoundFile('sounds')
 
 
 @app.route('/static/', branch=True)
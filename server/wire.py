@@ -0,0 +1,174 @@
+"""Wire formats used to exchange commands with clients.
+
+Clients choose a format by offering websocket subprotocols. Connections which
+offer none of them are spoken to with JSON text frames."""
+
+from json import dumps, loads
+from attr import attrs, attrib, Factory
+from msgpack import packb, unpackb, Packer
+
+# The names of commands which the msgpack format sends as numbers. The table
+# is sent to clients when they connect, so order is not significant.
+command_names = [
+    'message', 'identify', 'object_sound', 'interface_sound', 'hidden_sound',
+    'random_sound', 'delete', 'location', 'zone', 'convolver', 'speak',
+    'character_id', 'options', 'form', 'menu', 'get_text', 'url', 'copy',
+    'remember_quit', 'login', 'key', 'action', 'python', 'random_sounds',
+    'move'
+]
+
+
+class WireError(Exception):
+    """A frame could not be decoded."""
+
+
+@attrs
+class JSONFormat:
+    """Commands as JSON text frames."""
+
+    subprotocol = 'mindspace.json'
+    binary = False
+
+    def encode(self, name, args, kwargs):
+        """Encode a single command."""
+        return dumps(dict(name=name, args=args, kwargs=kwargs)).encode()
+
+    def encode_item(self, name, args, kwargs):
+        """Encode a command so it can be joined with others by self.join."""
+        return dumps([name, args, kwargs]).encode()
+
+    def join(self, items):
+        """Join the results of self.encode_item into a single frame."""
+        return b'[' + b', '.join(items) + b']'
+
+    def encode_batch(self, commands):
+        """Encode a list of [name, args, kwargs] lists as a single frame."""
+        return self.join([self.encode_item(*command) for command in commands])
+
+    def decode(self, payload):
+        """Return (name, args, kwargs) from payload."""
+        name, args, kwargs = loads(payload)
+        return (name, args, kwargs)
+
+
+@attrs
+class MsgpackFormat:
+    """Commands as msgpack binary frames, with command names replaced by their
+    index in self.names where possible."""
+
+    subprotocol = 'mindspace.msgpack'
+    binary = True
+    names = attrib(default=Factory(lambda: command_names.copy()))
+    opcodes = attrib(default=Factory(dict), init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        for opcode, name in enumerate(self.names):
+            self.opcodes[name] = opcode
+
+    def pack_command(self, name, args, kwargs):
+        return [self.opcodes.get(name, name), args, kwargs]
+
+    def encode(self, name, args, kwargs):
+        """Encode a single command."""
+        return packb(self.pack_command(name, args, kwargs), use_bin_type=True)
+
+    # A lone command and a member of a batch look the same.
+    encode_item = encode
+
+    def join(self, items):
+        """Join the results of self.encode_item into a single frame. A msgpack
+        array is just a header followed by its packed members, so the items
+        do not need to be packed again."""
+        return Packer().pack_array_header(len(items)) + b''.join(items)
+
+    def encode_batch(self, commands):
+        """Encode a list of [name, args, kwargs] lists as a single frame."""
+        return self.join([self.encode_item(*command) for command in commands])
+
+    def decode(self, payload):
+        """Return (name, args, kwargs) from payload."""
+        name, args, kwargs = unpackb(payload, raw=False)
+        if isinstance(name, int):
+            if not 0 <= name < len(self.names):
+                raise WireError('Invalid opcode: %d.' % name)
+            name = self.names[name]
+        return (name, args, kwargs)
+
+
+@attrs
+class PreparedCommand:
+    """A command which can be sent to any number of connections, but is only
+    encoded once for each wire format."""
+
+    name = attrib()
+    args = attrib()
+    kwargs = attrib()
+    frames = attrib(default=Factory(dict), init=False, repr=False)
+    items = attrib(default=Factory(dict), init=False, repr=False)
+    prepared = attrib(default=Factory(dict), init=False, repr=False)
+
+    def get_frame(self, format):
+        """Get this command as a frame in the given format."""
+        key = format.subprotocol
+        if key not in self.frames:
+            self.frames[key] = format.encode(
+                self.name, self.args, self.kwargs
+            )
+        return self.frames[key]
+
+    def get_item(self, format):
+        """Get this command ready to be batched in the given format."""
+        key = format.subprotocol
+        if key not in self.items:
+            self.items[key] = format.encode_item(
+                self.name, self.args, self.kwargs
+            )
+        return self.items[key]
+
+    def get_prepared(self, factory, format):
+        """Get an autobahn PreparedMessage, complete with websocket framing,
+        for connections which are not compressing their messages."""
+        key = format.subprotocol
+        if key not in self.prepared:
+            self.prepared[key] = factory.prepareMessage(
+                self.get_frame(format), isBinary=format.binary
+            )
+        return self.prepared[key]
+
+
+class ConnectionRequired(AttributeError):
+    """A command needed more from its connection than a send method."""
+
+
+class CommandRecorder:
+    """Pretends to be a connection, and records the commands sent to it."""
+
+    def __init__(self):
+        self.commands = []
+
+    def __getattr__(self, name):
+        raise ConnectionRequired(name)
+
+    def send(self, name, *args, **kwargs):
+        self.commands.append(PreparedCommand(name, args, kwargs))
+
+
+def prepare(command, *args, **kwargs):
+    """Call command (one of the functions from the protocol module for
+    example) with a CommandRecorder in place of a connection, and return the
+    list of PreparedCommand instances it sent. If command needs more from its
+    connection than a send method, return None: the command will have to be
+    run for each connection separately."""
+    recorder = CommandRecorder()
+    try:
+        command(recorder, *args, **kwargs)
+    except ConnectionRequired:
+        return None
+    return recorder.commands
+
+
+json_format = JSONFormat()
+msgpack_format = MsgpackFormat()
+
+# The formats we support, in order of preference.
+formats = (msgpack_format, json_format)
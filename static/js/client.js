@@ -1,12 +1,23 @@
-/* global Cookies, reverbjs */
+/* global Cookies, reverbjs, MessagePack */
 
 let cookies_options = {expires: 365}
-let recorder = null
-let cancel_recording = false
-let recording = "recording"
-let microphone_data = null
 let speech_data = null
 
+// Voice is sent in binary frames which start with a header (see server/voice.py).
+let voice_frame_tag = 0xc1
+let voice_frame_header_size = 14
+let voice_frame_pcm16 = 1
+let voice_frame_mulaw = 2
+let voice_frame_encoding = voice_frame_mulaw
+let voice_frame_rate = 16000
+// How far ahead to schedule voice when a speaker starts talking, to smooth out network jitter.
+let voice_frame_latency = 0.1
+let voice_frame_sequence = 0
+let voice_frame_players = {}
+let transmitting = false
+let microphone_source = null
+let microphone_processor = null
+
 let ArrayType = Uint8Array
 // The following code was taken from
 // https://developers.google.com/web/updates/2012/06/How-to-convert-ArrayBuffer-to-and-from-String
@@ -18,31 +29,128 @@ function init_microphone() {
     }
     navigator.mediaDevices.getUserMedia({audio: {deviceId: microphone_select.value}, video: false}).then(
         stream => {
-            if (MediaRecorder === undefined) {
-                write_message("*** No MediaRecorder available. Recording your voice will be impossible on this device. ***")
-            } else {
-                recorder = new MediaRecorder(stream)
-                recorder.ondataavailable = (e) => {
-                    if (cancel_recording) {
-                        return
-                    }
-                    let data = new Blob(new Array(e.data), { type: "audio/m4a"})
-                    let reader = new FileReader()
-                    reader.onloadend = () => {
-                        microphone_data = reader.result
-                        send({name: "speak", args: [ab2str(microphone_data)]})
-                    }
-                    reader.readAsArrayBuffer(data)
+            if (microphone_source !== null) {
+                microphone_source.disconnect()
+                microphone_processor.disconnect()
+            }
+            microphone_source = audio.createMediaStreamSource(stream)
+            microphone_processor = audio.createScriptProcessor(4096, 1, 1)
+            microphone_processor.onaudioprocess = (e) => {
+                if (transmitting) {
+                    send_voice(e.inputBuffer.getChannelData(0))
                 }
             }
+            microphone_source.connect(microphone_processor)
+            // Script processors only run while they are connected to something. The output is silent.
+            microphone_processor.connect(audio.destination)
         }, () => {
             alert("Failed to use microphone.")
         }
     )
 }
 
-function ab2str(buf) {
-    return String.fromCharCode.apply(null, new ArrayType(buf))
+function mulaw_encode(sample) {
+    // Encode a float between -1 and 1 as a G.711 mu-law byte.
+    let s = Math.max(-32635, Math.min(32635, Math.round(sample * 32767)))
+    let sign = 0
+    if (s < 0) {
+        sign = 0x80
+        s = -s
+    }
+    s += 0x84
+    let exponent = 7
+    for (let mask = 0x4000; (s & mask) === 0 && exponent > 0; mask >>= 1) {
+        exponent--
+    }
+    let mantissa = (s >> (exponent + 3)) & 0x0f
+    return ~(sign | (exponent << 4) | mantissa) & 0xff
+}
+
+function mulaw_decode(byte) {
+    // Decode a G.711 mu-law byte to a float between -1 and 1.
+    byte = ~byte & 0xff
+    let exponent = (byte >> 4) & 0x07
+    let sample = ((((byte & 0x0f) << 3) + 0x84) << exponent) - 0x84
+    if (byte & 0x80) {
+        sample = -sample
+    }
+    return sample / 32768
+}
+
+function send_voice(input) {
+    // Downsample input (a Float32Array at the audio context's sample rate) and send it as a voice frame.
+    let factor = Math.max(1, Math.round(audio.sampleRate / voice_frame_rate))
+    let count = Math.floor(input.length / factor)
+    let width = voice_frame_encoding == voice_frame_pcm16 ? 2 : 1
+    let buffer = new ArrayBuffer(voice_frame_header_size + count * width)
+    let view = new DataView(buffer)
+    view.setUint8(0, voice_frame_tag)
+    view.setUint8(1, voice_frame_encoding)
+    view.setUint32(2, Math.round(audio.sampleRate / factor))
+    view.setUint32(6, 0)
+    view.setUint32(10, voice_frame_sequence)
+    voice_frame_sequence = (voice_frame_sequence + 1) >>> 0
+    for (let i = 0; i < count; i++) {
+        // Averaging each group of samples doubles as a crude low pass filter.
+        let total = 0
+        for (let j = 0; j < factor; j++) {
+            total += input[i * factor + j]
+        }
+        let sample = Math.max(-1, Math.min(1, total / factor))
+        if (width == 2) {
+            view.setInt16(voice_frame_header_size + i * 2, Math.round(sample * 32767), true)
+        } else {
+            view.setUint8(voice_frame_header_size + i, mulaw_encode(sample))
+        }
+    }
+    soc.send(buffer)
+}
+
+function play_voice(data) {
+    // Play a voice frame from the server.
+    let view = new DataView(data)
+    let encoding = view.getUint8(1)
+    let sample_rate = view.getUint32(2)
+    let id = view.getUint32(6)
+    let sequence = view.getUint32(10)
+    let thing = objects[id]
+    if (thing === undefined) {
+        send({name: "identify", args: [id]})
+        return
+    }
+    let state = voice_frame_players[id]
+    if (state === undefined) {
+        state = {sequence: null, time: 0}
+        voice_frame_players[id] = state
+    } else if (sequence <= state.sequence && state.sequence - sequence < 100) {
+        // Late or duplicated. A big jump backwards means the speaker reconnected.
+        return
+    }
+    state.sequence = sequence
+    let width = encoding == voice_frame_pcm16 ? 2 : 1
+    let count = Math.floor((data.byteLength - voice_frame_header_size) / width)
+    if (!count) {
+        return
+    }
+    let buffer = audio.createBuffer(1, count, sample_rate)
+    let channel = buffer.getChannelData(0)
+    for (let i = 0; i < count; i++) {
+        if (width == 2) {
+            channel[i] = view.getInt16(voice_frame_header_size + i * 2, true) / 32768
+        } else {
+            channel[i] = mulaw_decode(view.getUint8(voice_frame_header_size + i))
+        }
+    }
+    let source = audio.createBufferSource()
+    source.buffer = buffer
+    source.connect(thing.panner)
+    // Queue frames back to back so speech plays smoothly.
+    let start = state.time
+    if (start < audio.currentTime) {
+        start = audio.currentTime + voice_frame_latency
+    }
+    source.start(start)
+    state.time = start + buffer.duration
 }
 
 function str2ab(str) {
@@ -74,6 +182,7 @@ let room = null
 let room_ambience = null
 let zone = null
 let music = null
+let random_sounds_timeout = null
 
 let escape_element = null
 
@@ -96,6 +205,16 @@ function scroll_bottom() {
     window.scrollTo(0,document.body.scrollHeight)
 }
 
+function seeded_random(seed) {
+    // Mulberry32, so a room's random sounds can be played from the seed the server sends.
+    return () => {
+        seed = (seed + 0x6D2B79F5) | 0
+        let t = Math.imul(seed ^ (seed >>> 15), 1 | seed)
+        t = (t + Math.imul(t ^ (t >>> 7), 61 | t)) ^ t
+        return ((t ^ (t >>> 14)) >>> 0) / 4294967296
+    }
+}
+
 function create_panner(max_distance) {
     let p = audio.createPanner()
     if (max_distance !== undefined) {
@@ -269,15 +388,30 @@ function send(obj) {
     if (obj.kwargs === undefined) {
         obj.kwargs = {}
     }
-    let l = [obj.name, obj.args, obj.kwargs]
-    let value = JSON.stringify(l)
-    soc.send(value)
+    if (soc.protocol == msgpack_protocol) {
+        let name = command_opcodes[obj.name]
+        if (name === undefined) {
+            name = obj.name
+        }
+        soc.send(MessagePack.encode([name, obj.args, obj.kwargs]))
+    } else {
+        let l = [obj.name, obj.args, obj.kwargs]
+        let value = JSON.stringify(l)
+        soc.send(value)
+    }
 }
 
 // Create a web socket.
 let soc = null
 let connected = false
 
+// Wire formats.
+let msgpack_protocol = "mindspace.msgpack"
+let json_protocol = "mindspace.json"
+// Command names and their numbers, as sent by the server with the opcodes command.
+let command_names = []
+let command_opcodes = {}
+
 // Page elements.
 
 let microphone_select = document.getElementById("microphone")
@@ -708,25 +842,24 @@ function set_convolver(url, node, volume) {
 
 let mindspace_functions = {
     toggle_recording: () => {
-        if (recorder === null || recorder.state == recording) {
+        if (transmitting) {
             mindspace_functions.stop_recording()
         } else {
             mindspace_functions.start_recording()
         }
     },
     start_recording: () => {
-        cancel_recording = false
-        recorder.start()
-    },
-    stop_recording: () => {
-        if (recorder === null) {
+        if (microphone_processor === null) {
             write_message("You cannot record audio on this device.")
-        } else if (recorder.state == recording) {
-            recorder.stop()
+        } else {
+            transmitting = true
         }
     },
+    stop_recording: () => {
+        transmitting = false
+    },
     cancel_recording: () => {
-        cancel_recording = true
+        // Voice is streamed as it is recorded, so there is nothing to throw away.
         mindspace_functions.stop_recording()
     },
     convolver: obj => {
@@ -772,6 +905,27 @@ let mindspace_functions = {
             source.start()
         })
     },
+    random_sounds: obj => {
+        let [seed, min_interval, max_interval, size_x, size_y, size_z, max_distance, palette] = obj.args
+        if (random_sounds_timeout !== null) {
+            clearTimeout(random_sounds_timeout)
+            random_sounds_timeout = null
+        }
+        if (!palette.length) {
+            return
+        }
+        let random = seeded_random(seed)
+        let uniform = (start, end) => start + random() * (end - start)
+        let schedule = delay => {
+            random_sounds_timeout = setTimeout(() => {
+                let [choices, min_volume, max_volume] = palette[Math.floor(random() * palette.length)]
+                let [path, sum] = choices[Math.floor(random() * choices.length)]
+                mindspace_functions.random_sound({args: [path, sum, uniform(0, size_x), uniform(0, size_y), uniform(0, size_z), uniform(min_volume, max_volume), max_distance]})
+                schedule(uniform(min_interval, max_interval) * 1000)
+            }, delay)
+        }
+        schedule(uniform(min_interval, max_interval) * 1000)
+    },
     speak: obj => {
         let [id, data] = obj.args
         let thing = objects[id]
@@ -1021,6 +1175,18 @@ let mindspace_functions = {
         thing.panner.setPosition(x, y, z)
         thing.ambience = create_ambience(thing.ambience, ambience_sound, ambience_volume, thing.panner)
     },
+    move: obj => {
+        let [id, x, y, z] = obj.args
+        let thing = objects[id]
+        if (thing === undefined) {
+            send({name: "identify", args: [id]})
+            return
+        }
+        if (id == character_id) {
+            audio.listener.setPosition(x, y, z)
+        }
+        thing.panner.setPosition(x, y, z)
+    },
     interface_sound: obj => {
         let [path, sum] = obj.args
         play_sound(path, sum)
@@ -1067,7 +1233,14 @@ let mindspace_functions = {
             music.mixer.gain.value = music_volume
         }
     },
-    mute_mic: () => {}
+    mute_mic: () => {},
+    opcodes: obj => {
+        command_names = obj.args[0]
+        command_opcodes = {}
+        command_names.forEach((name, opcode) => {
+            command_opcodes[name] = opcode
+        })
+    }
 }
 
 set_title()
@@ -1093,6 +1266,15 @@ connect_form.onsubmit = (e) => {
     return false
 }
 
+function handle_command(obj) {
+    let func = mindspace_functions[obj.name]
+    if (func !== undefined) {
+        func(obj)
+    } else {
+        write_message(`Unrecognised command: ${JSON.stringify(obj)}.`)
+    }
+}
+
 function create_socket(obj) {
     clear_element(voice_voice)
     let o = document.createElement("option")
@@ -1113,7 +1295,12 @@ function create_socket(obj) {
     if (window.WebSocket === undefined) {
         write_message("Your browser doesn't support this client. Please use a browser like FIrefox or Chrome.")
     } else {
-        soc = new window.WebSocket(`wss://${window.location.hostname}:6465`)
+        let protocols = [json_protocol]
+        if (window.MessagePack !== undefined) {
+            protocols.unshift(msgpack_protocol)
+        }
+        soc = new window.WebSocket(`wss://${window.location.hostname}:6465`, protocols)
+        soc.binaryType = "arraybuffer"
         soc.onclose = (e) => {
             if (audio !== null) {
                 audio.close()
@@ -1166,12 +1353,32 @@ function create_socket(obj) {
             )
         }
         soc.onmessage = (e) => {
-            let obj = JSON.parse(e.data)
-            let func = mindspace_functions[obj.name]
-            if (func !== undefined) {
-                func(obj)
+            if (e.data instanceof ArrayBuffer) {
+                if (e.data.byteLength && new Uint8Array(e.data, 0, 1)[0] == voice_frame_tag) {
+                    play_voice(e.data)
+                    return
+                }
+                let data = MessagePack.decode(new Uint8Array(e.data))
+                if (!Array.isArray(data[0])) {
+                    // A single command rather than a batch.
+                    data = [data]
+                }
+                for (let [name, args, kwargs] of data) {
+                    if (typeof(name) == "number") {
+                        name = command_names[name]
+                    }
+                    handle_command({name: name, args: args, kwargs: kwargs})
+                }
             } else {
-                write_message(`Unrecognised command: ${e.data}.`)
+                let data = JSON.parse(e.data)
+                if (Array.isArray(data)) {
+                    // A batch of [name, args, kwargs] lists.
+                    for (let [name, args, kwargs] of data) {
+                        handle_command({name: name, args: args, kwargs: kwargs})
+                    }
+                } else {
+                    handle_command(data)
+                }
             }
         }
     }
@@ -0,0 +1,56 @@
+from sqlalchemy import create_engine, select
+from server.db import (
+    Base, Object, ObjectRandomSound, Room, RoomRandomSound, get_classes
+)
+from server.db.bulk import (
+    bulk_load, create_indexes, create_tables, group_rows, sorted_tables,
+    strongly_connected
+)
+
+
+def test_strongly_connected():
+    graph = dict(a={'b'}, b={'c'}, c={'b', 'd'}, d=set(), e={'a'})
+    assert strongly_connected(graph) == [['d'], ['b', 'c'], ['a'], ['e']]
+
+
+def test_sorted_tables():
+    tables = sorted_tables(Base.metadata)
+    assert len(tables) == len(Base.metadata.tables)
+    for parent, child in (
+        (Room, RoomRandomSound), (Object, ObjectRandomSound)
+    ):
+        assert tables.index(parent.__table__) < tables.index(child.__table__)
+
+
+def test_group_rows():
+    rows = [dict(id=1), dict(id=2, name='b'), dict(id=3), dict(name='d', id=4)]
+    assert group_rows(rows) == [[rows[0], rows[2]], [rows[1], rows[3]]]
+
+
+def test_bulk_load():
+    engine = create_engine('sqlite:///:memory:')
+    source = dict(
+        Zone=[dict(id=1, name='Zone')],
+        Room=[dict(id=2, name='Room', zone_id=1)],
+        Object=[
+            dict(id=3, name='First', location_id=2, x=1.0),
+            dict(id=4, name='Second', location_id=2, invalid=True)
+        ]
+    )
+    timings = {}
+    with engine.begin() as connection:
+        created = create_tables(connection, Base.metadata)
+        assert len(created) == len(Base.metadata.tables)
+        assert bulk_load(
+            source, connection, get_classes(), timings=timings
+        ) == 4
+        create_indexes(connection, created)
+        assert not create_tables(connection, Base.metadata)
+        rows = connection.execute(
+            select([Object.__table__.c.name, Object.__table__.c.x]).order_by(
+                Object.__table__.c.id
+            )
+        ).fetchall()
+    assert rows == [('First', 1.0), ('Second', 0.0)]
+    assert sorted(timings) == ['objects', 'rooms', 'zones']
+    assert timings['objects'][0] == 2
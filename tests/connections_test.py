@@ -0,0 +1,61 @@
+from server.connections import (
+    ConnectionRegistry, connections, PermissionLevels
+)
+from server.db import Session as s, Object, Player, Room, Zone
+
+
+class CustomConnection:
+    def __init__(self, host='127.0.0.1'):
+        self.host = host
+        self.player_id = None
+
+
+def test_add_remove():
+    r = ConnectionRegistry()
+    con = CustomConnection()
+    r.add(con)
+    assert len(r) == 1
+    assert list(r) == [con]
+    assert r.from_host(con.host) == [con]
+    r.remove(con)
+    assert not len(r)
+    assert con not in r
+    assert r.from_host(con.host) == []
+    r.remove(con)  # Does nothing.
+
+
+def test_register():
+    z = Zone(name='Test Zone')
+    r1 = Room(name='First Room', zone=z)
+    r2 = Room(name='Second Room')
+    p = Player(username='registry')
+    p.set_password('test')
+    o = Object(name='Registry Player', player=p, location=r1)
+    s.add_all([z, r1, r2, p, o])
+    s.commit()
+    con = CustomConnection()
+    connections.add(con)
+    o.register_connection(con)
+    assert o.get_connection() is con
+    assert con.player_id == o.id
+    assert connections.in_room(r1.id) == [con]
+    assert connections.in_zone(z.id) == [con]
+    assert connections.at_level(PermissionLevels.player) == [con]
+    assert connections.staff == []
+    o.location = r2
+    assert connections.in_room(r1.id) == []
+    assert connections.in_zone(z.id) == []
+    assert connections.in_room(r2.id) == [con]
+    r2.zone_id = z.id
+    assert connections.in_zone(z.id) == [con]
+    p.builder = True
+    assert connections.staff == [con]
+    p.admin = True
+    assert connections.at_level(PermissionLevels.admin) == [con]
+    assert connections.at_level(PermissionLevels.builder) == []
+    connections.remove(con)
+    assert o.get_connection() is None
+    assert connections.in_room(r2.id) == []
+    assert connections.staff == []
+    s.delete(o)
+    s.commit()
@@ -0,0 +1,44 @@
+import os.path
+from sqlalchemy import create_engine
+from yaml import Loader, load
+from server import db
+from server.db import Object, Room, Session
+
+
+def test_backup_matches_live():
+    r = Room(name='Backup Room')
+    Session.add(r)
+    Session.commit()
+    Session.add(Object(name='Backup Object', location=r))
+    Session.commit()
+    expected = db.objects_as_dicts()
+    backup = db.backup_db()
+    try:
+        backup_engine = create_engine('sqlite:///' + backup)
+        with backup_engine.connect() as connection:
+            assert db.rows_as_dicts(connection) == expected
+        backup_engine.dispose()
+    finally:
+        os.remove(backup)
+
+
+def test_dump_db(tmpdir):
+    filename = str(tmpdir.join('world.yaml'))
+    assert db.dump_db(filename) is None
+    with open(filename, 'r') as f:
+        d = load(f, Loader=Loader)
+    assert len(d['Object']) == Object.count()
+    assert not [name for name in os.listdir(str(tmpdir)) if name.endswith(
+        '.tmp'
+    )]
+
+
+def test_overlapping_dumps(tmpdir):
+    filename = str(tmpdir.join('world.snapshot'))
+    db.dumping = True
+    try:
+        assert db.dump_db(filename, thread=True) is None
+        assert db.compact_db() is None
+    finally:
+        db.dumping = False
+    assert not os.path.exists(filename)
@@ -0,0 +1,83 @@
+from twisted.internet.task import Clock
+from server.connections import connections
+from server.db import Session as s, Object, Player, Room
+from server.interest import InterestManager, in_range, interest
+from .protocol_test import CustomProtocol
+
+
+def test_in_range():
+    assert in_range((0, 0, 0), (5, -5, 5), 5)
+    assert not in_range((0, 0, 0), (0, 5.5, 0), 5)
+
+
+def test_rate_limit():
+    i = InterestManager()
+    con = CustomProtocol()
+    clock = Clock()
+    i.start(0.5, clock)
+    i.add(con, 1)
+    i.move(con, 1, (1.0, 0.0, 0.0))
+    i.move(con, 1, (2.0, 0.0, 0.0))
+    i.move(con, 1, (3.0, 0.0, 0.0))
+    # Only the first move is sent straight away.
+    assert con.frames == [
+        dict(name='move', args=[1, 1.0, 0.0, 0.0], kwargs={})
+    ]
+    clock.advance(0.5)
+    assert con.frames[-1] == dict(
+        name='move', args=[1, 3.0, 0.0, 0.0], kwargs={}
+    )
+    assert len(con.frames) == 2
+    i.move(con, 1, (4.0, 0.0, 0.0))
+    i.drop(con, 1)
+    clock.advance(0.5)
+    # Moves are not sent for objects which have been dropped.
+    assert con.frames[-1] == dict(name='delete', args=[1], kwargs={})
+    assert not i.knows(con, 1)
+    assert not i.watchers
+    i.stop()
+
+
+def test_update_neighbours():
+    r = Room(name='Interest Room', max_distance=5.0)
+    p = Player(username='interested')
+    p.set_password('test')
+    listener = Object(name='Listener', player=p, location=r)
+    walker = Object(name='Interest Walker', location=r, x=10.0)
+    s.add_all([r, p, listener, walker])
+    s.commit()
+    con = CustomProtocol()
+    con.host = '127.0.0.1'
+    connections.add(con)
+    listener.register_connection(con)
+    listener.update_interest(con)
+    # The walker is out of range.
+    assert not interest.knows(con, walker.id)
+    con.frames.clear()
+    walker.x = 5.0
+    walker.update_neighbours(full=False)
+    assert [f['name'] for f in con.frames] == ['identify']
+    assert interest.knows(con, walker.id)
+    walker.x = 4.0
+    walker.update_neighbours(full=False)
+    assert con.frames[-1] == dict(
+        name='move', args=[walker.id, 4.0, 0.0, 0.0], kwargs={}
+    )
+    walker.update_neighbours()
+    assert con.frames[-1]['name'] == 'identify'
+    walker.x = 6.0
+    walker.update_neighbours(full=False)
+    assert con.frames[-1] == dict(name='delete', args=[walker.id], kwargs={})
+    assert not interest.knows(con, walker.id)
+    # The listener moving towards the walker brings it back into range.
+    listener.x = 2.0
+    listener.update_neighbours(full=False)
+    assert interest.knows(con, walker.id)
+    assert con.frames[-1]['name'] == 'identify'
+    assert con.frames[-1]['args'][0] == walker.id
+    connections.remove(con)
+    interest.forget(con)
+    assert not interest.watchers
+    for obj in (walker, listener, r):
+        s.delete(obj)
+    s.commit()
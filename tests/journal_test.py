@@ -0,0 +1,66 @@
+from datetime import timedelta
+from sqlalchemy import create_engine, select
+from server.db import Base, Session, Room, Player
+from server.db.journal import journal, Journal
+
+
+def test_journal(tmpdir):
+    filename = str(tmpdir.join('test.journal'))
+    old = journal.filename
+    journal.filename = filename
+    journal.open()
+    try:
+        r = Room(name='Journal Room')
+        p = Player(username='journal')
+        p.set_password('test')
+        Session.add_all([r, p])
+        Session.commit()
+        r.name = 'Renamed Room'
+        p.connected_time = timedelta(hours=2)
+        Session.commit()
+        deleted = Room(name='Deleted Room')
+        Session.add(deleted)
+        Session.commit()
+        Session.delete(deleted)
+        Session.commit()
+        not_committed = Room(name='Rolled Back')
+        Session.add(not_committed)
+        Session.flush()
+        Session.rollback()
+        Room.query(id=r.id).update({Room.max_distance: 15.0})
+        Session.commit()
+    finally:
+        journal.close()
+        journal.filename = old
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        assert Journal(filename).replay(connection, Base.metadata) == 7
+        # Replaying twice changes nothing.
+        Journal(filename).replay(connection, Base.metadata)
+        rooms = connection.execute(
+            select([Room.__table__.c.name, Room.__table__.c.max_distance])
+        ).fetchall()
+        assert rooms == [('Renamed Room', 15.0)]
+        table = Player.__table__
+        players = connection.execute(
+            select([table.c.username, table.c.connected_time])
+        ).fetchall()
+        assert players == [('journal', timedelta(hours=2))]
+
+
+def test_rotate(tmpdir):
+    j = Journal(str(tmpdir.join('test.journal')))
+    j.open()
+    j.f.write(b'\x90')
+    j.rotate()
+    assert j.recording
+    assert tmpdir.join('test.journal.old').read_binary() == b'\x90'
+    j.f.write(b'\x91')
+    j.f.flush()
+    j.rotate()
+    assert tmpdir.join('test.journal.old').read_binary() == b'\x90\x91'
+    j.discard_old()
+    assert not tmpdir.join('test.journal.old').exists()
+    j.clear()
+    j.close()
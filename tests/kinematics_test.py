@@ -0,0 +1,48 @@
+from pytest import raises
+from server.kinematics import (
+    steps, series_sum, braking_distance, braking_time, intercept_steps,
+    should_accelerate, autopilot
+)
+from server.util import frange
+
+
+def test_series():
+    for stop, step in (
+        (0.0, 1.0), (-5.0, 1.0), (1.0, 1.0), (10.0, 1.0), (10.5, 1.0),
+        (1000.0, 7.0), (123.4, 0.25)
+    ):
+        expected = list(frange(0, stop, step))
+        assert steps(stop, step) == len(expected)
+        assert abs(series_sum(stop, step) - sum(expected)) < 1e-6
+
+
+def test_braking():
+    assert braking_distance(5.0, 1.0) == 10.0
+    assert braking_time(5.0, 1.0) == 5
+    assert braking_distance(0.0, 1.0) == 0.0
+    assert braking_time(0.0, 1.0) == 0
+
+
+def test_intercept_steps():
+    for distance, acceleration, speed in (
+        (0.0, 1.0, 0.0), (1.0, 1.0, 0.0), (100.0, 1.0, 0.0),
+        (100.0, 3.0, 2.0), (12345.6, 0.5, 10.0), (10.0, 0.0, 3.0)
+    ):
+        n = 0
+        covered = 0.0
+        current = speed
+        while covered < distance:
+            current += acceleration
+            covered += current
+            n += 1
+        assert intercept_steps(distance, acceleration, speed=speed) == n
+    with raises(ValueError):
+        intercept_steps(10.0, 0.0)
+
+
+def test_autopilot():
+    assert should_accelerate(100.0, 5.0, 1.0)
+    assert not should_accelerate(10.0, 5.0, 1.0)
+    assert autopilot(100.0, 5.0, 1.0) == (1.0, True)
+    assert autopilot(10.0, 5.0, 1.0) == (1.0, False)
+    assert autopilot(0.0, 0.0, 1.0) == (0.0, False)
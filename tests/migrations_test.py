@@ -0,0 +1,25 @@
+from server.db import Session as s, Migration, Task, migrate
+
+
+def test_pause_polling_tasks():
+    Migration.query(name='pause_polling_tasks').delete()
+    ringtone = Task(name='Ringtone', code='pass')
+    other = Task(name='Unrelated Task', code='pass')
+    s.add_all([ringtone, other])
+    s.commit()
+    ids = (ringtone.id, other.id)
+    assert migrate() >= 1
+    ringtone, other = (Task.get(id) for id in ids)
+    assert ringtone.paused
+    assert ringtone.next_run is None
+    assert not other.paused
+    assert Migration.query(name='pause_polling_tasks').count() == 1
+    # Migrations only run once, so builders can start the task again.
+    ringtone.paused = False
+    s.commit()
+    assert migrate() == 0
+    ringtone, other = (Task.get(id) for id in ids)
+    assert not ringtone.paused
+    s.delete(ringtone)
+    s.delete(other)
+    s.commit()
@@ -0,0 +1,107 @@
+from time import time
+from server.db import (
+    Session as s, Direction, Entrance, Mobile, Object, Room
+)
+from server.db.directions import direction_table
+from server.db.mobiles import choose_direction, exit_index, move_mobiles
+
+
+def test_direction_table():
+    rows = direction_table.load()
+    assert len(rows) == Direction.count()
+    d = Direction.query().first()
+    row = direction_table.get(d.id)
+    assert row.coordinates == d.coordinates
+    assert row.opposite_id == d.opposite_id
+    assert direction_table.find(*d.coordinates).id == d.id
+    assert direction_table.get(-1) is None
+
+
+def test_choose_direction():
+    r = Room(name='Corner Room', size_x=10.0, size_y=10.0)
+    o = Object(name='Cornered', location=r, x=0.0, y=0.0)
+    s.add_all([r, o])
+    s.commit()
+    for _ in range(20):
+        d = choose_direction(o, r)
+        assert d.z == 0
+        assert d.x >= 0 and d.y >= 0
+    o.x = 10.0
+    o.y = 10.0
+    for _ in range(20):
+        d = choose_direction(o, r)
+        assert d.x <= 0 and d.y <= 0
+    s.delete(o)
+    s.delete(r)
+    s.commit()
+
+
+def test_move_mobiles():
+    r = Room(name='Mobile Room', size_x=10.0, size_y=10.0)
+    objects = [
+        Object(
+            name=f'Mobile {i}', location=r, x=5.0, y=5.0, mobile=Mobile()
+        ) for i in range(5)
+    ]
+    s.add(r)
+    s.add_all(objects)
+    s.commit()
+    now = time()
+    move_mobiles([obj.mobile for obj in objects], now)
+    s.commit()
+    for obj in objects:
+        assert obj.mobile.next_move > now
+        assert obj.steps == 1
+        assert obj.coordinates != (5.0, 5.0, 0.0)
+        assert obj.recent_direction_id is not None
+        x, y, z = direction_table.get(obj.recent_direction_id).coordinates
+        assert obj.coordinates == (5.0 + x, 5.0 + y, 0.0)
+    for obj in objects:
+        s.delete(obj)
+    s.delete(r)
+    s.commit()
+
+
+def test_follow_exits():
+    r1 = Room(name='First Exit Room')
+    r2 = Room(name='Second Exit Room')
+    exit = Object(
+        name='Door', location=r1, exit=Entrance(location=r2)
+    )
+    locked = Object(
+        name='Locked Door', location=r1, x=1.0,
+        exit=Entrance(location=r2, locked=True)
+    )
+    obj = Object(
+        name='Explorer', location=r1, mobile=Mobile(follow_exits=True)
+    )
+    s.add_all([r1, r2, exit, locked, obj])
+    s.commit()
+    assert exit_index([r1.id]) == {(r1.id, 0.0, 0.0, 0.0): [exit]}
+    move_mobiles([obj.mobile], time())
+    s.commit()
+    assert obj.location is r2
+    assert obj.recent_exit_id == exit.id
+    for thing in (obj, locked, exit, r1, r2):
+        s.delete(thing)
+    s.commit()
+
+
+def test_move_followed_mobile():
+    r = Room(name='Followed Room', size_x=10.0, size_y=10.0)
+    leader = Object(
+        name='Leader', location=r, x=5.0, y=5.0, mobile=Mobile()
+    )
+    follower = Object(name='Follower', location=r, x=5.0, y=5.0)
+    s.add_all([r, leader, follower])
+    s.commit()
+    follower.following_id = leader.id
+    s.commit()
+    move_mobiles([leader.mobile], time())
+    s.commit()
+    assert leader.coordinates != (5.0, 5.0, 0.0)
+    assert follower.coordinates == leader.coordinates
+    assert follower.recent_direction_id == leader.recent_direction_id
+    for thing in (follower, leader, r):
+        s.delete(thing)
+    s.commit()
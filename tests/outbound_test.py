@@ -0,0 +1,63 @@
+from server.outbound import OutboundQueue
+from server.wire import PreparedCommand
+
+
+def command(name, *args):
+    return PreparedCommand(name, args, {})
+
+
+def test_order():
+    q = OutboundQueue(10)
+    commands = [command('message', str(x)) for x in range(5)]
+    for c in commands:
+        assert q.push(c) is True
+    assert len(q) == 5
+    assert q.pop_all() == commands
+    assert not q
+    assert q.pop_all() == []
+
+
+def test_ambient():
+    q = OutboundQueue(2)
+    assert q.push(command('random_sound', 'sounds/test.wav'))
+    assert q.push(command('message', 'Hello.'))
+    assert q.over_high_water
+    assert not q.push(command('random_sound', 'sounds/test.wav'))
+    assert q.dropped == 1
+    assert q.push(command('message', 'Still here.'))
+    assert len(q) == 3
+
+
+def test_coalesce():
+    q = OutboundQueue(10)
+    first = command('identify', 1, 'First')
+    other = command('identify', 2, 'Other')
+    second = command('identify', 1, 'Second')
+    for c in (first, other, second):
+        q.push(c)
+    assert len(q) == 2
+    assert q.pop_all() == [other, second]
+
+
+def test_delete():
+    q = OutboundQueue(10)
+    q.push(command('identify', 1, 'Thing'))
+    delete = command('delete', 1)
+    q.push(delete)
+    assert q.pop_all() == [delete]
+
+
+def test_move():
+    q = OutboundQueue(10)
+    q.push(command('move', 1, 1.0, 0.0, 0.0))
+    last = command('move', 1, 2.0, 0.0, 0.0)
+    q.push(last)
+    assert q.pop_all() == [last]
+    q.push(command('move', 1, 3.0, 0.0, 0.0))
+    identify = command('identify', 1, 'Thing')
+    q.push(identify)
+    assert q.pop_all() == [identify]
+    q.push(command('move', 1, 4.0, 0.0, 0.0))
+    delete = command('delete', 1)
+    q.push(delete)
+    assert q.pop_all() == [delete]
@@ -0,0 +1,300 @@
+from json import loads
+from logging import getLogger
+from pytest import raises
+from types import SimpleNamespace
+from autobahn.twisted.websocket import WebSocketServerFactory
+from server.server import MindspaceWebSocketProtocol
+from server.connections import connections
+from server.db import Session as s, Object, Player, Room, ServerOptions
+from server.protocol import message, object_sound, location, random_sounds
+from server.sound import Sound
+from server.voice import VoiceEncodings, relabel, voice_header, voice_tag
+from server.wire import prepare
+
+
+class CustomProtocol(MindspaceWebSocketProtocol):
+    def __init__(self, batching=False):
+        super().__init__()
+        self.state = self.STATE_OPEN
+        self._perMessageCompress = True
+        self.frames = []
+        self.voices = []
+        self.setup_outbound(
+            SimpleNamespace(
+                outbound_high_water=4, outbound_limit=8,
+                slow_client_timeout=30.0, batch_commands=batching
+            )
+        )
+        self.aborted = False
+        self.logger = getLogger(__name__)
+
+    def abortConnection(self):
+        self.aborted = True
+
+    @property
+    def transport(self):
+        return self
+
+    def sendMessage(self, payload, isBinary=False):
+        if isBinary:
+            self.voices.append(payload)
+        else:
+            self.frames.append(loads(payload))
+
+
+def test_unbatched():
+    con = CustomProtocol()
+    message(con, 'First line.\nSecond line.')
+    assert len(con.frames) == 2
+    assert con.frames[0] == dict(
+        name='message', args=['First line.', None, None], kwargs={}
+    )
+
+
+def test_uncompressed():
+    con = CustomProtocol()
+    con._perMessageCompress = None
+    con.factory = WebSocketServerFactory()
+    con.sendData = lambda data: con.frames.append(data)
+    con.send('delete', 5)
+    frame, = con.frames
+    assert loads(frame[2:]) == dict(name='delete', args=[5], kwargs={})
+    con.state = con.STATE_CLOSING
+    con.send('delete', 6)
+    assert con.frames == [frame]
+
+
+def test_batched():
+    con = CustomProtocol(batching=True)
+    message(con, 'First line.\nSecond line.')
+    con.send('delete', 5)
+    assert not con.frames
+    con.flush()
+    assert con.frames == [
+        [
+            ['message', ['First line.', None, None], {}],
+            ['message', ['Second line.', None, None], {}],
+            ['delete', [5], {}]
+        ]
+    ]
+    assert not con.outbound
+    con.flush()
+    assert len(con.frames) == 1
+
+
+def test_closing():
+    con = CustomProtocol(batching=True)
+    con.send('delete', 5)
+    # The flush scheduled by send happens after the close handshake began.
+    con.state = con.STATE_CLOSING
+    con.flush()
+    assert not con.frames
+    con.on_disconnect(SimpleNamespace(getErrorMessage=lambda: 'Closed.'))
+    assert not con.outbound
+
+
+def test_stopped():
+    con = CustomProtocol()
+    con.stopProducing()
+    for x in range(con.outbound_limit * 2):
+        con.send('identify', x)
+    # Nothing piles up, so the connection is not evicted as a slow client.
+    assert not con.outbound
+    assert not con.aborted
+    assert not con.frames
+
+
+def test_prepared():
+    first = CustomProtocol()
+    second = CustomProtocol(batching=True)
+    commands = prepare(object_sound, 5, Sound('sounds/test.wav', sum=1.0))
+    assert len(commands) == 1
+    command = commands[0]
+    for con in (first, second):
+        con.send_prepared(command)
+    second.flush()
+    assert first.frames == [
+        dict(name='object_sound', args=[5, 'sounds/test.wav', 1.0], kwargs={})
+    ]
+    assert second.frames == [
+        [['object_sound', [5, 'sounds/test.wav', 1.0], {}]]
+    ]
+    assert list(command.frames) == list(command.items) == ['mindspace.json']
+
+
+def test_prepare_needs_connection():
+    assert prepare(location) is None
+
+
+def test_prepare_attribute_error():
+    def broken(con):
+        con.send('identify', None.id)
+
+    with raises(AttributeError):
+        prepare(broken)
+
+
+def test_paused():
+    con = CustomProtocol()
+    con.pauseProducing()
+    for x in range(4):
+        con.send('identify', x)
+    con.send('random_sound', 'sounds/test.wav')
+    assert not con.frames
+    assert len(con.outbound) == 4
+    assert con.outbound.dropped == 1
+    con.resumeProducing()
+    assert [frame['args'] for frame in con.frames] == [[0], [1], [2], [3]]
+    assert not con.outbound
+    assert not con.aborted
+
+
+def test_evicted():
+    con = CustomProtocol()
+    con.pauseProducing()
+    for x in range(8):
+        con.send('message', str(x))
+    assert con.aborted
+    assert not con.outbound
+
+
+def test_slow():
+    con = CustomProtocol()
+    con.pauseProducing()
+    for x in range(4):
+        con.send('identify', x)
+    assert con.over_high_water_since is not None
+    assert not con.aborted
+    con.over_high_water_since -= con.slow_client_timeout + 1
+    con.send('identify', 5)
+    assert con.aborted
+
+
+def test_random_sounds():
+    room = SimpleNamespace(
+        random_sounds=[
+            SimpleNamespace(name='beeps', min_volume=0.1, max_volume=0.5)
+        ], min_random_sound_interval=5.0, max_random_sound_interval=15.0,
+        size_x=10.0, size_y=20.0, size_z=0.0
+    )
+    command, = prepare(random_sounds, room)
+    assert command.name == 'random_sounds'
+    seed, *args, sounds = command.args
+    assert isinstance(seed, int)
+    assert args == [5.0, 15.0, 10.0, 20.0, 0.0, 100]
+    [choices, min_volume, max_volume], = sounds
+    assert len(choices) > 1
+    assert ['sounds/beeps/Beep1.wav', choices[0][1]] in choices
+    assert (min_volume, max_volume) == (0.1, 0.5)
+
+
+def test_random_sounds_resync():
+    options = ServerOptions.instance()
+    options.client_random_sounds = True
+    room = Room(name='Palette Room')
+    p = Player(username='palette')
+    p.set_password('test')
+    obj = Object(name='Palette Player', player=p, location=room)
+    s.add_all([room, p, obj])
+    s.commit()
+    con = CustomProtocol()
+    con.host = '127.0.0.1'
+    connections.add(con)
+    obj.register_connection(con)
+    room.add_random_sound('beeps')
+    s.flush()
+    # Nothing is sent until the change is committed.
+    assert not [f for f in con.frames if f['name'] == 'random_sounds']
+    s.rollback()
+    s.commit()
+    assert not [f for f in con.frames if f['name'] == 'random_sounds']
+    sound = room.add_random_sound('beeps')
+    s.commit()
+    frame = [f for f in con.frames if f['name'] == 'random_sounds'][-1]
+    assert len(frame['args'][-1]) == 1
+    con.frames.clear()
+    room.remove_random_sound(sound)
+    s.delete(sound)
+    s.commit()
+    frame = [f for f in con.frames if f['name'] == 'random_sounds'][-1]
+    assert frame['args'][-1] == []
+    connections.remove(con)
+    options.client_random_sounds = False
+    s.delete(obj)
+    s.delete(room)
+    s.commit()
+
+
+def test_random_sounds_toggle():
+    room = Room(name='Toggle Room')
+    p = Player(username='toggler')
+    p.set_password('test')
+    obj = Object(name='Toggle Player', player=p, location=room)
+    s.add_all([room, p, obj])
+    s.commit()
+    room.add_random_sound('beeps')
+    s.commit()
+    con = CustomProtocol()
+    con.host = '127.0.0.1'
+    connections.add(con)
+    obj.register_connection(con)
+    con.frames.clear()
+    options = ServerOptions.instance()
+    options.client_random_sounds = True
+    frame, = [f for f in con.frames if f['name'] == 'random_sounds']
+    assert len(frame['args'][-1]) == 1
+    con.frames.clear()
+    options.client_random_sounds = False
+    frame, = [f for f in con.frames if f['name'] == 'random_sounds']
+    assert frame['args'][-1] == []
+    connections.remove(con)
+    for sound in room.random_sounds:
+        s.delete(sound)
+    s.delete(obj)
+    s.delete(room)
+    s.commit()
+
+
+def test_voice():
+    room = Room(name='Voice Room', max_distance=10.0)
+    s.add(room)
+    s.commit()
+    objects = []
+    cons = []
+    for name, x in (('speaker', 0.0), ('near', 5.0), ('far', 50.0)):
+        p = Player(username=f'voice_{name}')
+        p.set_password('test')
+        obj = Object(name=f'Voice {name}', player=p, location=room, x=x)
+        s.add_all([p, obj])
+        s.commit()
+        con = CustomProtocol()
+        con.host = '127.0.0.1'
+        connections.add(con)
+        obj.register_connection(con)
+        objects.append(obj)
+        cons.append(con)
+    speaker, near, far = cons
+    frame = voice_header.pack(
+        voice_tag, VoiceEncodings.mulaw, 16000, 0, 1
+    ) + b'\x00\x01'
+    speaker.handle_voice(frame)
+    assert near.voices == [relabel(frame, objects[0].id)]
+    assert not far.voices
+    assert not speaker.voices
+    # Frames over the rate limit are dropped.
+    options = ServerOptions.instance()
+    near.voices.clear()
+    for x in range(options.voice_frame_rate * 2):
+        speaker.handle_voice(frame)
+    assert len(near.voices) == options.voice_frame_rate - 1
+    # So are frames which are too long.
+    speaker.voice_second = 0.0
+    near.voices.clear()
+    speaker.handle_voice(frame + bytes(options.max_voice_frame_length))
+    assert not near.voices
+    for con in cons:
+        connections.remove(con)
+    for obj in objects:
+        s.delete(obj)
+    s.delete(room)
+    s.commit()
@@ -0,0 +1,30 @@
+from sqlalchemy.orm import sessionmaker
+from server.db import Room, Session
+from server.db.engine import engine
+from server.db.session import make_persistent
+
+factory = sessionmaker(bind=engine)
+make_persistent(factory)
+
+
+def test_persistent():
+    r = Room(name='Persistent Room')
+    Session.add(r)
+    Session.commit()
+    s = factory()
+    try:
+        room = s.query(Room).get(r.id)
+        assert room in s.info['references']
+        room.name = 'Renamed Room'
+        s.commit()
+        # Not expired by the commit.
+        assert 'name' in room.__dict__
+        s.query(Room).filter_by(id=r.id).update(
+            {Room.name: 'Bulk Room'}, synchronize_session=False
+        )
+        assert 'name' not in room.__dict__
+        assert room.name == 'Bulk Room'
+        s.expunge(room)
+        assert room not in s.info['references']
+    finally:
+        s.close()
@@ -0,0 +1,38 @@
+from datetime import timedelta
+from pytest import raises
+from sqlalchemy import create_engine, select
+from server.db import Base, Session, Object, Player, RestingStates, engine
+from server.db.snapshot import (
+    read_tables, write_snapshot, load_snapshot, SnapshotError
+)
+
+
+def test_round_trip(tmpdir):
+    p = Player(username='snapshot', connected_time=timedelta(minutes=5))
+    p.set_password('test')
+    o = Object(name='Snapshot', player=p, resting_state=RestingStates.lying)
+    Session.add_all([p, o])
+    Session.commit()
+    filename = str(tmpdir.join('test.snapshot'))
+    tables = [Object.__table__, Player.__table__]
+    with engine.connect() as connection:
+        write_snapshot(filename, read_tables(connection, tables))
+        expected = [
+            connection.execute(select([table])).fetchall()
+            for table in tables
+        ]
+    other = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(bind=other)
+    with other.begin() as connection:
+        assert load_snapshot(
+            filename, connection, Base.metadata
+        ) == sum(len(rows) for rows in expected)
+        for table, rows in zip(tables, expected):
+            assert connection.execute(select([table])).fetchall() == rows
+
+
+def test_not_a_snapshot(tmpdir):
+    f = tmpdir.join('test.snapshot')
+    f.write_binary(b'\x90')
+    with raises(SnapshotError):
+        load_snapshot(str(f), None, Base.metadata)
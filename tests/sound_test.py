@@ -0,0 +1,112 @@
+import os
+from pytest import raises
+from server import sound
+from server.sound import (
+    Sound, SoundCatalog, NoSuchSound, get_sum, hash_file, set_digest,
+    stat_tag
+)
+
+
+def test_stat_tag(tmpdir):
+    path = str(tmpdir.join('test.wav'))
+    with open(path, 'wb') as f:
+        f.write(b'test')
+    st = os.stat(path)
+    assert get_sum(path) == stat_tag(st)
+    assert get_sum(path) == get_sum(path)
+
+
+def test_digest(tmpdir):
+    path = str(tmpdir.join('test.wav'))
+    with open(path, 'wb') as f:
+        f.write(b'test')
+    st = os.stat(path)
+    s = Sound(path)
+    sound.sounds[path] = s
+    digest = hash_file(path)
+    assert len(digest) == 32
+    set_digest(digest, path, st.st_size, st.st_mtime_ns)
+    try:
+        assert s.sum == digest
+        assert get_sum(path) == digest
+        with open(path, 'ab') as f:
+            f.write(b'ing')
+        assert get_sum(path) != digest
+        assert hash_file(path) != digest
+    finally:
+        del sound.sounds[path]
+        del sound.manifest[path]
+
+
+def test_missing():
+    assert get_sum('this file does not exist.wav') is None
+
+
+def make_tree(tmpdir):
+    root = tmpdir.mkdir('sounds')
+    root.mkdir('walk').join('1.wav').write('1')
+    root.join('walk').join('2.wav').write('2')
+    root.join('beep.wav').write('beep')
+    root.join('beep.attribution.txt').write('"A beep."\nIgnored.\n')
+    return str(root)
+
+
+def test_catalog(tmpdir):
+    root = make_tree(tmpdir)
+    c = SoundCatalog(root)
+    assert c.scan() == 2
+    walk = os.path.join(root, 'walk')
+    assert c.isdir(walk)
+    assert c.listdir(walk) == ['1.wav', '2.wav']
+    assert c.isfile(os.path.join(walk, '1.wav'))
+    assert not c.isfile(walk)
+    assert c.walk(root) == [
+        os.path.join(root, 'beep.attribution.txt'),
+        os.path.join(root, 'beep.wav'),
+        os.path.join(walk, '1.wav'),
+        os.path.join(walk, '2.wav')
+    ]
+    assert c.attribution(os.path.join(root, 'beep.wav')) == '"A beep."'
+    assert c.attribution(
+        os.path.join(walk, '1.wav')
+    ) == 'No description available.'
+    with raises(NoSuchSound):
+        c.listdir(os.path.join(root, 'nothing'))
+
+
+def test_attribution_edited(tmpdir):
+    root = make_tree(tmpdir)
+    c = SoundCatalog(root)
+    c.scan()
+    beep = os.path.join(root, 'beep.wav')
+    assert c.attribution(beep) == '"A beep."'
+    name = os.path.join(root, 'beep.attribution.txt')
+    mtime = os.stat(name).st_mtime_ns
+    with open(name, 'w') as f:
+        f.write('"A louder beep."\n')
+    # Make sure the change is seen on filesystems with coarse timestamps.
+    os.utime(name, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+    # The directory has not changed, but the attribution is read again.
+    assert not c.refresh()
+    assert c.attribution(beep) == '"A louder beep."'
+
+
+def test_catalog_refresh(tmpdir):
+    root = make_tree(tmpdir)
+    c = SoundCatalog(root)
+    c.scan()
+    assert c.refresh() == 0
+    walk = os.path.join(root, 'walk')
+    path = os.path.join(walk, '3.wav')
+    with open(path, 'w') as f:
+        f.write('3')
+    os.utime(walk, ns=(0, 0))
+    assert c.refresh() == 1
+    assert c.isfile(path)
+    for name in c.listdir(walk):
+        os.remove(os.path.join(walk, name))
+    os.rmdir(walk)
+    c.refresh()
+    assert not c.isdir(walk)
+    assert not c.isfile(path)
+    assert c.listdir(root) == ['beep.attribution.txt', 'beep.wav']
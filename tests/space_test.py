@@ -0,0 +1,125 @@
+from math import pi
+from pytest import approx
+from server import space
+from server.db import Session as s, Direction, Orbit, Zone
+from server.distance import light_speed
+
+
+def test_step():
+    # Speeds are in units per tick, and light speed is just under 3 units.
+    east = Direction.query(x=1, y=0, z=0).first()
+    north = Direction.query(x=0, y=1, z=0).first()
+    accelerating = Zone(
+        name='Accelerating', speed=0.25, acceleration=0.5, direction=east
+    )
+    braking = Zone(
+        name='Braking', speed=0.25, acceleration=0.5, accelerating=False,
+        direction=north, x=5.0
+    )
+    fast = Zone(
+        name='Fast', speed=light_speed, acceleration=light_speed,
+        direction=east
+    )
+    coasting = Zone(name='Coasting', speed=1.0, acceleration=0.0)
+    still = Zone(name='Still')
+    s.add_all([accelerating, braking, fast, coasting, still])
+    s.commit()
+    assert space.step(s) == 3
+    s.commit()
+    assert accelerating.speed == 0.75
+    assert accelerating.coordinates == (0.75, 0.0, 0.0)
+    # Braking zones stop, and have their engines turned off.
+    assert braking.speed == 0.0
+    assert braking.coordinates == (5.0, 0.0, 0.0)
+    assert braking.acceleration == 0.0
+    assert braking.accelerating is True
+    assert fast.speed == light_speed
+    assert fast.x == light_speed
+    assert coasting.speed == 1.0
+    assert coasting.coordinates == (0.0, 0.0, 0.0)
+    assert still.speed is None
+    assert space.step(s) == 2
+    s.commit()
+    assert accelerating.x == 2.0
+    for zone in (accelerating, braking, fast, coasting, still):
+        zone.speed = None
+        zone.acceleration = None
+    s.commit()
+
+
+def test_tick():
+    east = Direction.query(x=1, y=0, z=0).first()
+    zone = Zone(
+        name='Ticking', speed=0.25, acceleration=0.5, direction=east
+    )
+    s.add(zone)
+    s.commit()
+    id = zone.id
+    # Ticks run in their own session.
+    space.tick()
+    zone = Zone.get(id)
+    assert zone.coordinates == (0.75, 0.0, 0.0)
+    zone.speed = None
+    zone.acceleration = None
+    s.commit()
+
+
+def test_orbit_levels():
+    assert space.orbit_levels([2, 3, 4], [1, 2, 3]).tolist() == [0, 1, 2]
+    assert space.orbit_levels([4, 3, 2], [3, 2, 1]).tolist() == [2, 1, 0]
+    # 5 and 6 orbit each other, and 7 orbits 6.
+    assert space.orbit_levels(
+        [7, 5, 6, 2], [6, 6, 5, 1]
+    ).tolist() == [-1, -1, -1, 0]
+
+
+def test_orbit():
+    sun = Zone(name='Sun', x=10.0)
+    planet = Zone(name='Planet', x=14.0, z=1.0)
+    moon = Zone(name='Moon', x=15.0, z=1.0)
+    s.add_all([sun, planet, moon])
+    s.commit()
+    # Add the moon's orbit first, to make sure planets move before moons.
+    moon_orbit = Orbit(
+        zone=moon, orbiting=planet, distance=1.0, offset=pi / 2
+    )
+    planet_orbit = Orbit(
+        zone=planet, orbiting=sun, distance=4.0, offset=pi / 2
+    )
+    s.add_all([moon_orbit, planet_orbit])
+    s.commit()
+    assert planet_orbit.angle is None
+    assert space.orbit(s) == 2
+    s.commit()
+    # Both started at an angle of 0, and the planet's height is kept.
+    assert planet_orbit.angle == approx(pi / 2)
+    assert planet_orbit.height == approx(1.0)
+    assert moon_orbit.height == approx(0.0)
+    assert planet.coordinates == approx((10.0, 4.0, 1.0))
+    assert moon.coordinates == approx((10.0, 5.0, 1.0))
+    assert space.orbit(s, warp=2.0) == 2
+    s.commit()
+    assert planet_orbit.angle == approx(3 * pi / 2)
+    assert planet.coordinates == approx((10.0, -4.0, 1.0))
+    assert moon.coordinates == approx((10.0, -5.0, 1.0))
+    for obj in (moon_orbit, planet_orbit):
+        s.delete(obj)
+    s.commit()
+    assert space.orbit(s) == 0
+
+
+def test_orbit_seed():
+    sun = Zone(name='Sun')
+    planet = Zone(name='Planet', x=-3.0, y=-3.0)
+    s.add_all([sun, planet])
+    s.commit()
+    o = Orbit(zone=planet, orbiting=sun, distance=3.0, offset=0.0)
+    s.add(o)
+    s.commit()
+    assert space.orbit(s) == 1
+    s.commit()
+    assert o.angle == approx(5 * pi / 4)
+    assert planet.x == approx(-3.0 / 2 ** 0.5)
+    assert planet.y == approx(-3.0 / 2 ** 0.5)
+    s.delete(o)
+    s.commit()
@@ -0,0 +1,52 @@
+from server.db import Session as s, Object, Room
+from server.spatial import SpatialIndex, spatial_index
+
+
+def test_add_remove():
+    i = SpatialIndex(cell_size=5.0)
+    i.add(1, 1, 0.0, 0.0, 0.0)
+    i.add(2, 1, 4.0, 0.0, 0.0)
+    i.add(3, 1, 12.0, 0.0, 0.0)
+    i.add(4, 2, 0.0, 0.0, 0.0)
+    assert len(i) == 4
+    assert i.in_room(1) == {1, 2, 3}
+    assert i.get(3) == (1, 12.0, 0.0, 0.0)
+    i.add(3, 2, 1.0, 0.0, 0.0)
+    assert i.in_room(1) == {1, 2}
+    assert i.in_room(2) == {3, 4}
+    i.remove(3)
+    i.remove(3)  # Does nothing.
+    assert 3 not in i
+    i.add(4, None, 0.0, 0.0, 0.0)
+    assert i.in_room(2) == set()
+    assert 2 not in i.rooms
+
+
+def test_near():
+    i = SpatialIndex(cell_size=5.0)
+    for id, x in enumerate((0.0, 3.0, 6.0, 10.0, 30.0, -4.0)):
+        i.add(id, 1, x, 1.0, -1.0)
+    assert i.near(1, (0.0, 0.0, 0.0), 3.0) == {0, 1}
+    assert i.near(1, (0.0, 0.0, 0.0), 6.0) == {0, 1, 2, 5}
+    # So many cells are in range that occupied cells are scanned instead.
+    assert i.near(1, (0.0, 0.0, 0.0), 1000.0) == set(range(6))
+    assert i.near(1, (0.0, 5.0, 0.0), 3.0) == set()
+    assert i.near(2, (0.0, 0.0, 0.0), 1000.0) == set()
+
+
+def test_objects():
+    r1 = Room(name='First Spatial Room')
+    r2 = Room(name='Second Spatial Room')
+    o = Object(name='Spatial Object', location=r1, x=1.0, y=2.0, z=3.0)
+    s.add_all([r1, r2, o])
+    s.commit()
+    assert spatial_index.get(o.id) == (r1.id, 1.0, 2.0, 3.0)
+    o.coordinates = (4.0, 5.0, 6.0)
+    assert spatial_index.get(o.id) == (r1.id, 4.0, 5.0, 6.0)
+    o.location = r2
+    assert spatial_index.get(o.id) == (r2.id, 4.0, 5.0, 6.0)
+    s.commit()
+    assert o.id in spatial_index.near(r2.id, (0.0, 0.0, 0.0), 6.0)
+    s.delete(o)
+    s.commit()
+    assert o.id not in spatial_index
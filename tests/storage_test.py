@@ -0,0 +1,45 @@
+from threading import Thread
+from pytest import raises
+from server.db.engine import StorageModes, StorageError, create_storage
+
+
+def count(connection):
+    return connection.execute('SELECT COUNT(*) FROM test').scalar()
+
+
+def test_file(tmpdir):
+    filename = str(tmpdir.join('test.db'))
+    engine, read_engine = create_storage(
+        StorageModes.file, filename=filename, mmap_size=1024 * 1024
+    )
+    engine.execute('CREATE TABLE test (name)')
+    engine.execute("INSERT INTO test (name) VALUES ('First')")
+    assert engine.execute('PRAGMA journal_mode').scalar() == 'wal'
+    assert engine.execute('PRAGMA mmap_size').scalar() == 1024 * 1024
+    reader = read_engine.connect()
+    reader.execute('BEGIN')
+    assert count(reader) == 1
+    engine.execute("INSERT INTO test (name) VALUES ('Second')")
+    results = []
+    thread = Thread(target=lambda: results.append(count(reader)))
+    thread.start()
+    thread.join()
+    # The reader still sees the database as it was when it started reading.
+    assert results == [1]
+    reader.close()
+    with read_engine.connect() as connection:
+        assert count(connection) == 2
+        with raises(Exception):
+            connection.execute("INSERT INTO test (name) VALUES ('Third')")
+    engine.dispose()
+    read_engine.dispose()
+    # The file is emptied whenever the server starts.
+    engine, read_engine = create_storage(StorageModes.file, filename=filename)
+    assert not engine.has_table('test')
+    engine.dispose()
+    read_engine.dispose()
+
+
+def test_invalid():
+    with raises(StorageError):
+        create_storage('invalid')
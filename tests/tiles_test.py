@@ -0,0 +1,81 @@
+from server.db import Session as s, Room, RoomFloorTile
+from server.tiles import RoomTiles, Tile, tile_index
+
+
+def make_tile(id, name, start, end):
+    return Tile(id, name, None, *start, *end)
+
+
+def test_tile_at():
+    grass = make_tile(1, 'Grass', (0, 0, 0), (10, 10, 0))
+    path = make_tile(2, 'Path', (4, 0, 0), (6, 10, 0))
+    roof = make_tile(3, 'Roof', (0, 0, 5), (10, 10, 5))
+    tiles = RoomTiles.from_tiles([path, roof, grass])
+    assert len(tiles) == 3
+    assert tiles.tile_at(0, 0, 0) is grass
+    assert tiles.tile_at(3.5, 2, 0) is grass
+    # Newer tiles are laid on top of older ones, including on boundaries.
+    assert tiles.tile_at(4, 2, 0) is path
+    assert tiles.tile_at(5, 2, 0) is path
+    assert tiles.tile_at(6, 10, 0) is path
+    assert tiles.tile_at(6.5, 10, 0) is grass
+    assert tiles.tile_at(5, 5, 5) is roof
+    # Nothing between the floor and the roof.
+    assert tiles.tile_at(5, 5, 2) is None
+    assert tiles.tile_at(-1, 0, 0) is None
+    assert tiles.tile_at(11, 0, 0) is None
+    assert RoomTiles.from_tiles([]).tile_at(0, 0, 0) is None
+
+
+def test_crossing():
+    first = make_tile(1, 'Grass', (0, 0, 0), (4, 4, 0))
+    second = make_tile(2, 'Grass', (5, 0, 0), (9, 4, 0))
+    path = make_tile(3, 'Path', (10, 0, 0), (10, 4, 0))
+    tiles = RoomTiles.from_tiles([first, second, path])
+    assert tiles.crossing((0, 0, 0), (1, 0, 0)) is None
+    # Tiles with the same name are the same floor.
+    assert tiles.crossing((4, 0, 0), (5, 0, 0)) is None
+    assert tiles.crossing((0, 4, 0), (0, 5, 0)) == (first, None)
+    assert tiles.crossing((0, 5, 0), (0, 4, 0)) == (None, first)
+    assert tiles.crossing((9, 0, 0), (10, 0, 0)) == (second, path)
+    assert tiles.crossing((20, 0, 0), (21, 0, 0)) is None
+
+
+def test_covers():
+    tile = RoomFloorTile(
+        start_x=0.0, start_y=0.0, start_z=1.0, end_x=5.0, end_y=5.0,
+        end_z=2.0
+    )
+    assert tile.covers(1.0, 1.0, 1.0)
+    assert tile.covers(5.0, 5.0, 2.0)
+    # Points below the tile used to count as covered.
+    assert not tile.covers(1.0, 1.0, 0.0)
+    assert not tile.covers(1.0, 6.0, 1.0)
+
+
+def test_room_tiles():
+    r = Room(name='Tiled Room')
+    s.add(r)
+    s.commit()
+    assert r.tile_at(1.0, 1.0, 0.0) is None
+    assert r.id in tile_index
+    tile = RoomFloorTile(
+        room=r, name='Carpet', start_x=0.0, start_y=0.0, start_z=0.0,
+        end_x=2.0, end_y=2.0, end_z=0.0
+    )
+    s.add(tile)
+    s.commit()
+    assert r.id not in tile_index
+    assert r.tile_at(1.0, 1.0, 0.0) is tile
+    tile.end_x = 0.5
+    s.commit()
+    assert r.id not in tile_index
+    assert r.tile_at(1.0, 1.0, 0.0) is None
+    # The carpet has no floor type, so it is silent.
+    assert r.get_walk_sound((0.0, 0.0, 0.0)) is None
+    assert r.get_walk_sound((1.0, 1.0, 0.0)) is not None
+    RoomFloorTile.query(room_id=r.id).delete()
+    assert not len(tile_index.rooms)
+    assert r.tile_at(0.0, 0.0, 0.0) is None
+    s.delete(r)
+    s.commit()
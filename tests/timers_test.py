@@ -0,0 +1,194 @@
+from time import time
+from twisted.internet.task import Clock
+from server.db import (
+    Session as s, Mobile, Object, Phone, PhoneStates, Room, ServerOptions
+)
+from server.db.timers import build_timers
+from server.timers import TimerService, timers
+
+
+def test_heap():
+    t = TimerService()
+    now = time()
+    t.push(('Test', 1, 'test'), now + 5)
+    t.push(('Test', 2, 'test'), now + 1)
+    t.push(('Test', 3, 'test'), now + 3)
+    t.push(('Test', 3, 'test'), now + 2)
+    t.push(('Test', 4, 'test'), None)
+    assert len(t) == 3
+    assert ('Test', 4, 'test') not in t
+    assert t.next_due() == now + 1
+    t.discard(('Test', 2, 'test'))
+    assert t.next_due() == now + 2
+    assert t.pop_due(now) == []
+    assert t.pop_due(now + 10) == [('Test', 3, 'test'), ('Test', 1, 'test')]
+    assert not len(t)
+    assert t.next_due() is None
+
+
+def test_clock():
+    t = TimerService()
+    clock = Clock()
+    t.start(clock)
+    assert not clock.getDelayedCalls()
+    now = time()
+    t.push(('Test', 1, 'test'), now + 10)
+    call, = clock.getDelayedCalls()
+    assert 9 < call.getTime() <= 10
+    t.push(('Test', 2, 'test'), now + 5)
+    call, = clock.getDelayedCalls()
+    assert 4 < call.getTime() <= 5
+    t.discard(('Test', 1, 'test'))
+    t.discard(('Test', 2, 'test'))
+    t.arm()
+    assert not clock.getDelayedCalls()
+    t.stop()
+
+
+def test_mobile():
+    m = Mobile()
+    s.add(m)
+    s.commit()
+    key = timers.key(m, 'move')
+    assert timers.get(key) == 0.0
+    now = time()
+    assert timers.run(now=now) >= 1
+    # Timers fire in their own session.
+    m = Mobile.get(key[1])
+    # The mobile is not in a room, so it waits for its next move.
+    assert m.next_move > now
+    assert timers.get(key) == m.next_move
+    m.paused = True
+    s.commit()
+    assert key not in timers
+    m.paused = False
+    s.commit()
+    assert timers.get(key) == m.next_move
+    timers.clear()
+    build_timers()
+    assert timers.get(key) == m.next_move
+    timers.cancel(m, 'move')
+    assert key not in timers
+    timers.schedule(m, 'move', now + 60)
+    assert m.next_move == now + 60
+    assert timers.due(m, 'move') == now + 60
+    s.delete(m)
+    s.commit()
+    assert key not in timers
+
+
+def test_random_sounds():
+    r = Room(name='Noisy Room')
+    s.add(r)
+    s.commit()
+    key = timers.key(r, 'random_sound')
+    assert key not in timers
+    r.next_random_sound = 0.0
+    s.commit()
+    assert timers.get(key) == 0.0
+    # There are no sounds, so the timer stops.
+    timers.run()
+    r = Room.get(key[1])
+    assert r.next_random_sound is None
+    assert key not in timers
+    s.delete(r)
+    s.commit()
+
+
+def test_client_random_sounds():
+    options = ServerOptions.instance()
+    options.client_random_sounds = True
+    r = Room(name='Client Room')
+    s.add(r)
+    s.commit()
+    r.add_random_sound('beeps')
+    s.commit()
+    key = timers.key(r, 'random_sound')
+    assert timers.get(key) == 0.0
+    # Clients play the sounds, so the server only reschedules the room.
+    now = time()
+    timers.run(now=now)
+    r = Room.get(key[1])
+    assert r.next_random_sound > now
+    assert timers.get(key) == r.next_random_sound
+    ServerOptions.instance().client_random_sounds = False
+    for sound in r.random_sounds:
+        s.delete(sound)
+    s.delete(r)
+    s.commit()
+
+
+def test_ringing_phone():
+    r = Room(name='Phone Room')
+    obj = Object(
+        name='Ringing Phone', location=r,
+        phone=Phone(address='555-0100', state=PhoneStates.ringing)
+    )
+    s.add_all([r, obj])
+    s.commit()
+    room_id = r.id
+    key = timers.key(obj.phone, 'ring')
+    timers.clear()
+    build_timers()
+    # The phone has never rung, so it is due straight away.
+    assert timers.get(key) == 0.0
+    now = time()
+    timers.run(now=now)
+    phone = Phone.get(key[1])
+    assert phone.next_ring == now + phone.ring_every
+    assert timers.get(key) == phone.next_ring
+    phone.state = PhoneStates.idle
+    s.commit()
+    timers.run(now=phone.next_ring)
+    phone = Phone.get(key[1])
+    assert phone.next_ring is None
+    s.delete(phone.object)
+    s.delete(phone)
+    s.delete(Room.get(room_id))
+    s.commit()
+
+
+def test_failure():
+    r = Room(name='Broken Room')
+    s.add(r)
+    s.commit()
+    r.add_random_sound('beeps')
+    other = Room(name='Working Room')
+    s.add(other)
+    s.commit()
+    other.next_random_sound = 0.0
+    s.commit()
+    key = timers.key(r, 'random_sound')
+    other_key = timers.key(other, 'random_sound')
+    timer = timers.timers[('Room', 'random_sound')]
+    handler = timer.handler
+
+    def fail(room, now):
+        room.name = 'Renamed Room'
+        if room.id == key[1]:
+            raise RuntimeError('The handler failed.')
+        room.next_random_sound = None
+
+    timer.handler = fail
+    try:
+        now = time()
+        assert timers.run(now=now) >= 2
+        # The failed timer is pushed again once its back-off has passed.
+        assert timers.get(key) == now + timers.backoff
+        # Its changes were rolled back, but the other timer still fired.
+        assert Room.get(key[1]).name == 'Broken Room'
+        assert Room.get(other_key[1]).name == 'Renamed Room'
+        assert other_key not in timers
+        # The back-off doubles with each failure.
+        timers.run(now=now + timers.backoff)
+        assert timers.get(key) == now + 3 * timers.backoff
+    finally:
+        timer.handler = handler
+    timers.run(now=now + 3 * timers.backoff)
+    assert key not in timers.failures
+    r = Room.get(key[1])
+    for sound in r.random_sounds:
+        s.delete(sound)
+    s.delete(r)
+    s.delete(Room.get(other_key[1]))
+    s.commit()
@@ -0,0 +1,34 @@
+from pytest import raises
+from server.voice import (
+    voice_header, voice_tag, VoiceEncodings, VoiceError, is_voice, relabel
+)
+
+
+def frame(encoding=VoiceEncodings.mulaw, sample_rate=16000, speaker=0,
+          sequence=1, samples=b'\x00\x01\x02\x03'):
+    return voice_header.pack(
+        voice_tag, encoding, sample_rate, speaker, sequence
+    ) + samples
+
+
+def test_is_voice():
+    assert is_voice(frame())
+    assert not is_voice(b'')
+    assert not is_voice(b'\x93\x00\x90\x80')
+
+
+def test_relabel():
+    data = relabel(frame(sequence=5), 1234)
+    assert data == frame(speaker=1234, sequence=5)
+
+
+def test_invalid():
+    with raises(VoiceError):
+        relabel(frame()[:5], 1)
+    with raises(VoiceError):
+        relabel(frame(encoding=9), 1)
+    with raises(VoiceError):
+        relabel(frame(sample_rate=1), 1)
+    with raises(VoiceError):
+        relabel(frame(encoding=VoiceEncodings.pcm16, samples=b'\x00'), 1)
+    relabel(frame(encoding=VoiceEncodings.pcm16, samples=b'\x00\x00'), 1)
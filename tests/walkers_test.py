@@ -0,0 +1,97 @@
+from twisted.internet.task import Clock
+from server.db import Session as s, Object, Room
+from server.util import WalkTask, walkers
+
+
+def test_walkers():
+    clock = Clock()
+    walkers.clock = clock
+    r = Room(name='Walking Room', size_x=10.0, size_y=10.0)
+    first = Object(name='First Walker', location=r, speed=0.5)
+    second = Object(name='Second Walker', location=r, speed=0.5)
+    slow = Object(name='Slow Walker', location=r, speed=1.0)
+    s.add_all([r, first, second, slow])
+    s.commit()
+    room_id = r.id
+    ids = [first.id, second.id, slow.id]
+    tasks = [WalkTask(id, 2.0, 0.0, 0.0) for id in ids]
+    for task in tasks:
+        task.start()
+    assert all(task.running for task in tasks)
+    assert len(walkers) == 3
+    # One loop per speed.
+    assert sorted(walkers.loops) == [0.5, 1.0]
+    clock.advance(0.5)
+    first, second, slow = (Object.get(id) for id in ids)
+    assert first.x == 1.0
+    assert second.x == 1.0
+    assert slow.x == 0.0
+    # Changing speed moves a walker to another bucket.
+    second.speed = 1.0
+    s.commit()
+    clock.advance(0.5)
+    first, second, slow = (Object.get(id) for id in ids)
+    assert first.x == 2.0
+    assert second.x == 1.0
+    assert slow.x == 1.0
+    assert walkers.speeds[second.id] == 1.0
+    # Walkers which have arrived stop on their next tick.
+    clock.advance(0.5)
+    assert not tasks[0].running
+    assert 0.5 not in walkers.loops
+    clock.advance(0.5)
+    first, second, slow = (Object.get(id) for id in ids)
+    assert second.x == 2.0
+    assert slow.x == 2.0
+    tasks[1].stop()
+    assert not tasks[1].running
+    # Deleted objects are forgotten.
+    s.delete(slow)
+    s.commit()
+    clock.advance(1.0)
+    assert not len(walkers)
+    assert not walkers.loops
+    assert not clock.getDelayedCalls()
+    walkers.clock = None
+    s.delete(Object.get(ids[0]))
+    s.delete(Object.get(ids[1]))
+    s.delete(Room.get(room_id))
+    s.commit()
+
+
+class BrokenWalkTask(WalkTask):
+    def step(self, obj):
+        obj.x = 5.0
+        raise RuntimeError('The step failed.')
+
+
+def test_failure():
+    clock = Clock()
+    walkers.clock = clock
+    r = Room(name='Stumbling Room', size_x=10.0, size_y=10.0)
+    broken = Object(name='Broken Walker', location=r, speed=0.5)
+    working = Object(name='Working Walker', location=r, speed=0.5)
+    s.add_all([r, broken, working])
+    s.commit()
+    room_id = r.id
+    ids = [broken.id, working.id]
+    tasks = [
+        BrokenWalkTask(ids[0], 2.0, 0.0, 0.0),
+        WalkTask(ids[1], 2.0, 0.0, 0.0)
+    ]
+    for task in tasks:
+        task.start()
+    clock.advance(0.5)
+    broken, working = (Object.get(id) for id in ids)
+    # The broken walker's changes are rolled back, and it stops walking.
+    assert broken.x == 0.0
+    assert not tasks[0].running
+    # The other walker still moves.
+    assert working.x == 1.0
+    assert tasks[1].running
+    tasks[1].stop()
+    walkers.clock = None
+    s.delete(broken)
+    s.delete(working)
+    s.delete(Room.get(room_id))
+    s.commit()
@@ -0,0 +1,51 @@
+from pytest import raises
+from msgpack import unpackb
+from server.wire import (
+    json_format, msgpack_format, MsgpackFormat, WireError, command_names
+)
+
+
+def test_json():
+    data = json_format.encode('message', ['Hello.', None, None], {})
+    assert json_format.decode(
+        b'["message", ["Hello.", null, null], {}]'
+    ) == ('message', ['Hello.', None, None], {})
+    assert not json_format.binary
+    assert b'"name": "message"' in data
+
+
+def test_msgpack_opcodes():
+    f = MsgpackFormat()
+    assert f.names == command_names
+    assert f.names is not command_names
+    assert f.opcodes['message'] == command_names.index('message')
+
+
+def test_msgpack():
+    f = msgpack_format
+    assert f.binary
+    data = f.encode('identify', [5, 1.0, 2.0, 3.0], {})
+    assert unpackb(data, raw=False) == [
+        command_names.index('identify'), [5, 1.0, 2.0, 3.0], {}
+    ]
+    assert f.decode(data) == ('identify', [5, 1.0, 2.0, 3.0], {})
+    data = f.encode('custom_command', [], {'value': True})
+    assert f.decode(data) == ('custom_command', [], {'value': True})
+
+
+def test_msgpack_batch():
+    f = msgpack_format
+    data = f.encode_batch([['message', ['Hi.'], {}], ['delete', [3], {}]])
+    assert unpackb(data, raw=False) == [
+        [f.opcodes['message'], ['Hi.'], {}],
+        [f.opcodes['delete'], [3], {}]
+    ]
+
+
+def test_invalid_opcode():
+    data = msgpack_format.encode(len(command_names) + 10, [], {})
+    with raises(WireError):
+        msgpack_format.decode(data)
+    data = msgpack_format.encode(-1, [], {})
+    with raises(WireError):
+        msgpack_format.decode(data)
@@ -0,0 +1,49 @@
+from server.db import (
+    Session as s, Zone, Star, Starship, StarshipSensors, engine
+)
+
+# Keep well away from zones made by other tests.
+offset = 1000000.0
+
+
+def make_zone(name, x, **kwargs):
+    return Zone(name=name, x=offset + x, y=offset, z=offset, **kwargs)
+
+
+def indexed(zone):
+    return engine.execute(
+        'SELECT min_x, kind, hidden FROM zones_rtree WHERE id = ?', zone.id
+    ).fetchall()
+
+
+def test_sensors():
+    sensors = StarshipSensors(name='Test Sensors', distance=100.0)
+    ship = make_zone(
+        'Sensor Ship', 0.0, starship=Starship(sensors=sensors)
+    )
+    star = make_zone('Sensor Star', 50.0, star=Star())
+    debris = make_zone('Sensor Debris', -20.0)
+    hidden = make_zone('Sensor Hidden', 10.0, hidden=True)
+    far = make_zone('Sensor Far', 150.0)
+    s.add_all([sensors, ship, star, debris, hidden, far])
+    s.commit()
+    assert indexed(ship) == [(offset, 1, 0)]
+    assert indexed(star) == [(offset + 50.0, 2, 0)]
+    assert indexed(hidden) == [(offset + 10.0, 3, 1)]
+    assert ship.visible_objects() == [debris, star]
+    assert ship.sensor_query(limit=1).all() == [debris]
+    assert ship.can_see(star)
+    assert not ship.can_see(hidden)
+    assert not ship.can_see(far)
+    ship.starship.filter_star = True
+    assert ship.visible_objects() == [debris]
+    ship.starship.filter_star = False
+    far.x = offset + 10.0
+    s.commit()
+    assert ship.visible_objects() == [far, debris, star]
+    s.delete(far)
+    s.commit()
+    assert ship.visible_objects() == [debris, star]
+    assert Zone.near(
+        ship.coordinates, 15.0, include_hidden=True
+    ).all() == [ship, hidden]